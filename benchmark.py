@@ -1,34 +1,54 @@
+import sys
+import json
 import random
 import uuid
-import timeit
 import argparse
+import itertools
 import contextlib
-from functools import partial
-
-from pymongo import MongoClient
+import multiprocessing
+from timeit import default_timer
 
 from vakt import (
-    MemoryStorage, DENY_ACCESS, ALLOW_ACCESS,
-    Policy, RegexChecker, RulesChecker, Guard, Inquiry,
+    MemoryStorage, DENY_ACCESS, ALLOW_ACCESS, __version__,
+    Policy, RegexChecker, RulesChecker, StringExactChecker, StringFuzzyChecker, Guard, CachingGuard, Inquiry,
 )
-from vakt.storage.mongo import MongoStorage
 from vakt.rules import operator, logic, list, net
 
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
 
 # Globals
 LINE_LEN = 80
-overall_policies_created = 0
-similar_regexp_policies_created = 0
+PERCENTILES = (50, 90, 99)
 
 
 # Define and parse possible arguments
-parser = argparse.ArgumentParser(description='Run vakt benchmark.')
-parser.add_argument('-n', '--number', dest='policies_number', nargs='?', type=int, default=100000,
-                    help='number of policies to create in DB (default: %(default)d)')
-parser.add_argument('-d', '--storage', choices=('mongo', 'memory'), default='memory',
+parser = argparse.ArgumentParser(
+    description='Run vakt benchmark. '
+                'Every combination of storage, checker, guard, number of policies and match ratio is run '
+                'in a separate process: Guard decides on a number of inquiries and their latency is measured.'
+)
+parser.add_argument('-n', '--number', dest='policies_number', nargs='+', type=int, default=[100000],
+                    help='number of policies to create in DB (default: %(default)s)')
+parser.add_argument('-d', '--storage', nargs='+', choices=('mongo', 'memory'), default=['memory'],
                     help='type of storage (default: %(default)s)')
-parser.add_argument('-c', '--checker', choices=('regex', 'rules', 'exact', 'fuzzy'), default='regex',
+parser.add_argument('-c', '--checker', nargs='+', choices=('regex', 'rules', 'exact', 'fuzzy'), default=['regex'],
                     help='type of checker (default: %(default)s)')
+parser.add_argument('-g', '--guard', nargs='+', choices=('plain', 'caching'), default=['plain'],
+                    help='type of guard (default: %(default)s)')
+parser.add_argument('-m', '--match', dest='match_ratio', nargs='+', type=float, default=[0.001],
+                    help='ratio of policies that fit the inquiries (default: %(default)s)')
+parser.add_argument('-i', '--inquiries', type=int, default=1000,
+                    help='number of inquiries to decide on (default: %(default)d)')
+parser.add_argument('--distinct', type=int, default=100,
+                    help='number of distinct inquiries (default: %(default)d)')
+parser.add_argument('--seed', type=int, default=42,
+                    help='random seed (default: %(default)d)')
+parser.add_argument('--json', dest='json_file',
+                    help="file to write results in JSON format to ('-' for stdout)")
 
 regex_group = parser.add_argument_group('regex policy related')
 regex_group.add_argument('--regexp', action='store_false', default=True,
@@ -36,129 +56,150 @@ regex_group.add_argument('--regexp', action='store_false', default=True,
 regex_group.add_argument('--same', type=int, default=0,
                          help='number of similar regexps in Policy')
 regex_group.add_argument('--cache', type=int,
-                         help="number of LRU-cache for RegexChecker (default: RegexChecker's default cache-size)")
-
-ARGS = parser.parse_args()
-
+                         help="size of RegexChecker's own LRU-cache (default: process-wide shared cache)")
 
-def rand_string():
-    return ''.join([chr(random.randint(97, 122)) for _ in range(0, 10)])
 
-
-def rand_true():
-    return bool(random.getrandbits(1))
+def rand_string(rnd):
+    return ''.join([chr(rnd.randint(97, 122)) for _ in range(0, 10)])
 
 
 def gen_id():
     return str(uuid.uuid4())
 
 
-def gen_regexp():
-    a, b = [rand_string() for _ in range(2)]
+def gen_regexp(rnd):
+    a, b = [rand_string(rnd) for _ in range(2)]
     return r'<[\d]{3}[%s]*>' % a, '<[%s]{2}>' % b
 
 
-def gen_policy():
-    if ARGS.checker == 'rules':
-        return Policy(
-            uid=gen_id(),
-            effect=ALLOW_ACCESS if rand_true() else DENY_ACCESS,
-            subjects=[
-                {
-                    'name': logic.Or(operator.Eq('Nicky'), operator.Eq('Nick')),
-                    'stars': logic.And(
-                        operator.Greater(random.randint(-1000, -1)),
-                        operator.Less(random.randint(1000, 3000)),
-                        operator.Eq(900)
-                    ),
-                    'status': operator.Eq('registered')
+class Scenario:
+    """
+    One cell of the benchmark matrix: generates policies and inquiries for it.
+    Policies that should fit are generated with the given match ratio.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.rnd = random.Random(config['seed'])
+        self.similar_regexp_policies_created = 0
+        self.static_subjects = gen_regexp(self.rnd)
+
+    def gen_policy(self, matching):
+        rnd = self.rnd
+        # policies that fit inquiries allow access, so that the decisions are positive
+        effect = ALLOW_ACCESS if matching or rnd.getrandbits(1) else DENY_ACCESS
+        checker = self.config['checker']
+        if checker == 'rules':
+            name = 'Nick' if matching else rand_string(rnd)
+            return Policy(
+                uid=gen_id(),
+                effect=effect,
+                subjects=[
+                    {
+                        'name': logic.Or(operator.Eq('Nicky'), operator.Eq(name)),
+                        'stars': logic.And(
+                            operator.Greater(rnd.randint(-1000, -1)),
+                            operator.Less(rnd.randint(1000, 3000)),
+                        ),
+                        'status': operator.Eq('registered')
+                    },
+                ],
+                resources=(
+                    {
+                        'method': list.AnyIn('get', 'post', 'delete'),
+                        'path': list.NotIn('org/custom', 'vacations/pending', 'должность/повысить'),
+                    },
+                    {
+                        'method': operator.Eq('violate'),
+                    }
+                ),
+                actions=(
+                    {'before': operator.Eq('foo')},
+                    {'after': list.In(rand_string(rnd), rand_string(rnd), rand_string(rnd))},
+                ),
+                context={
+                    'ip': net.CIDR('127.0.0.1'),
                 },
-            ],
-            resources=(
-                {
-                    'method': list.AnyIn('get', 'post', 'delete'),
-                    'path': list.NotIn('org/custom', 'vacations/pending', 'должность/повысить'),
-                    'id': operator.Eq(rand_string())
+            )
+        if checker in ('exact', 'fuzzy'):
+            return Policy(
+                uid=gen_id(),
+                effect=effect,
+                subjects=('user' if matching else rand_string(rnd), rand_string(rnd)),
+                resources=('library:books' if matching else rand_string(rnd), rand_string(rnd)),
+                actions=('get', rand_string(rnd)),
+                context={
+                    'ip': net.CIDR('127.0.0.1'),
                 },
-                {
-                    'method': operator.Eq('violate'),
-                }
-            ),
-            actions=(
-                {'before': operator.Eq('foo')},
-                {'after': list.In(rand_string(), rand_string(), rand_string())},
-            ),
-            context={
-                'ip': net.CIDR('127.0.0.1'),
-            },
-        )
-    else:
-        global similar_regexp_policies_created
-        static_subjects = gen_regexp()
-        if ARGS.regexp:
-            if similar_regexp_policies_created < ARGS.same:
-                subjects = static_subjects
-                similar_regexp_policies_created += 1
+            )
+        if matching:
+            subjects = (r'<user\d+>', rand_string(rnd))
+        elif self.config['regexp']:
+            if self.similar_regexp_policies_created < self.config['same']:
+                subjects = self.static_subjects
+                self.similar_regexp_policies_created += 1
             else:
-                subjects = gen_regexp()
+                subjects = gen_regexp(rnd)
         else:
-            subjects = (rand_string(), rand_string())
+            subjects = (rand_string(rnd), rand_string(rnd))
         return Policy(
             uid=gen_id(),
-            effect=ALLOW_ACCESS if rand_true() else DENY_ACCESS,
+            effect=effect,
             subjects=subjects,
             resources=('library:books:<.+>', 'office:magazines:<.+>'),
-            actions=['<' + rand_string() + '|' + rand_string() + '>'],
+            actions=['<' + rand_string(rnd) + '|get>'],
             context={
                 'ip': net.CIDR('127.0.0.1'),
             },
         )
 
+    def gen_policies(self):
+        number, ratio = self.config['policies_number'], self.config['match_ratio']
+        matching = max(int(number * ratio), 1) if ratio > 0 else 0
+        for i in range(number):
+            yield self.gen_policy(i < matching)
 
-def get_checker():
-    if ARGS.checker == 'rules':
-        return RulesChecker()
-    return RegexChecker(ARGS.cache) if ARGS.cache else RegexChecker()
-
-
-def get_inquiry():
-    if ARGS.checker == 'rules':
-        return Inquiry(
-            subject={'name': 'Nick', 'stars': 900, 'status': 'registered'},
-            resource={'method': ['post', 'get'], 'path': '/acme/users', 'id': rand_string()},
-            action={'before': 'foo', 'after': rand_string()},
-            context={'ip': '127.0.0.1'}
-        )
-    return Inquiry(action='get', subject='xo', resource='library:books:1234', context={'ip': '127.0.0.1'})
-
-
-def populate_storage(store):
-    global overall_policies_created
-    for x in range(ARGS.policies_number):
-        policy = gen_policy()
-        store.add(policy)
-        overall_policies_created += 1
-        yield
+    def gen_inquiries(self):
+        rnd = self.rnd
+        checker = self.config['checker']
+        distinct = []
+        for i in range(self.config['distinct']):
+            if checker == 'rules':
+                inquiry = Inquiry(
+                    subject={'name': 'Nick', 'stars': rnd.randint(0, 900), 'status': 'registered'},
+                    resource={'method': ['post', 'get'], 'path': '/acme/users/%d' % i},
+                    action={'before': 'foo', 'after': rand_string(rnd)},
+                    context={'ip': '127.0.0.1'}
+                )
+            elif checker in ('exact', 'fuzzy'):
+                inquiry = Inquiry(action='get', subject='user', resource='library:books', context={'ip': '127.0.0.1'})
+            else:
+                inquiry = Inquiry(action='get', subject='user%d' % i, resource='library:books:%d' % i,
+                                  context={'ip': '127.0.0.1'})
+            distinct.append(inquiry)
+        return [rnd.choice(distinct) for _ in range(self.config['inquiries'])]
 
+    def get_checker(self):
+        checker = self.config['checker']
+        if checker == 'rules':
+            return RulesChecker()
+        if checker == 'exact':
+            return StringExactChecker()
+        if checker == 'fuzzy':
+            return StringFuzzyChecker()
+        return RegexChecker(self.config['cache']) if self.config['cache'] else RegexChecker()
 
-def print_generation(generator, factor=10, line_len=LINE_LEN):
-    cl, cf = 0, 0
-    for _ in generator():
-        if cf < factor:
-            cf += 1
-            continue
-        print('.', end='', flush=True)
-        cl += 1
-        cf = 0
-        if cl >= line_len:
-            cl = 0
-            print()
-    print()
+    def get_guard(self, storage):
+        if self.config['guard'] == 'caching':
+            return CachingGuard(storage, self.get_checker())
+        return Guard(storage, self.get_checker())
 
 
 @contextlib.contextmanager
-def get_storage():
-    if ARGS.storage == 'mongo':
+def get_storage(name):
+    if name == 'mongo':
+        from pymongo import MongoClient
+        from vakt.storage.mongo import MongoStorage
         db_name = 'vakt_db'
         collection = 'vakt_policies_benchmark'
         client = MongoClient('127.0.0.1', 27017)
@@ -169,21 +210,123 @@ def get_storage():
         yield MemoryStorage()
 
 
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    idx = int(round(pct / 100 * (len(sorted_values) - 1)))
+    return sorted_values[idx]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on other systems
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def run_scenario(config):
+    """Run one cell of the benchmark matrix and return its measurements"""
+    scenario = Scenario(config)
+    with get_storage(config['storage']) as st:
+        start = default_timer()
+        st.add_many(scenario.gen_policies())
+        populate_time = default_timer() - start
+        inquiries = scenario.gen_inquiries()
+        guard = scenario.get_guard(st)
+        start = default_timer()
+        guard.is_allowed(inquiries[0])
+        first_latency = default_timer() - start
+        latencies, allowed = [], 0
+        start = default_timer()
+        for inquiry in inquiries:
+            t = default_timer()
+            allowed += guard.is_allowed(inquiry)
+            latencies.append(default_timer() - t)
+        total = default_timer() - start
+    latencies.sort()
+    result = dict(config)
+    result.update({
+        'similar_regexp_policies': scenario.similar_regexp_policies_created,
+        'populate_sec': populate_time,
+        'first_decision_ms': first_latency * 1000,
+        'allowed': allowed,
+        'ops_per_sec': len(latencies) / total if total else None,
+        'latency_mean_ms': total / len(latencies) * 1000 if latencies else None,
+        'latency_max_ms': latencies[-1] * 1000 if latencies else None,
+        'peak_rss_mb': peak_rss_mb(),
+    })
+    for pct in PERCENTILES:
+        value = percentile(latencies, pct)
+        result['latency_p%d_ms' % pct] = value * 1000 if value is not None else None
+    return result
+
+
+def run_isolated(config):
+    """Run scenario in a separate process, so that its peak memory usage isn't affected by other scenarios"""
+    with multiprocessing.Pool(1) as pool:
+        return pool.apply(run_scenario, (config,))
+
+
+def get_configs(args):
+    matrix = itertools.product(args.storage, args.checker, args.guard, args.policies_number, args.match_ratio)
+    for storage, checker, guard, number, ratio in matrix:
+        yield {
+            'storage': storage,
+            'checker': checker,
+            'guard': guard,
+            'policies_number': number,
+            'match_ratio': ratio,
+            'inquiries': args.inquiries,
+            'distinct': args.distinct,
+            'seed': args.seed,
+            'regexp': args.regexp,
+            'same': args.same,
+            'cache': args.cache,
+        }
+
+
+def print_result(result, out):
+    print('=' * LINE_LEN, file=out)
+    print('Storage: %(storage)s, Checker: %(checker)s, Guard: %(guard)s' % result, file=out)
+    print('Number of unique Policies in DB: {:,}'.format(result['policies_number']), file=out)
+    print('Ratio of Policies that fit Inquiries: %s' % result['match_ratio'], file=out)
+    print('Among them Policies with the same regexp pattern: {:,}'.format(result['similar_regexp_policies']), file=out)
+    print('Populating storage took: %0.4f seconds' % result['populate_sec'], file=out)
+    print('First decision took: %0.4f ms' % result['first_decision_ms'], file=out)
+    print('Decisions: {:,} ({:,} allowed)'.format(result['inquiries'], result['allowed']), file=out)
+    print('Throughput: %0.1f decisions/sec' % result['ops_per_sec'], file=out)
+    print('Latency, ms: mean %0.4f, %s, max %0.4f' % (
+        result['latency_mean_ms'],
+        ', '.join('p%d %0.4f' % (p, result['latency_p%d_ms' % p]) for p in PERCENTILES),
+        result['latency_max_ms'],
+    ), file=out)
+    if result['peak_rss_mb'] is not None:
+        print('Peak RSS: %0.1f MB' % result['peak_rss_mb'], file=out)
+
+
+def main(args):
+    # human-readable output goes to stderr if JSON is written to stdout
+    out = sys.stderr if args.json_file == '-' else sys.stdout
+    results = []
+    for config in get_configs(args):
+        result = run_isolated(config)
+        results.append(result)
+        print_result(result, out)
+    print('=' * LINE_LEN, file=out)
+    if args.json_file:
+        report = {
+            'vakt_version': __version__,
+            'python': sys.version,
+            'platform': sys.platform,
+            'results': results,
+        }
+        if args.json_file == '-':
+            json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        else:
+            with open(args.json_file, 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+
+
 if __name__ == '__main__':
-    with get_storage() as st:
-        print('=' * LINE_LEN)
-        print('Populating %s with Policies' % st.__class__.__name__)
-        print_generation(partial(populate_storage, st), int(ARGS.policies_number / 100 * 1), LINE_LEN)
-        print('START BENCHMARK!')
-        start = timeit.default_timer()
-        checker = get_checker()
-        inq = get_inquiry()
-        allowed = Guard(st, checker).is_allowed(inquiry=inq)
-        stop = timeit.default_timer()
-        print('Number of unique Policies in DB: {:,}'.format(overall_policies_created))
-        print('Among them Policies with the same regexp pattern: {:,}'.format(similar_regexp_policies_created))
-        print('Checker used: %s' % checker.__class__.__name__)
-        # print('Inquiry looks like: %s' % vars(inq))
-        print('Decision for 1 Inquiry took: %0.4f seconds' % (stop - start))
-        print('Inquiry passed the guard? %s' % allowed)
-        print('=' * LINE_LEN)
+    main(parser.parse_args())
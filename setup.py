@@ -37,6 +37,9 @@ if __name__ == '__main__':
             'mongo': [
                 'pymongo~=3.5',
             ],
+            'motor': [
+                'motor~=2.0',
+            ],
         },
         packages=find_packages(exclude='tests'),
         classifiers=[
@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+
+from vakt.aio import AsyncGuard, AsyncMemoryStorage
+from vakt.storage.memory import MemoryStorage
+from vakt.guard import BaseGuard, Guard, Inquiry
+from vakt.policy import Policy
+from vakt.effects import ALLOW_ACCESS, DENY_ACCESS
+from vakt.checker import RegexChecker, RulesChecker
+from vakt.rules.net import CIDR
+from vakt.rules.operator import Eq
+from vakt.metrics import MetricsCollector
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+storage = MemoryStorage()
+storage.add_many([
+    Policy(
+        uid='1',
+        effect=ALLOW_ACCESS,
+        subjects=('Max', '<Ben|Henry>'),
+        actions=('<create|delete>', 'get'),
+        resources=('books:<.+>',),
+        context={'ip': CIDR('127.0.0.1/32')},
+    ),
+    Policy(
+        uid='2',
+        effect=DENY_ACCESS,
+        subjects=('Henry',),
+        actions=('delete',),
+        resources=('books:<.+>',),
+    ),
+    Policy(
+        uid='3',
+        effect=ALLOW_ACCESS,
+        subjects=[{'name': Eq('Nina')}],
+        actions=[Eq('read')],
+        resources=[{'id': Eq(1)}],
+    ),
+])
+
+inquiries = [
+    Inquiry(subject='Max', action='get', resource='books:1', context={'ip': '127.0.0.1'}),
+    Inquiry(subject='Max', action='get', resource='books:1', context={'ip': '127.0.0.2'}),
+    Inquiry(subject='Ben', action='delete', resource='books:2', context={'ip': '127.0.0.1'}),
+    Inquiry(subject='Henry', action='delete', resource='books:2', context={'ip': '127.0.0.1'}),
+    Inquiry(subject='Henry', action='create', resource='books:2', context={'ip': '127.0.0.1'}),
+    Inquiry(subject='Nina', action='get', resource='books:1', context={'ip': '127.0.0.1'}),
+    Inquiry(subject={'name': 'Nina'}, action='read', resource={'id': 1}),
+    Inquiry(subject={'name': 'Nina'}, action='read', resource={'id': 2}),
+    Inquiry(subject={'name': ['Nina']}, action='read', resource={'id': 1}),
+]
+
+
+@pytest.mark.parametrize('checker', [RegexChecker(), RulesChecker()])
+def test_decisions_are_the_same_as_of_guard(checker):
+    guard = Guard(storage, checker)
+    async_guard = AsyncGuard(AsyncMemoryStorage(storage), checker)
+    expected = [guard.is_allowed(inquiry) for inquiry in inquiries]
+    assert True in expected
+    assert expected == [run(async_guard.is_allowed(inquiry)) for inquiry in inquiries]
+    assert expected == run(async_guard.is_allowed_many(inquiries))
+
+
+def test_is_allowed_many_queries_storage_once_for_the_same_inquiries():
+    class CountingStorage(AsyncMemoryStorage):
+        calls = 0
+
+        async def find_for_inquiry(self, inquiry, checker=None):
+            self.calls += 1
+            await asyncio.sleep(0)
+            return await super().find_for_inquiry(inquiry, checker)
+
+    st = CountingStorage(storage)
+    guard = AsyncGuard(st, RegexChecker())
+    answers = run(guard.is_allowed_many(inquiries[:2] * 10 + inquiries[2:3]))
+    assert [True, False] * 10 + [True] == answers
+    # the first two inquiries differ only by context
+    assert 3 == st.calls
+
+
+def test_is_allowed_many_with_different_contexts_is_the_same_as_is_allowed():
+    st = AsyncMemoryStorage()
+    guard = AsyncGuard(st, RulesChecker())
+    inquiries = [Inquiry(subject='a', action='a', resource='a', context={'n': n}) for n in [2, 1, 2, 1]]
+
+    async def scenario():
+        await st.add(Policy('1', effect=ALLOW_ACCESS, subjects=[Eq('a')], actions=[Eq('a')], resources=[Eq('a')],
+                            context={'n': Eq(1)}))
+        return [await guard.is_allowed(i) for i in inquiries], await guard.is_allowed_many(inquiries)
+
+    assert ([False, True, False, True], [False, True, False, True]) == run(scenario())
+
+
+def test_exceptions_are_denials(caplog):
+    class FailingStorage(AsyncMemoryStorage):
+        async def find_for_inquiry(self, inquiry, checker=None):
+            raise Exception('foo')
+
+    guard = AsyncGuard(FailingStorage(storage), RegexChecker())
+    assert not run(guard.is_allowed(inquiries[0]))
+    assert [False, False] == run(guard.is_allowed_many(inquiries[:2]))
+    assert 3 == len([r for r in caplog.records if r.levelname == 'ERROR'])
+
+
+def test_compiled_policies_are_dropped_on_changes():
+    st = AsyncMemoryStorage()
+    guard = AsyncGuard(st, RegexChecker())
+    inquiry = Inquiry(subject='Max', action='get', resource='books')
+
+    async def scenario():
+        await st.add(Policy('1', effect=ALLOW_ACCESS, subjects=['Max'], actions=['get'], resources=['books']))
+        assert await guard.is_allowed(inquiry)
+        assert len(guard._compiled) == 1
+        await st.update(Policy('1', effect=DENY_ACCESS, subjects=['Max'], actions=['get'], resources=['books']))
+        assert len(guard._compiled) == 0
+        assert not await guard.is_allowed(inquiry)
+
+    run(scenario())
+
+
+def test_observed_decisions_are_the_same_as_of_guard():
+    collector = MetricsCollector()
+    guard = AsyncGuard(AsyncMemoryStorage(storage), RegexChecker(), observer=collector)
+    expected = [Guard(storage, RegexChecker()).is_allowed(i) for i in inquiries]
+    assert expected == [run(guard.is_allowed(i)) for i in inquiries]
+    assert expected == run(guard.is_allowed_many(inquiries))
+    counters = collector.snapshot()['counters']
+    assert 2 * len(inquiries) == counters['decisions']
+    assert 2 * expected.count(True) == counters['allowed']
+    assert 0 < counters['candidates']
+
+
+def test_async_guard_is_not_a_blocking_guard():
+    guard = AsyncGuard(AsyncMemoryStorage(), RegexChecker())
+    assert isinstance(guard, BaseGuard)
+    assert not isinstance(guard, Guard)
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from vakt.policy import Policy
+from vakt.guard import Inquiry
+from vakt.effects import ALLOW_ACCESS, DENY_ACCESS
+from vakt.rules.operator import Eq
+from vakt.exceptions import PolicyExistsError
+from vakt.checker import RegexChecker, RulesChecker, StringExactChecker
+
+motor_asyncio = pytest.importorskip('motor.motor_asyncio')
+
+from vakt.aio import AsyncGuard
+from vakt.aio.mongo import AsyncMongoStorage
+
+
+MONGO_HOST = '127.0.0.1'
+MONGO_PORT = 27017
+DB_NAME = 'vakt_db_test'
+COLLECTION = 'vakt_policies_async_test'
+
+
+def create_client():
+    return motor_asyncio.AsyncIOMotorClient(MONGO_HOST, MONGO_PORT)
+
+
+@pytest.mark.integration
+class TestAsyncMongoStorage:
+
+    @pytest.fixture()
+    def loop(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        yield loop
+        loop.close()
+        asyncio.set_event_loop(None)
+
+    @pytest.fixture()
+    def st(self, loop):
+        client = create_client()
+        yield AsyncMongoStorage(client, DB_NAME, collection=COLLECTION)
+        loop.run_until_complete(client[DB_NAME][COLLECTION].delete_many({}))
+        client.close()
+
+    def test_add_get_update_delete(self, st, loop):
+        async def scenario():
+            await st.add(Policy('1', description='foo', subjects=[{'name': Eq('Max')}]))
+            back = await st.get('1')
+            assert 'foo' == back.description
+            assert isinstance(back.subjects[0]['name'], Eq)
+            with pytest.raises(PolicyExistsError):
+                await st.add(Policy('1', description='bar'))
+            await st.update(Policy('1', description='bar'))
+            assert 'bar' == (await st.get('1')).description
+            await st.delete('1')
+            assert None is await st.get('1')
+        loop.run_until_complete(scenario())
+
+    def test_get_all(self, st, loop):
+        async def scenario():
+            for i in range(20):
+                await st.add(Policy(str(i)))
+            assert 20 == len(await st.get_all(0, 0))
+            assert 5 == len(await st.get_all(5, 10))
+            with pytest.raises(ValueError):
+                await st.get_all(-1, 0)
+        loop.run_until_complete(scenario())
+
+    def test_find_for_inquiry(self, st, loop):
+        async def scenario():
+            await st.add(Policy('1', subjects=['Max'], actions=['get'], resources=['books:<.+>']))
+            await st.add(Policy('2', subjects=['Nina'], actions=['get'], resources=['books:<.+>']))
+            await st.add(Policy('3', subjects=[{'name': Eq('Max')}], actions=[Eq('get')], resources=[Eq('books')]))
+            inquiry = Inquiry(subject='Max', action='get', resource='books:1')
+            assert ['1'] == [p.uid for p in await st.find_for_inquiry(inquiry, RegexChecker())]
+            exact = Inquiry(subject='Nina', action='get', resource='books:<.+>')
+            assert ['2'] == [p.uid for p in await st.find_for_inquiry(exact, StringExactChecker())]
+            assert ['3'] == [p.uid for p in await st.find_for_inquiry(inquiry, RulesChecker())]
+            assert 3 == len(await st.find_for_inquiry(inquiry))
+            assert st.partitioned_by_effect
+            assert 3 == len(await st.find_for_inquiry_by_effect(inquiry, DENY_ACCESS))
+            assert [] == await st.find_for_inquiry_by_effect(inquiry, ALLOW_ACCESS, RegexChecker())
+        loop.run_until_complete(scenario())
+
+    def test_bulk_methods(self, st, loop):
+        async def scenario():
+            results = await st.add_many([Policy('1'), Policy('2'), Policy('1')])
+            assert [None, None] == results[:2]
+            assert isinstance(results[2], PolicyExistsError)
+            assert [None] == await st.update_many([Policy('2', description='foo')])
+            assert 'foo' == (await st.get('2')).description
+            assert [None, None] == await st.delete_many(['1', '2'])
+            assert [] == await st.get_all(0, 0)
+        loop.run_until_complete(scenario())
+
+    def test_guard(self, st, loop):
+        guard = AsyncGuard(st, RegexChecker())
+
+        async def scenario():
+            await st.add(Policy('1', effect=ALLOW_ACCESS, subjects=['<Max|Nina>'], actions=['get'], resources=['<.*>']))
+            await st.add(Policy('2', effect=DENY_ACCESS, subjects=['Nina'], actions=['get'], resources=['secrets']))
+            return await guard.is_allowed_many([
+                Inquiry(subject='Max', action='get', resource='secrets'),
+                Inquiry(subject='Nina', action='get', resource='secrets'),
+                Inquiry(subject='Nina', action='get', resource='books'),
+                Inquiry(subject='Ben', action='get', resource='books'),
+            ])
+
+        assert [True, False, True, False] == loop.run_until_complete(scenario())
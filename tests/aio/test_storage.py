@@ -0,0 +1,143 @@
+import asyncio
+
+import pytest
+
+from vakt.aio.storage import AsyncStorage, AsyncMemoryStorage
+from vakt.storage.memory import MemoryStorage
+from vakt.policy import Policy
+from vakt.guard import Inquiry
+from vakt.exceptions import PolicyExistsError
+from vakt.checker import RegexChecker
+from vakt.effects import ALLOW_ACCESS, DENY_ACCESS
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+@pytest.fixture
+def st():
+    return AsyncMemoryStorage()
+
+
+def test_add_and_get(st):
+    async def scenario():
+        await st.add(Policy('1', description='foo'))
+        assert 'foo' == (await st.get('1')).description
+        assert await st.get('2') is None
+        with pytest.raises(PolicyExistsError):
+            await st.add(Policy('1', description='bar'))
+    run(scenario())
+
+
+def test_get_all(st):
+    async def scenario():
+        for i in range(10):
+            await st.add(Policy(str(i)))
+        assert 10 == len(await st.get_all(0, 0))
+        assert 3 == len(await st.get_all(3, 7))
+        with pytest.raises(ValueError):
+            await st.get_all(-1, 0)
+    run(scenario())
+
+
+def test_find_for_inquiry(st):
+    async def scenario():
+        await st.add(Policy('1', subjects=['Max'], actions=['get'], resources=['<.*>']))
+        await st.add(Policy('2', subjects=['Nina'], actions=['get'], resources=['<.*>']))
+        inquiry = Inquiry(subject='Max', action='get', resource='books')
+        assert ['1'] == [p.uid for p in await st.find_for_inquiry(inquiry, RegexChecker())]
+        assert ['1', '2'] == sorted(p.uid for p in await st.find_for_inquiry(inquiry))
+    run(scenario())
+
+
+def test_find_for_inquiry_by_effect(st):
+    async def scenario():
+        await st.add(Policy('1', subjects=['Max'], actions=['get'], resources=['<.*>'], effect=ALLOW_ACCESS))
+        await st.add(Policy('2', subjects=['<.*>'], actions=['get'], resources=['<.*>'], effect=DENY_ACCESS))
+        inquiry = Inquiry(subject='Max', action='get', resource='books')
+        assert st.partitioned_by_effect
+        assert ['1'] == [p.uid for p in await st.find_for_inquiry_by_effect(inquiry, ALLOW_ACCESS, RegexChecker())]
+        assert ['2'] == [p.uid for p in await st.find_for_inquiry_by_effect(inquiry, DENY_ACCESS)]
+    run(scenario())
+
+
+def test_update_and_delete(st):
+    async def scenario():
+        await st.add(Policy('1', description='foo'))
+        await st.update(Policy('1', description='bar'))
+        assert 'bar' == (await st.get('1')).description
+        await st.delete('1')
+        assert await st.get('1') is None
+        await st.delete('1')
+    run(scenario())
+
+
+def test_bulk_methods(st):
+    async def scenario():
+        results = await st.add_many([Policy('1'), Policy('2'), Policy('1')])
+        assert [None, None] == results[:2]
+        assert isinstance(results[2], PolicyExistsError)
+        assert [None] == await st.update_many([Policy('1', description='foo')])
+        assert 'foo' == (await st.get('1')).description
+        assert [None, None] == await st.delete_many(['1', '3'])
+        assert ['2'] == [p.uid for p in await st.get_all(0, 0)]
+    run(scenario())
+
+
+def test_wraps_memory_storage():
+    storage = MemoryStorage()
+    st = AsyncMemoryStorage(storage)
+    calls = []
+    st.on_change(lambda: calls.append(1))
+    storage.add(Policy('1'))
+    assert '1' == run(st.get('1')).uid
+    run(st.delete('1'))
+    assert storage.get('1') is None
+    assert 2 == len(calls)
+
+
+def test_default_bulk_methods():
+    class DictStorage(AsyncStorage):
+        def __init__(self):
+            self.policies = {}
+
+        async def add(self, policy):
+            if policy.uid in self.policies:
+                raise PolicyExistsError(policy.uid)
+            self.policies[policy.uid] = policy
+
+        async def get(self, uid):
+            return self.policies.get(uid)
+
+        async def get_all(self, limit, offset):
+            return list(self.policies.values())
+
+        async def find_for_inquiry(self, inquiry, checker=None):
+            return list(self.policies.values())
+
+        async def update(self, policy):
+            self.policies[policy.uid] = policy
+
+        async def delete(self, uid):
+            del self.policies[uid]
+
+    st = DictStorage()
+    assert not st.partitioned_by_effect
+    results = run(st.add_many([Policy('1'), Policy('1'), Policy('2')]))
+    assert None is results[0]
+    assert isinstance(results[1], PolicyExistsError)
+    assert None is results[2]
+    assert [None] == run(st.update_many([Policy('2', description='foo')]))
+    assert 'foo' == st.policies['2'].description
+    results = run(st.delete_many(['1', '3']))
+    assert None is results[0]
+    assert isinstance(results[1], KeyError)
+    assert ['2'] == list(st.policies)
+    run(st.add(Policy('3', effect=ALLOW_ACCESS)))
+    assert ['3'] == [p.uid for p in run(st.find_for_inquiry_by_effect(Inquiry(), ALLOW_ACCESS))]
+    assert ['2'] == [p.uid for p in run(st.find_for_inquiry_by_effect(Inquiry(), DENY_ACCESS))]
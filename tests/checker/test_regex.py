@@ -1,6 +1,8 @@
 import pytest
 
 from vakt.checker import RegexChecker
+from vakt.cache import PatternCache, regex_cache
+from vakt.storage.memory import MemoryStorage
 from vakt.policy import Policy
 from vakt.rules.operator import Eq
 
@@ -25,3 +27,21 @@ from vakt.rules.operator import Eq
 def test_fits(policy, field, what, result):
     c = RegexChecker()
     assert result == c.fits(policy, field, what)
+
+
+def test_checkers_share_compiled_patterns():
+    assert RegexChecker().cache is regex_cache
+    assert RegexChecker().compile('<[0-9]+>', '<', '>') is RegexChecker().compile('<[0-9]+>', '<', '>')
+    own = RegexChecker(16)
+    assert own.cache is not regex_cache
+    assert 16 == own.cache.maxsize
+    cache = PatternCache()
+    assert cache is RegexChecker(cache=cache).cache
+
+
+def test_patterns_are_compiled_on_storage_add():
+    st = MemoryStorage()
+    st.add(Policy('1', actions=[r'<get[\d]{5}>'], resources=['<.*>']))
+    hits = regex_cache.hits
+    assert RegexChecker().fits(st.get('1'), 'actions', 'get12345')
+    assert hits + 1 == regex_cache.hits
@@ -0,0 +1,8 @@
+import sys
+
+
+collect_ignore = []
+
+# asyncio support requires "async def" syntax
+if sys.version_info < (3, 5):
+    collect_ignore.append('aio')
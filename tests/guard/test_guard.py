@@ -1,14 +1,18 @@
+import logging
+
 import pytest
 
-from vakt.checker import RegexChecker, RulesChecker
+from vakt.checker import RegexChecker, RulesChecker, StringExactChecker
 from vakt.storage.memory import MemoryStorage
 from vakt.rules.net import CIDR
 from vakt.rules.inquiry import SubjectEqual
 from vakt.effects import DENY_ACCESS, ALLOW_ACCESS
 from vakt.policy import Policy
-from vakt.guard import Guard, Inquiry
+from vakt.guard import Guard, CachingGuard, Inquiry
 from vakt.rules.operator import Eq
 from vakt.rules.string import RegexMatch
+from vakt.metrics import MetricsCollector, Observer
+from vakt.audit import DecisionLog
 
 
 # Create all required test policies
@@ -334,3 +338,249 @@ def test_guard_if_unexpected_exception_raised():
             raise Exception('This is test class that raises errors')
     g = Guard(BadMemoryStorage(), RegexChecker())
     assert not g.is_allowed(Inquiry(subject='foo', action='bar', resource='baz'))
+
+
+def test_is_allowed_many():
+    inquiries = [
+        Inquiry(action='update', subject='Max', resource='books:1'),
+        Inquiry(action='print', subject='Max', resource='books:1'),
+        Inquiry(action='update', subject='Nina', resource='12345'),
+        Inquiry(action='update', subject='Nina', resource='abc'),
+        Inquiry(action='update', subject='Max', resource='books:1'),
+        Inquiry(action={'method': 'get'}, subject={'name': 'Max'}, resource={'id': '1'}),
+    ]
+    g = Guard(st, RegexChecker())
+    assert [True, False, True, False, True, False] == g.is_allowed_many(inquiries)
+    assert [g.is_allowed(i) for i in inquiries] == g.is_allowed_many(iter(inquiries))
+    assert [] == g.is_allowed_many([])
+
+
+def test_is_allowed_many_queries_storage_once_per_distinct_inquiry_attributes():
+    class CountingMemoryStorage(MemoryStorage):
+        calls = 0
+
+        def find_for_inquiry(self, inquiry, checker=None):
+            self.calls += 1
+            return super().find_for_inquiry(inquiry, checker)
+    cst = CountingMemoryStorage()
+    for p in policies:
+        cst.add(p)
+    inquiries = [
+        Inquiry(action='update', subject='Max', resource='books:1', context={'a': 1}),
+        Inquiry(action='update', subject='Max', resource='books:1', context={'a': 2}),
+        Inquiry(action='update', subject='Nina', resource='12345'),
+        Inquiry(action='update', subject='Max', resource='books:1'),
+        Inquiry(action='update', subject={'name': 'Nina'}, resource='12345'),
+        Inquiry(action='update', subject={'name': 'Nina'}, resource='12345'),
+        Inquiry(action='update', subject={'name': ['Nina']}, resource='12345'),
+    ]
+    assert [True, True, True, True, False, False, False] == Guard(cst, RegexChecker()).is_allowed_many(inquiries)
+    assert 6 == cst.calls
+
+
+def test_is_allowed_many_with_different_contexts_is_the_same_as_is_allowed():
+    cst = MemoryStorage()
+    cst.add(Policy('1', effect=ALLOW_ACCESS, subjects=[Eq('a')], actions=[Eq('a')], resources=[Eq('a')],
+                   context={'n': Eq(1)}))
+    g = Guard(cst, RulesChecker())
+    inquiries = [Inquiry(subject='a', action='a', resource='a', context={'n': n}) for n in [2, 1, 2, 1]]
+    assert [False, True, False, True] == [g.is_allowed(i) for i in inquiries]
+    assert [False, True, False, True] == g.is_allowed_many(inquiries)
+
+
+def test_is_allowed_many_if_unexpected_exception_raised():
+    class BadMemoryStorage(MemoryStorage):
+        def find_for_inquiry(self, inquiry=None, checker=None):
+            raise Exception('This is test class that raises errors')
+    g = Guard(BadMemoryStorage(), RegexChecker())
+    assert [False, False] == g.is_allowed_many([Inquiry(subject='foo'), Inquiry(subject='bar')])
+
+
+def test_caching_guard():
+    cst = MemoryStorage()
+    cst.add(Policy('1', effect=ALLOW_ACCESS, subjects=['Max'], actions=['<read|get>'], resources=['<.*>']))
+    g = CachingGuard(cst, RegexChecker(), cache_size=10)
+    inq = Inquiry(action='get', subject='Max', resource='book')
+    assert g.is_allowed(inq)
+    assert g.is_allowed(Inquiry(action='get', subject='Max', resource='book'))
+    assert 1 == g.cache.hits
+    assert 1 == g.cache.misses
+    assert g.is_allowed(Inquiry(action='get', subject='Max', resource='book', context={'a': [1]}))
+    assert 2 == g.cache.misses
+    # decisions are invalidated on storage changes
+    cst.add(Policy('2', effect=DENY_ACCESS, subjects=['Max'], actions=['get'], resources=['book']))
+    assert not g.is_allowed(inq)
+    cst.delete('2')
+    assert g.is_allowed(inq)
+    cst.update(Policy('1', effect=DENY_ACCESS, subjects=['Max'], actions=['<read|get>'], resources=['<.*>']))
+    assert not g.is_allowed(inq)
+    assert not g.is_allowed(inq)
+    assert 2 == g.cache.hits
+
+
+def test_caching_guard_does_not_cache_unhashable_inquiries_and_failures():
+    class BadMemoryStorage(MemoryStorage):
+        def find_for_inquiry(self, inquiry=None, checker=None):
+            raise Exception('This is test class that raises errors')
+    g = CachingGuard(BadMemoryStorage(), RegexChecker())
+    assert not g.is_allowed(Inquiry(subject='foo', action='bar', resource='baz'))
+    assert 0 == len(g.cache)
+    g = CachingGuard(st, RegexChecker())
+    assert g.is_allowed(Inquiry(action='update', subject='Max', resource='x', context={'a': bytearray()}))
+    assert 0 == len(g.cache)
+    assert [True, True] == g.is_allowed_many([Inquiry(action='update', subject='Max', resource='x')] * 2)
+    assert 1 == len(g.cache)
+    assert 1 == g.cache.hits
+
+
+def test_guard_recompiles_policies_on_storage_changes_and_checker_change():
+    cst = MemoryStorage()
+    p = Policy('1', effect=ALLOW_ACCESS, subjects=['Max'], actions=['get'], resources=['<.*>'])
+    cst.add(p)
+    g = Guard(cst, RegexChecker())
+    inq = Inquiry(action='get', subject='Max', resource='book')
+    assert g.is_allowed(inq)
+    p.subjects = ['Nina']
+    cst.update(p)
+    assert not g.is_allowed(inq)
+    assert g.is_allowed(Inquiry(action='get', subject='Nina', resource='book'))
+    g.checker = StringExactChecker()
+    assert not g.is_allowed(Inquiry(action='get', subject='Nina', resource='book'))
+    assert g.is_allowed(Inquiry(action='get', subject='Nina', resource='.*'))
+
+
+def test_check_policies_allow_stops_on_first_fitting_deny_policy():
+    checked = []
+
+    class Tracking(Eq):
+        def satisfied(self, what, inquiry=None):
+            checked.append(self.val)
+            return super().satisfied(what, inquiry)
+    g = Guard(MemoryStorage(), RulesChecker())
+    policies = [
+        Policy('1', effect=ALLOW_ACCESS, subjects=[Tracking('allow')], actions=[Eq('get')], resources=[Eq('book')]),
+        Policy('2', effect=DENY_ACCESS, subjects=[Tracking('deny')], actions=[Eq('get')], resources=[Eq('book')]),
+        Policy('3', effect=DENY_ACCESS, subjects=[Tracking('deny-2')], actions=[Eq('get')], resources=[Eq('book')]),
+    ]
+    assert not g.check_policies_allow(Inquiry(subject='deny', action='get', resource='book'), policies)
+    assert ['deny'] == checked
+    del checked[:]
+    assert g.check_policies_allow(Inquiry(subject='allow', action='get', resource='book'), policies)
+    assert ['deny', 'deny-2', 'allow'] == checked
+
+
+def test_guard_reorders_fields_by_selectivity():
+    g = Guard(MemoryStorage(), RegexChecker())
+    g.selectivity.sample_every = 1
+    g.selectivity.reorder_every = 2
+    p = Policy('1', effect=ALLOW_ACCESS, subjects=['Max'], actions=['get'], resources=['book'])
+    for subject in ['Nina', 'Bob']:
+        assert not g.check_policies_allow(Inquiry(subject=subject, action='get', resource='book'), [p])
+    assert 'subjects' == g.selectivity.order[0]
+    assert 0 == len(g._compiled)
+    assert g.check_policies_allow(Inquiry(subject='Max', action='get', resource='book'), [p])
+    assert 'subject' == g._compile(p).checks[0][0]
+
+
+def test_guard_fetches_allow_policies_only_if_no_deny_policy_fits():
+    class CountingMemoryStorage(MemoryStorage):
+        def __init__(self):
+            super().__init__()
+            self.effects = []
+
+        def find_for_inquiry_by_effect(self, inquiry, effect, checker=None):
+            self.effects.append(effect)
+            return super().find_for_inquiry_by_effect(inquiry, effect, checker)
+    cst = CountingMemoryStorage()
+    cst.add(Policy('1', effect=ALLOW_ACCESS, subjects=['<.*>'], actions=['get'], resources=['book']))
+    cst.add(Policy('2', effect=DENY_ACCESS, subjects=['Nina'], actions=['get'], resources=['book']))
+    g = Guard(cst, RegexChecker())
+    assert not g.is_allowed(Inquiry(subject='Nina', action='get', resource='book'))
+    assert [DENY_ACCESS] == cst.effects
+    del cst.effects[:]
+    assert g.is_allowed(Inquiry(subject='Max', action='get', resource='book'))
+    assert [DENY_ACCESS, ALLOW_ACCESS] == cst.effects
+    del cst.effects[:]
+    inquiries = [Inquiry(subject='Max', action='get', resource='book')] * 2 + \
+        [Inquiry(subject='Nina', action='get', resource='book')]
+    assert [True, True, False] == g.is_allowed_many(inquiries)
+    assert [DENY_ACCESS, ALLOW_ACCESS, DENY_ACCESS] == cst.effects
+
+
+def test_observer_receives_decision_stats():
+    received = []
+
+    class Recorder(Observer):
+        def on_decision(self, stats):
+            received.append(stats)
+    cst = MemoryStorage()
+    cst.add(Policy('1', effect=ALLOW_ACCESS, subjects=['<.*>'], actions=['get'], resources=['book'],
+                   context={'ip': CIDR('127.0.0.1/32')}))
+    cst.add(Policy('2', effect=DENY_ACCESS, subjects=['Nina'], actions=['get'], resources=['book']))
+    g = Guard(cst, RegexChecker(), observer=Recorder())
+    assert g.is_allowed(Inquiry(subject='Max', action='get', resource='book', context={'ip': '127.0.0.1'}))
+    assert not g.is_allowed(Inquiry(subject='Nina', action='get', resource='book'))
+    allowed, denied = received
+    assert allowed.answer and not denied.answer
+    assert (2, 1, 1, 1) == (allowed.fetches, allowed.candidates, allowed.checked, allowed.matched)
+    assert (1, 1, 1, 1) == (denied.fetches, denied.candidates, denied.checked, denied.matched)
+    assert None is allowed.cached and None is allowed.exception
+    assert 0 < allowed.context_time
+    assert 0 < allowed.fetch_time < allowed.total_time
+    assert allowed.filter_time < allowed.check_time <= allowed.total_time
+    assert not g.check_policies_allow(allowed.inquiry, [])
+
+
+def test_caching_guard_with_metrics_collector():
+    class BadMemoryStorage(MemoryStorage):
+        def find_for_inquiry(self, inquiry=None, checker=None):
+            raise Exception('This is test class that raises errors')
+
+    class BadObserver(Observer):
+        def on_decision(self, stats):
+            raise Exception('This is test class that raises errors')
+    collector = MetricsCollector()
+    g = CachingGuard(st, RegexChecker(), observer=collector)
+    inquiries = [Inquiry(action='update', subject='Max', resource='x')] * 2 + [Inquiry(subject='foo')]
+    assert [True, True, False] == g.is_allowed_many(inquiries)
+    assert not Guard(BadMemoryStorage(), RegexChecker(), observer=collector).is_allowed(inquiries[0])
+    assert Guard(st, RegexChecker(), observer=BadObserver()).is_allowed(inquiries[0])
+    snapshot = collector.snapshot()
+    counters = snapshot['counters']
+    assert (4, 2, 2) == (counters['decisions'], counters['allowed'], counters['denied'])
+    assert (1, 2, 1) == (counters['cache_hits'], counters['cache_misses'], counters['exceptions'])
+    assert 4 == snapshot['timings']['total']['count']
+    assert 4 == snapshot['candidates']['buckets'][-1][1]
+    collector.reset()
+    assert 0 == collector.snapshot()['counters']['decisions']
+
+
+def test_decision_log_replaces_info_logs(caplog):
+    caplog.set_level(logging.INFO, logger='vakt.guard')
+    decisions = DecisionLog()
+    g = CachingGuard(st, RegexChecker(), decision_log=decisions)
+    inquiries = [Inquiry(action='update', subject='Max', resource='x'), Inquiry(subject='foo')]
+    assert [True, False] == g.is_allowed_many(inquiries)
+    assert not g.is_allowed(inquiries[1])
+    assert [(inquiries[0], True), (inquiries[1], False), (inquiries[1], False)] == \
+        [(r.inquiry, r.answer) for r in decisions.records()]
+    assert 0 == len([r for r in caplog.records if r.name == 'vakt.guard'])
+
+
+def test_guard_does_not_keep_policy_compiled_before_storage_change():
+    cst = MemoryStorage()
+    p = Policy('1', effect=ALLOW_ACCESS, subjects=['Max'], actions=['get'], resources=['book'])
+    cst.add(p)
+
+    class ChangingChecker(RegexChecker):
+        def matcher(self, policy, field):
+            if field == 'resources' and policy.subjects == ['Max']:
+                # policy is changed and updated in the storage while it's being compiled
+                policy.subjects = ['Nina']
+                cst.update(policy)
+            return super().matcher(policy, field)
+    g = Guard(cst, ChangingChecker())
+    assert g.is_allowed(Inquiry(subject='Max', action='get', resource='book'))
+    assert 0 == len(g._compiled)
+    assert not g.is_allowed(Inquiry(subject='Max', action='get', resource='book'))
+    assert g.is_allowed(Inquiry(subject='Nina', action='get', resource='book'))
@@ -0,0 +1,56 @@
+import pickle
+
+import pytest
+
+from vakt.rules.net import AnyCIDR
+
+
+@pytest.mark.parametrize('cidrs, ip, result', [
+    ([], '192.168.2.56', False),
+    (['192.168.2.0/24'], '192.168.2.56', True),
+    (['192.168.2.0/28'], '192.168.2.56', False),
+    (['192.168.2.0/28', '192.168.2.48/28'], '192.168.2.56', True),
+    (['192.168.2.0/28', '10.0.0.0/8'], '10.255.0.1', True),
+    (['192.168.2.0/28', '10.0.0.0/8'], '11.0.0.1', False),
+    (['10.1.0.0/16', '10.0.0.0/8'], '10.2.0.1', True),
+    (['10.0.0.0/8', '10.1.0.0/16'], '10.2.0.1', True),
+    (['192.168.2.56/32'], '192.168.2.56', True),
+    (['192.168.2.56/32'], '192.168.2.57', False),
+    (['0.0.0.0/0'], '192.168.2.56', True),
+    (['0.0.0.0/0'], '2001:db8::1', False),
+    (['2001:db8::/32'], '2001:db8::1', True),
+    (['2001:db8::/32'], '2001:db9::1', False),
+    (['2001:db8::/32', '192.168.2.0/24'], '192.168.2.1', True),
+    (['2', '192.168.2.0/24'], '192.168.2.56', True),
+    (['2'], '192.168.2.56', False),
+    (['192.168.2.0/28'], '2', False),
+    (['192.168.2.0/28'], 2, False),
+    (['192.168.2.0/28'], None, False),
+])
+def test_any_cidr_satisfied(cidrs, ip, result):
+    c = AnyCIDR(*cidrs)
+    assert result == c.satisfied(ip)
+    # test after (de)serialization
+    assert result == AnyCIDR.from_json(c.to_json()).satisfied(ip)
+    assert result == pickle.loads(pickle.dumps(c)).satisfied(ip)
+
+
+def test_any_cidr_is_not_serialized_with_tree():
+    c = AnyCIDR('192.168.2.0/24', '10.0.0.0/8')
+    assert {'cidrs': ('192.168.2.0/24', '10.0.0.0/8')} == vars(c)
+    assert '_trees' not in c.to_json()
+
+
+def test_any_cidr_change():
+    c = AnyCIDR('192.168.2.0/24')
+    c.cidrs = ('10.0.0.0/8',)
+    assert c.satisfied('10.1.2.3')
+    assert not c.satisfied('192.168.2.1')
+
+
+def test_any_cidr_many_networks():
+    c = AnyCIDR(*['10.%d.%d.0/24' % (i // 256, i % 256) for i in range(0, 10000, 2)])
+    assert c.satisfied('10.0.0.1')
+    assert not c.satisfied('10.0.1.1')
+    assert c.satisfied('10.39.14.255')
+    assert not c.satisfied('10.39.15.0')
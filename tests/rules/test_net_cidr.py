@@ -20,3 +20,22 @@ def test_cidr_satisfied(cidr, ip, result):
         c = CIDRRule(cidr)
         assert result == c.satisfied(ip)
         assert result == CIDRRule.from_json(c.to_json()).satisfied(ip)
+
+
+def test_cidr_is_parsed_once_and_not_serialized(monkeypatch):
+    c = CIDR('192.168.2.0/24')
+    assert {'cidr': '192.168.2.0/24'} == vars(c)
+    assert '_range' not in c.to_json()
+
+    def fail(*args, **kwargs):
+        raise AssertionError('network should not be parsed on satisfied')
+    monkeypatch.setattr('ipaddress.ip_network', fail)
+    assert c.satisfied('192.168.2.1')
+    assert not c.satisfied('192.168.3.1')
+
+
+def test_cidr_change():
+    c = CIDR('192.168.2.0/24')
+    c.cidr = '10.0.0.0/8'
+    assert c.satisfied('10.1.2.3')
+    assert not c.satisfied('192.168.2.1')
@@ -0,0 +1,44 @@
+from vakt.storage.abc import Storage
+from vakt.policy import Policy
+from vakt.exceptions import PolicyExistsError
+
+
+class DictStorage(Storage):
+    def __init__(self):
+        self.policies = {}
+
+    def add(self, policy):
+        if policy.uid in self.policies:
+            raise PolicyExistsError(policy.uid)
+        self.policies[policy.uid] = policy
+
+    def get(self, uid):
+        return self.policies.get(uid)
+
+    def get_all(self, limit, offset):
+        return list(self.policies.values())
+
+    def find_for_inquiry(self, inquiry, checker=None):
+        return list(self.policies.values())
+
+    def update(self, policy):
+        if policy.uid not in self.policies:
+            raise KeyError(policy.uid)
+        self.policies[policy.uid] = policy
+
+    def delete(self, uid):
+        self.policies.pop(uid, None)
+
+
+def test_bulk_methods_default_to_single_item_ones():
+    st = DictStorage()
+    results = st.add_many(Policy(uid) for uid in ['1', '2', '1', '3'])
+    assert [None, None, None] == results[:2] + results[3:]
+    assert isinstance(results[2], PolicyExistsError)
+    assert ['1', '2', '3'] == sorted(st.policies)
+    results = st.update_many([Policy('2', description='foo'), Policy('4')])
+    assert None is results[0]
+    assert isinstance(results[1], KeyError)
+    assert 'foo' == st.get('2').description
+    assert [None, None] == st.delete_many(['1', '5'])
+    assert ['2', '3'] == sorted(st.policies)
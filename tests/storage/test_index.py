@@ -0,0 +1,426 @@
+import pytest
+
+from vakt.storage.index import RegexIndex, RulesIndex, StringExactIndex, StringFuzzyIndex, SubstringIndex, RegexSet, PrefixTrie, IntervalTree, Interval
+from vakt.policy import Policy
+from vakt.guard import Inquiry
+from vakt.rules.operator import Eq, Greater, Less, GreaterOrEqual, LessOrEqual
+from vakt.rules.list import In
+from vakt.rules.logic import Any, And
+
+
+def test_regex_index_find():
+    idx = RegexIndex()
+    idx.add(Policy('1', subjects=['max', 'bob'], actions=['get'], resources=['books', 'comics']))
+    idx.add(Policy('2', subjects=['<.*>'], actions=['get', 'list'], resources=['books']))
+    idx.add(Policy('3', subjects=['max'], actions=['<get|list>'], resources=['<.*>']))
+    idx.add(Policy('4', subjects=['max'], actions=[], resources=['books']))
+    idx.add(Policy('5', subjects=[Eq('max')], actions=[Eq('get')], resources=[Eq('books')]))
+    idx.add(Policy('6'))
+    assert {'1', '2', '3'} == idx.find(Inquiry(subject='max', action='get', resource='books'))
+    assert {'2', '3'} == idx.find(Inquiry(subject='max', action='list', resource='books'))
+    assert {'3'} == idx.find(Inquiry(subject='max', action='list', resource='magazines'))
+    assert {'2'} == idx.find(Inquiry(subject='nina', action='list', resource='books'))
+    assert set() == idx.find(Inquiry(subject='nina', action='list', resource='comics'))
+    assert {'2'} == idx.find(Inquiry(subject={'name': 'max'}, action='get', resource='books'))
+
+
+def test_regex_index_remove():
+    idx = RegexIndex()
+    p = Policy('1', subjects=['max', 'bob'], actions=['get'], resources=['<.*>'])
+    idx.add(p)
+    # mutation of an indexed policy shouldn't affect removal
+    p.subjects = ['nina']
+    idx.remove('1')
+    idx.remove('1')
+    assert 0 == len(idx.literals['subjects'])
+    assert 0 == len(idx.patterns['resources'])
+    assert 0 == len(idx.regex_sets['resources'])
+    assert set() == idx.find(Inquiry(subject='max', action='get', resource='books'))
+
+
+def test_string_exact_index_find():
+    idx = StringExactIndex()
+    idx.add(Policy('1', subjects=['max', 'bob'], actions=['get'], resources=['books', 'comics']))
+    idx.add(Policy('2', subjects=['<max>'], actions=['get', 'list'], resources=['books']))
+    idx.add(Policy('3', subjects=['max'], actions=['<.*>'], resources=['books']))
+    idx.add(Policy('4', subjects=['max'], actions=[], resources=['books']))
+    idx.add(Policy('5', subjects=[Eq('max')], actions=[Eq('get')], resources=[Eq('books')]))
+    idx.add(Policy('6', subjects=['', 'max'], actions=['get'], resources=['books']))
+    idx.add(Policy('7'))
+    assert {'1', '2', '6'} == idx.find(Inquiry(subject='max', action='get', resource='books'))
+    assert {'2'} == idx.find(Inquiry(subject='max', action='list', resource='books'))
+    assert {'3'} == idx.find(Inquiry(subject='max', action='.*', resource='books'))
+    assert {'6'} == idx.find(Inquiry(subject='nina', action='get', resource='books'))
+    assert set() == idx.find(Inquiry(subject='nina', action='list', resource='comics'))
+    assert {'1', '2', '6'} == idx.find(Inquiry(subject={'name': 'max'}, action='get', resource='books'))
+
+
+def test_string_exact_index_remove_and_copy():
+    idx = StringExactIndex()
+    p = Policy('1', subjects=['max', ''], actions=['get'], resources=['books'])
+    idx.add(p)
+    copy = idx.copy()
+    # mutation of an indexed policy shouldn't affect removal
+    p.subjects = ['nina']
+    idx.remove('1')
+    idx.remove('1')
+    assert 0 == len(idx.values['subjects'])
+    assert set() == idx.broken['subjects']
+    inquiry = Inquiry(subject='max', action='get', resource='books')
+    assert set() == idx.find(inquiry)
+    assert {'1'} == copy.find(inquiry)
+
+
+def test_string_fuzzy_index_find():
+    idx = StringFuzzyIndex()
+    idx.add(Policy('1', subjects=['maxim', 'bob'], actions=['get'], resources=['books', 'comics']))
+    idx.add(Policy('2', subjects=['<max>'], actions=['get', 'list'], resources=['audiobooks']))
+    idx.add(Policy('3', subjects=['max'], actions=['<.*>'], resources=['books']))
+    idx.add(Policy('4', subjects=['max'], actions=[], resources=['books']))
+    idx.add(Policy('5', subjects=[Eq('max')], actions=[Eq('get')], resources=[Eq('books')]))
+    idx.add(Policy('6', subjects=['', 'nina'], actions=['get'], resources=['books']))
+    idx.add(Policy('7'))
+    assert {'1', '2', '6'} == idx.find(Inquiry(subject='max', action='get', resource='books'))
+    assert {'1', '2', '6'} == idx.find(Inquiry(subject='m', action='e', resource='oo'))
+    assert {'2'} == idx.find(Inquiry(subject='ax', action='is', resource='audiobook'))
+    assert {'1'} == idx.find(Inquiry(subject='maxim', action='get', resource='comic'))
+    assert {'3'} == idx.find(Inquiry(subject='max', action='.*', resource='books'))
+    assert set() == idx.find(Inquiry(subject='maxi', action='list', resource='books'))
+    assert {'1', '2', '3', '6'} == idx.find(Inquiry(subject='', action='', resource=''))
+    assert {'1', '2', '6'} == idx.find(Inquiry(subject={'name': 'max'}, action='get', resource='books'))
+    idx.remove('2')
+    copy = idx.copy()
+    idx.remove('1')
+    assert {'6'} == idx.find(Inquiry(subject='max', action='get', resource='books'))
+    assert {'1', '6'} == copy.find(Inquiry(subject='max', action='get', resource='books'))
+    assert 'audiobooks' not in idx.values['resources']
+
+
+@pytest.mark.parametrize('value, expect', [
+    ('', ['abc', 'abcd', 'bcde', 'xyz']),
+    ('b', ['abc', 'abcd', 'bcde']),
+    ('bc', ['abc', 'abcd', 'bcde']),
+    ('bcd', ['abcd', 'bcde']),
+    ('abcd', ['abcd']),
+    ('bcde', ['bcde']),
+    ('abcde', []),
+    ('abd', []),
+    ('q', []),
+])
+def test_substring_index_containing(value, expect):
+    idx = SubstringIndex()
+    for string in ['abc', 'abcd', 'bcde', 'xyz', 'xyz']:
+        idx.add(string)
+    assert expect == sorted(idx.containing(value))
+
+
+def test_substring_index_remove_and_copy():
+    idx = SubstringIndex(gram_size=2)
+    idx.add('abcabc')
+    idx.add('cab')
+    copy = idx.copy()
+    idx.remove('abcabc')
+    idx.remove('abcabc')
+    assert ['cab'] == sorted(idx.containing('ab'))
+    assert [] == sorted(idx.containing('bca'))
+    assert 1 == len(idx)
+    assert {'c', 'a', 'b', 'ca', 'ab'} == set(idx.grams)
+    assert ['abcabc'] == sorted(copy.containing('bca'))
+    assert 2 == len(copy)
+
+
+def test_rules_index():
+    idx = RulesIndex()
+    idx.add(Policy('1', subjects=['max'], actions=['get'], resources=['books']))
+    idx.add(Policy('2', subjects=[Eq('max')], actions=[Any()], resources=[Any()]))
+    idx.add(Policy('3', subjects=[{'name': Eq('max')}], actions=[Any()], resources=[Any()]))
+    idx.add(Policy('4'))
+    idx.add(Policy('5', subjects=[Any()]))
+    assert {'2'} == idx.find(Inquiry(subject='max', action='get'))
+    assert {'2', '3'} == idx.find(Inquiry(subject={'name': 'max'}, action='get'))
+    idx.remove('2')
+    assert set() == idx.find(Inquiry(subject='max', action='get'))
+
+
+def test_rules_index_find_by_values():
+    idx = RulesIndex()
+    any_action = {'actions': [Any()], 'resources': [Any()]}
+    idx.add(Policy('1', subjects=[{'tenant': Eq('acme'), 'role': Any()}], **any_action))
+    idx.add(Policy('2', subjects=[{'tenant': In('acme', 'globex'), 'role': Eq('admin')}], **any_action))
+    idx.add(Policy('3', subjects=[{'tenant': Eq('initech')}, {'name': Eq('max')}], **any_action))
+    idx.add(Policy('4', subjects=[{'tenant': Any()}], **any_action))
+    idx.add(Policy('5', subjects=[{'tenant': Eq(['acme'])}], **any_action))
+    idx.add(Policy('6', subjects=[{'tenant': Eq('acme')}, Any()], **any_action))
+    idx.add(Policy('7', subjects=[{'tenant': Eq('acme')}, {}], **any_action))
+    idx.add(Policy('8', subjects=[{'tenant': Eq('acme')}], actions=[In('get', 'list')], resources=[Any()],
+                   context={'ip': Any(), 'region': Eq('eu')}))
+    idx.add(Policy('9', subjects=[In()], **any_action))
+    assert {'1', '2', '4', '5', '6', '7'} == idx.find(Inquiry(subject={'tenant': 'acme'}, action='delete'))
+    assert {'1', '2', '4', '5', '6', '7', '8'} == \
+        idx.find(Inquiry(subject={'tenant': 'acme'}, action='get', context={'region': 'eu'}))
+    assert {'2', '4', '5', '6'} == idx.find(Inquiry(subject={'tenant': 'globex'}, action='get'))
+    assert {'3', '4', '5', '6'} == idx.find(Inquiry(subject={'name': 'max', 'tenant': 'x'}))
+    assert {'4', '5', '6'} == idx.find(Inquiry(subject={'name': 'bob'}))
+    assert {'4', '5', '6'} == idx.find(Inquiry(subject='acme'))
+    # values that are not literals are left for the checker
+    assert {'1', '2', '3', '4', '5', '6', '7'} == idx.find(Inquiry(subject={'tenant': ['acme'], 'name': 'max'}))
+    for uid in ['4', '5', '6']:
+        idx.remove(uid)
+    assert set() == idx.find(Inquiry(subject={'name': 'bob'}))
+    assert {'3'} == idx.find(Inquiry(subject={'name': 'max'}))
+    for uid in ['1', '2', '3', '7', '8', '9']:
+        idx.remove(uid)
+    assert {field: {} for field in idx.values} == idx.values
+    assert {field: set() for field in idx.others} == idx.others
+
+
+def test_rules_index_find_by_intervals():
+    idx = RulesIndex()
+    any_action = {'actions': [Any()], 'resources': [Any()]}
+    idx.add(Policy('1', subjects=[{'stars': And(Greater(50), Less(999)), 'name': Any()}], **any_action))
+    idx.add(Policy('2', subjects=[{'stars': GreaterOrEqual(999)}], **any_action))
+    idx.add(Policy('3', subjects=[LessOrEqual(50)], **any_action))
+    idx.add(Policy('4', subjects=[{'stars': And(Greater(10), Less(5))}], **any_action))
+    idx.add(Policy('5', subjects=[{'stars': Greater('a')}], **any_action))
+    idx.add(Policy('6', subjects=[{'stars': Greater(100), 'name': Eq('max')}], **any_action))
+    # bare rule of policy 3 can't be satisfied by dictionaries, but it's up to the checker
+    assert {'1', '3', '5'} == idx.find(Inquiry(subject={'stars': 51}))
+    assert {'1', '3', '5', '6'} == idx.find(Inquiry(subject={'stars': 500, 'name': 'max'}))
+    assert {'2', '3', '5'} == idx.find(Inquiry(subject={'stars': 999.0}))
+    assert {'2', '3', '5'} == idx.find(Inquiry(subject={'stars': float('inf')}))
+    assert {'3', '5'} == idx.find(Inquiry(subject={'stars': 50}))
+    assert {'3', '5'} == idx.find(Inquiry(subject=50))
+    assert {'3', '5'} == idx.find(Inquiry(subject=-10 ** 100))
+    assert {'5'} == idx.find(Inquiry(subject=51))
+    # values that are not numbers are left for the checker
+    assert {'1', '2', '3', '5'} == idx.find(Inquiry(subject={'stars': '51'}))
+    assert {'3', '5'} == idx.find(Inquiry(subject='51'))
+    for uid in ['1', '2', '3', '4', '5', '6']:
+        idx.remove(uid)
+    assert {field: {} for field in idx.intervals} == idx.intervals
+
+
+@pytest.mark.parametrize('intervals, number, expect', [
+    ([], 1, []),
+    ([(1, True, 5, True)], 1, [0]),
+    ([(1, False, 5, True)], 1, []),
+    ([(1, False, 5, True)], 5, [0]),
+    ([(1, False, 5, False)], 5, []),
+    ([(1, False, 5, False), (5, True, 10, False), (3, True, 7, True), (-10, True, 0, False)], 5, [1, 2]),
+    ([(1, False, 5, False), (5, True, 10, False), (3, True, 7, True), (-10, True, 0, False)], 2, [0]),
+    ([(1, False, 5, False), (5, True, 10, False), (3, True, 7, True), (-10, True, 0, False)], 0, []),
+    ([(1, False, 5, False), (5, True, 10, False), (3, True, 7, True), (-10, True, 0, False)], -10, [3]),
+    ([(float('-inf'), True, float('inf'), True), (1, True, float('inf'), True)], 0, [0]),
+    ([(float('-inf'), True, float('inf'), True), (1, True, float('inf'), True)], float('inf'), [0, 1]),
+    ([(i, True, i + 10, False) for i in range(100)], 50.5, list(range(41, 51))),
+    ([(i, True, i + 10, False) for i in range(100)], float('nan'), []),
+])
+def test_interval_tree_find(intervals, number, expect):
+    tree = IntervalTree()
+    for i, interval in enumerate(intervals):
+        tree.add(Interval(*interval), i)
+    assert expect == sorted(uid for uids in tree.find(number) for uid in uids)
+
+
+def test_interval_tree_change_and_copy():
+    tree = IntervalTree()
+    tree.add(Interval(1, True, 5, True), 'a')
+    tree.add(Interval(1, True, 5, True), 'b')
+    tree.add(Interval(4, True, 8, True), 'c')
+    assert [{'a', 'b'}, {'c'}] == sorted(tree.find(4), key=len, reverse=True)
+    copy = tree.copy()
+    tree.remove(Interval(1, True, 5, True), 'a')
+    tree.remove(Interval(4, True, 8, True), 'c')
+    tree.remove(Interval(4, True, 8, True), 'c')
+    copy.add(Interval(0, True, 2, True), 'd')
+    assert [{'b'}] == tree.find(4)
+    assert 1 == len(tree)
+    assert [{'a', 'b'}, {'c'}] == sorted(copy.find(4), key=len, reverse=True)
+    assert [{'a', 'b'}, {'d'}] == sorted(copy.find(2), key=len, reverse=True)
+
+
+def test_interval_tree_is_built_lazily_for_every_copy():
+    tree = IntervalTree()
+    tree.add(Interval(1, True, 5, True), 'a')
+    before = tree.copy()
+    assert [{'a'}] == tree.find(3)
+    after = tree.copy()
+    before.add(Interval(2, True, 3, True), 'b')
+    after.add(Interval(3, True, 4, True), 'c')
+    assert [{'a'}] == tree.find(3)
+    assert [{'a'}, {'b'}] == sorted(before.find(3), key=sorted)
+    assert [{'a'}, {'c'}] == sorted(after.find(3), key=sorted)
+    assert tree.root is not IntervalTree.NOT_BUILT
+
+
+def test_rules_index_is_not_changed_by_policy_mutation():
+    idx = RulesIndex()
+    p = Policy('1', subjects=[{'tenant': Eq('acme')}], actions=[Any()], resources=[Any()])
+    idx.add(p)
+    p.subjects = [{'tenant': Eq('globex')}]
+    assert {'1'} == idx.find(Inquiry(subject={'tenant': 'acme'}))
+    idx.remove('1')
+    assert set() == idx.find(Inquiry(subject={'tenant': 'acme'}))
+    assert {} == idx.values['subjects']
+
+
+def test_regex_index_matches_each_pattern_once():
+    idx = RegexIndex()
+    for i in range(100):
+        idx.add(Policy(str(i), subjects=['<[mM]ax>'], actions=['<get|list>'], resources=['books:<\\d+>']))
+    idx.add(Policy('x', subjects=['<[mM]ax>'], actions=['get'], resources=['books:<\\d+>']))
+    assert 1 == len(idx.regex_sets['subjects'])
+    assert 101 == len(idx.find(Inquiry(subject='max', action='get', resource='books:1')))
+    assert 100 == len(idx.find(Inquiry(subject='Max', action='list', resource='books:12')))
+    assert 0 == len(idx.find(Inquiry(subject='Max', action='list', resource='books:x')))
+    for i in range(100):
+        idx.remove(str(i))
+    assert {'x'} == idx.find(Inquiry(subject='max', action='get', resource='books:1'))
+    assert 0 == len(idx.regex_sets['actions'])
+    assert 1 == len(idx.regex_sets['resources'])
+
+
+@pytest.mark.parametrize('patterns, value, expect', [
+    ([], 'foo', []),
+    (['<.*>'], 'foo', ['<.*>']),
+    (['<f.o>', '<b.r>', 'fo<o+>', '<\\d+>'], 'foo', ['<f.o>', 'fo<o+>']),
+    (['<f.o>', '<b.r>', 'fo<o+>', '<\\d+>'], 'baz', []),
+    (['<(?P<y>a)(?P=y)>', '<(?P<x>b)(?P=x)>', '<(?P<x>b)>', '<(a)>'], 'aa', ['<(?P<y>a)(?P=y)>']),
+    (['<(?P<y>a)(?P=y)>', '<(?P<x>b)(?P=x)>', '<(?P<x>b)>', '<(a)>'], 'a', ['<(a)>']),
+    (['<(?P<y>a)(?P=y)>', '<(?P<x>b)(?P=x)>', '<(?P<x>b)>', '<(a)>'], 'bb', ['<(?P<x>b)(?P=x)>']),
+    (['<(?P<y>a)(?P=y)>', '<(?P<x>b)(?P=x)>', '<(?P<x>b)>', '<(a)>'], 'b', ['<(?P<x>b)>']),
+    (['<foo', '<.*>'], 'foo', ['<.*>']),
+    (['<[>', '<.*>'], 'foo', ['<[>', '<.*>']),
+    (['<(?i)foo>', '<.*>'], 'foo', ['<(?i)foo>', '<.*>']),
+])
+def test_regex_set_match(patterns, value, expect):
+    rs = RegexSet()
+    rs.chunk_size = 2
+    for p in patterns:
+        rs.add((p, '<', '>'))
+    assert sorted(expect) == sorted(k[0] for k in rs.match(value))
+
+
+def test_regex_set_remove():
+    rs = RegexSet()
+    rs.chunk_size = 2
+    for p in ['<f.o>', '<b.r>', 'fo<o+>', '<.*>', '<(?P<y>f)o+>', '<(?i)foo>']:
+        rs.add((p, '<', '>'))
+    assert 5 == len(rs.match('foo'))
+    assert 1 == len(rs.singles)
+    assert 1 == len(rs.failing)
+    assert 2 == len(rs.groups)
+    assert 2 == len(rs.groups.get('').chunks)
+    rs.remove(('<f.o>', '<', '>'))
+    rs.remove(('fo<o+>', '<', '>'))
+    rs.remove(('<(?P<y>f)o+>', '<', '>'))
+    rs.remove(('<(?i)foo>', '<', '>'))
+    rs.remove(('<unknown>', '<', '>'))
+    assert [('<.*>', '<', '>')] == rs.match('foo')
+    assert 1 == len(rs.groups)
+    assert None is rs.groups.get('fo')
+    assert 2 == len(rs)
+
+
+def test_regex_set_runs_only_patterns_with_matching_prefix():
+    rs = RegexSet()
+    rs.add(('library:books:<.+>', '<', '>'))
+    rs.add(('library:<.+>', '<', '>'))
+    rs.add(('office:<.+>', '<', '>'))
+    rs.add(('<[a-z]+>:books:1', '<', '>'))
+    assert 4 == len(rs.groups)
+    assert 2 == len(list(rs.groups.prefixes_of('library:x')))
+    assert 1 == len(list(rs.groups.prefixes_of('books')))
+    assert ['<[a-z]+>:books:1', 'library:<.+>', 'library:books:<.+>'] == \
+        sorted(k[0] for k in rs.match('library:books:1'))
+    assert ['<[a-z]+>:books:1', 'office:<.+>'] == sorted(k[0] for k in rs.match('office:books:1'))
+
+
+def test_prefix_trie():
+    t = PrefixTrie()
+    t.set('', 0)
+    t.set('ab', 2)
+    t.set('abcd', 4)
+    t.set('b', 'b')
+    assert 4 == len(t)
+    assert [0, 2, 4] == list(t.prefixes_of('abcde'))
+    assert [0, 2] == list(t.prefixes_of('abc'))
+    assert [0] == list(t.prefixes_of('a'))
+    assert [0, 'b'] == list(t.prefixes_of('bb'))
+    assert 2 == t.get('ab')
+    assert None is t.get('abc')
+    assert 'x' == t.get('abcdef', 'x')
+    t.remove('ab')
+    t.remove('ab')
+    t.remove('abce')
+    assert 3 == len(t)
+    assert [0, 4] == list(t.prefixes_of('abcde'))
+    t.remove('abcd')
+    assert {'b'} == set(t.root.children)
+    t.set('b', None)
+    assert [0, None] == list(t.prefixes_of('b'))
+
+
+def test_index_copy_is_independent():
+    idx = RegexIndex()
+    idx.add(Policy('1', subjects=['max', '<n.na>'], actions=['get'], resources=['books']))
+    idx.add(Policy('2', subjects=['<n.na>'], actions=['get'], resources=['<b.+>']))
+    inquiry = Inquiry(subject='nina', action='get', resource='books')
+    assert {'1', '2'} == idx.find(inquiry)
+    copy = idx.copy()
+    copy.remove('1')
+    copy.add(Policy('3', subjects=['nina'], actions=['get'], resources=['books']))
+    idx.remove('2')
+    assert {'1'} == idx.find(inquiry)
+    assert {'2', '3'} == copy.find(inquiry)
+    rules_idx = RulesIndex()
+    rules_idx.add(Policy('1', subjects=[Eq('nina')], actions=[Any()], resources=[Any()]))
+    rules_copy = rules_idx.copy()
+    rules_copy.remove('1')
+    rules_copy.add(Policy('2', subjects=[In('nina', 'max')], actions=[Any()], resources=[Any()]))
+    assert {'1'} == rules_idx.find(inquiry)
+    assert {'2'} == rules_copy.find(inquiry)
+
+
+def test_regex_set_copy_is_independent():
+    rs = RegexSet()
+    rs.chunk_size = 2
+    for p in ['<f.o>', '<b.r>', 'fo<o+>', '<.*>', '<(?P<y>f)o+>']:
+        rs.add((p, '<', '>'))
+    assert 4 == len(rs.match('foo'))
+    copy = rs.copy()
+    copy.remove(('<f.o>', '<', '>'))
+    copy.remove(('<(?P<y>f)o+>', '<', '>'))
+    copy.add(('f<o{2}>', '<', '>'))
+    rs.remove(('fo<o+>', '<', '>'))
+    assert ['<(?P<y>f)o+>', '<.*>', '<f.o>'] == sorted(k[0] for k in rs.match('foo'))
+    assert ['<.*>', 'f<o{2}>', 'fo<o+>'] == sorted(k[0] for k in copy.match('foo'))
+
+
+def test_regex_set_is_compiled_lazily_for_every_copy():
+    rs = RegexSet()
+    rs.add(('<f.o>', '<', '>'))
+    rs.add(('<b.r>', '<', '>'))
+    before = rs.copy()
+    assert ['<f.o>'] == [k[0] for k in rs.match('foo')]
+    after = rs.copy()
+    before.add(('<fo+>', '<', '>'))
+    after.add(('<.*>', '<', '>'))
+    assert ['<f.o>'] == [k[0] for k in rs.match('foo')]
+    assert ['<f.o>', '<fo+>'] == sorted(k[0] for k in before.match('foo'))
+    assert ['<.*>', '<f.o>'] == sorted(k[0] for k in after.match('foo'))
+
+
+def test_prefix_trie_copy():
+    t = PrefixTrie()
+    t.set('', 0)
+    t.set('ab', 2)
+    copy = t.copy()
+    copy.set('ab', 3)
+    copy.set('abc', 4)
+    copy.remove('')
+    t.set('a', 1)
+    assert [0, 1, 2] == list(t.prefixes_of('abc'))
+    assert [3, 4] == list(copy.prefixes_of('abc'))
+    assert 3 == len(t)
+    assert 2 == len(copy)
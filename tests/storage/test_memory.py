@@ -1,11 +1,16 @@
+import random
+
 import pytest
 
 from vakt.storage.memory import MemoryStorage
 from vakt.policy import Policy
-from vakt.guard import Inquiry
+from vakt.guard import Inquiry, Guard, CachingGuard
+from vakt.effects import ALLOW_ACCESS, DENY_ACCESS
 from vakt.exceptions import PolicyExistsError
-from vakt.rules.operator import Eq
-from vakt.rules.logic import Any
+from vakt.rules.operator import Eq, Greater, Less, GreaterOrEqual, LessOrEqual
+from vakt.rules.logic import Any, And
+from vakt.rules.list import In
+from vakt.checker import RegexChecker, RulesChecker, StringExactChecker, StringFuzzyChecker
 
 
 @pytest.fixture
@@ -116,3 +121,297 @@ def test_delete(st):
     st.delete('1')
     assert None is st.get('1')
     st.delete('1000000')
+
+
+def test_on_change_callbacks(st):
+    calls = []
+
+    class Listener:
+        def notify(self):
+            calls.append('method')
+    listener = Listener()
+    st.on_change(lambda: calls.append('function'))
+    st.on_change(listener.notify)
+    st.add(Policy('1'))
+    assert ['function', 'method'] == calls
+    st.update(Policy('1', description='foo'))
+    assert 4 == len(calls)
+    del listener
+    st.delete('1')
+    assert ['function', 'method', 'function', 'method', 'function'] == calls
+    st.delete('1')
+    assert 5 == len(calls)
+
+
+@pytest.mark.parametrize('checker, expect', [
+    (None, ['1', '2', '3', '4', '5']),
+    (RegexChecker(), ['4']),
+    (RulesChecker(), ['5']),
+    (StringExactChecker(), ['4']),
+    (StringFuzzyChecker(), ['4']),
+])
+def test_find_for_inquiry_with_checker(st, checker, expect):
+    st.add(Policy('1', subjects=['<[mM]ax>', '<.*>']))
+    st.add(Policy('2', subjects=['sam<.*>', 'Jim']))
+    st.add(Policy('3', subjects=[{'stars': Eq(90)}, Eq('Max')], actions=[Any()], resources=[Any()]))
+    st.add(Policy('4', subjects=['Jim'], actions=['delete'], resources=['server']))
+    st.add(Policy('5', subjects=[Eq('Jim'), Eq('Nina')], actions=[Any()], resources=[Any()]))
+    inquiry = Inquiry(subject='Jim', action='delete', resource='server')
+    found = st.find_for_inquiry(inquiry, checker)
+    assert expect == sorted(p.uid for p in found)
+
+
+@pytest.mark.parametrize('checker', [
+    None, RegexChecker(), RulesChecker(), StringExactChecker(), StringFuzzyChecker(),
+])
+def test_find_for_inquiry_by_effect(st, checker):
+    st.add(Policy('1', subjects=['Jim'], actions=['delete'], resources=['server'], effect=ALLOW_ACCESS))
+    st.add(Policy('2', subjects=['<.*>'], actions=['delete'], resources=['server'], effect=DENY_ACCESS))
+    st.add(Policy('3', subjects=[Eq('Jim')], actions=[Any()], resources=[Any()], effect=ALLOW_ACCESS))
+    st.add(Policy('4', subjects=[Eq('Jim')], actions=[Any()], resources=[Any()], effect=DENY_ACCESS))
+    inquiry = Inquiry(subject='Jim', action='delete', resource='server')
+    found = sorted(p.uid for p in st.find_for_inquiry(inquiry, checker))
+    allow = sorted(p.uid for p in st.find_for_inquiry_by_effect(inquiry, ALLOW_ACCESS, checker))
+    deny = sorted(p.uid for p in st.find_for_inquiry_by_effect(inquiry, DENY_ACCESS, checker))
+    assert found == sorted(allow + deny)
+    assert all(st.get(uid).allow_access() for uid in allow)
+    assert not any(st.get(uid).allow_access() for uid in deny)
+    st.update(Policy('2', subjects=['<.*>'], actions=['delete'], resources=['server'], effect=ALLOW_ACCESS))
+    st.update(Policy('4', subjects=[Eq('Jim')], actions=[Any()], resources=[Any()], effect=ALLOW_ACCESS))
+    assert [] == st.find_for_inquiry_by_effect(inquiry, DENY_ACCESS, checker)
+    assert found == sorted(p.uid for p in st.find_for_inquiry_by_effect(inquiry, ALLOW_ACCESS, checker))
+
+
+def test_find_for_inquiry_with_subclassed_checker(st):
+    class CaseInsensitiveChecker(StringExactChecker):
+        def compare(self, needle, haystack):
+            return needle.lower() == haystack.lower()
+    st.add(Policy('1', subjects=['Jim'], actions=['Delete'], resources=['server'], effect=ALLOW_ACCESS))
+    st.add(Policy('2', subjects=['Max'], actions=['delete'], resources=['server'], effect=DENY_ACCESS))
+    inquiry = Inquiry(subject='jim', action='delete', resource='SERVER')
+    checker = CaseInsensitiveChecker()
+    assert ['1', '2'] == sorted(p.uid for p in st.find_for_inquiry(inquiry, checker))
+    assert ['1'] == [p.uid for p in st.find_for_inquiry_by_effect(inquiry, ALLOW_ACCESS, checker)]
+    assert ['2'] == [p.uid for p in st.find_for_inquiry_by_effect(inquiry, DENY_ACCESS, checker)]
+    assert Guard(st, checker).is_allowed(inquiry)
+
+
+def test_partitioned_by_effect():
+    class Subclass(MemoryStorage):
+        pass
+
+    class CustomFind(MemoryStorage):
+        def find_for_inquiry(self, inquiry, checker=None):
+            return []
+    assert MemoryStorage().partitioned_by_effect
+    assert Subclass().partitioned_by_effect
+    assert not CustomFind().partitioned_by_effect
+
+
+def test_find_for_inquiry_after_update_and_delete(st):
+    st.add(Policy('1', subjects=['Jim'], actions=['delete'], resources=['server']))
+    st.add(Policy('2', subjects=['<.*>'], actions=['delete'], resources=['server']))
+    inquiry = Inquiry(subject='Jim', action='delete', resource='server')
+    assert ['1', '2'] == sorted(p.uid for p in st.find_for_inquiry(inquiry, RegexChecker()))
+    st.update(Policy('1', subjects=['Max'], actions=['delete'], resources=['server']))
+    assert ['2'] == sorted(p.uid for p in st.find_for_inquiry(inquiry, RegexChecker()))
+    st.update(Policy('1', subjects=['Jim'], actions=['delete'], resources=['<.*>']))
+    assert ['1', '2'] == sorted(p.uid for p in st.find_for_inquiry(inquiry, RegexChecker()))
+    st.delete('2')
+    assert ['1'] == sorted(p.uid for p in st.find_for_inquiry(inquiry, RegexChecker()))
+
+
+def _random_policies(rnd, number):
+    words = ['max', 'nina', 'get', 'list', 'books', 'books:1', 'books:12', 'magazines']
+    patterns = ['<.*>', '<max|nina>', 'books:<\\d+>', 'books<.+>', 'ma<.*>', '<[a-z]+>', '<get']
+    rules = {
+        'a': [Eq('max'), Eq('get'), Any(), In('max', 'list')],
+        'b': [Eq(5), Any(), And(Greater(1), Less(10)), GreaterOrEqual(5), In(5, 12), LessOrEqual(1), Greater(10),
+              And(GreaterOrEqual(12), LessOrEqual(12.0)), And(Greater(5), Less(5))],
+    }
+
+    def strings():
+        return [rnd.choice(words + patterns) for _ in range(rnd.randint(0, 3))]
+
+    def rule_items():
+        items = []
+        for _ in range(rnd.randint(0, 3)):
+            if rnd.random() < 0.3:
+                items.append(rnd.choice(rules['a']))
+            else:
+                keys = rnd.sample(['a', 'b'], rnd.randint(1, 2))
+                items.append({key: rnd.choice(rules[key]) for key in keys})
+        return items
+    for i in range(number):
+        make = strings if rnd.random() < 0.5 else rule_items
+        yield Policy(str(i), subjects=make(), actions=make(), resources=make(),
+                     effect=rnd.choice([ALLOW_ACCESS, DENY_ACCESS]))
+
+
+def _random_inquiries(rnd, number):
+    values = ['max', 'nina', 'get', 'list', 'books', 'books:1', 'books:12', 'magazines', 'ma', '', 5, 7,
+              {'a': 'max'}, {'a': 'get', 'b': 5}, {'b': 12}, {'a': 'list', 'b': 1}, {'b': 7.5}, {'a': [1]}]
+    for _ in range(number):
+        yield Inquiry(subject=rnd.choice(values), action=rnd.choice(values), resource=rnd.choice(values))
+
+
+@pytest.mark.parametrize('checker', [
+    RegexChecker(),
+    RulesChecker(),
+    StringExactChecker(),
+    StringFuzzyChecker(),
+])
+def test_guard_decisions_are_the_same_as_without_indices(checker):
+    class NoIndexStorage(MemoryStorage):
+        def find_for_inquiry(self, inquiry, checker=None):
+            return list(self.policies.values())
+    rnd = random.Random(42)
+    st, no_index_st = MemoryStorage(), NoIndexStorage()
+    for p in _random_policies(rnd, 300):
+        st.add(p)
+        no_index_st.add(p)
+    for p in _random_policies(rnd, 50):
+        st.update(p)
+        no_index_st.update(p)
+    for uid in range(0, 300, 7):
+        st.delete(str(uid))
+        no_index_st.delete(str(uid))
+    guard, no_index_guard = Guard(st, checker), Guard(no_index_st, checker)
+    allowed = 0
+    for inquiry in _random_inquiries(rnd, 500):
+        expected = no_index_guard.is_allowed(inquiry)
+        allowed += expected
+        assert expected == guard.is_allowed(inquiry)
+    assert allowed > 0, allowed
+
+
+def test_reads_are_served_from_snapshots(st):
+    st.add(Policy('1', subjects=['max'], actions=['get'], resources=['books']))
+    inquiry = Inquiry(subject='max', action='get', resource='books')
+    policies = st.get_all(0, 0)
+    assert ['1'] == [p.uid for p in st.find_for_inquiry(inquiry, RegexChecker())]
+    st.add(Policy('2', subjects=['max'], actions=['get'], resources=['books']))
+    assert ['1'] == [p.uid for p in policies]
+    assert ['1', '2'] == sorted(p.uid for p in st.find_for_inquiry(inquiry, RegexChecker()))
+    # write in progress doesn't block reads: the previous snapshot is used
+    with st.lock:
+        st._prepare_write()
+        del st.policies['2']
+        st._unindex('2')
+        assert ['1', '2'] == sorted(p.uid for p in st.find_for_inquiry(inquiry, RegexChecker()))
+        assert '2' == st.get('2').uid
+        st._publish()
+        assert ['1'] == [p.uid for p in st.find_for_inquiry(inquiry, RegexChecker())]
+
+
+def test_finished_writes_are_visible_while_lock_is_held_by_another_writer(st):
+    import threading
+    st.add(Policy('1', subjects=['max'], actions=['get'], resources=['books'], effect=ALLOW_ACCESS))
+    locked, release = threading.Event(), threading.Event()
+
+    def hold_lock():
+        with st.lock:
+            locked.set()
+            release.wait(5)
+    t = threading.Thread(target=hold_lock)
+    st.delete('2')
+    st.add(Policy('2', subjects=['max'], actions=['get'], resources=['books'], effect=DENY_ACCESS))
+    t.start()
+    locked.wait(5)
+    try:
+        assert '2' == st.get('2').uid
+        guard = CachingGuard(st, RegexChecker())
+        assert not guard.is_allowed(Inquiry(subject='max', action='get', resource='books'))
+    finally:
+        release.set()
+        t.join()
+
+
+def test_concurrent_reads_and_writes(st):
+    import threading
+    inquiry = Inquiry(subject='max', action='get', resource='books')
+    errors = []
+    done = threading.Event()
+
+    def write():
+        try:
+            for i in range(300):
+                st.add(Policy(str(i), subjects=['max', '<m.x>'], actions=['get'], resources=['books']))
+                if i % 3 == 0:
+                    st.delete(str(i))
+        finally:
+            done.set()
+
+    def read():
+        checker = RegexChecker()
+        try:
+            while not done.is_set():
+                found = st.find_for_inquiry(inquiry, checker)
+                all_policies = st.get_all(0, 0)
+                assert len(set(p.uid for p in found)) == len(found)
+                assert len(found) <= 200 and len(all_policies) <= 200
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert [] == errors
+    assert 200 == len(st.find_for_inquiry(inquiry, RegexChecker()))
+
+
+def test_write_cost_does_not_grow_with_number_of_policies(st):
+    import time
+
+    def policy(i):
+        if i % 2:
+            return Policy(str(i), subjects=['user%d' % i, '<[mM]ax%d>' % (i % 50)], actions=['get', 'list'],
+                          resources=['books:%d:<.*>' % i])
+        return Policy(str(i), subjects=[{'name': Eq('user%d' % i)}], actions=[Any()], resources=[{'n': Greater(i)}])
+
+    def cost(write):
+        start = time.perf_counter()
+        write()
+        return time.perf_counter() - start
+    size = 4000
+    build_cost = cost(lambda: st.add_many(policy(i) for i in range(size)))
+    # a single write should cost about as much as indexing a few policies, not as much as copying the whole store
+    uids = iter(range(size, 2 * size))
+    for write in (lambda: st.add(policy(next(uids))), lambda: st.update(policy(7)), lambda: st.delete(str(next(uids)))):
+        assert min(cost(write) for _ in range(3)) < build_cost / 40
+    assert size + 3 == len(st.get_all(0, 0))
+
+
+def test_add_many(st):
+    calls = []
+    st.on_change(lambda: calls.append(1))
+    results = st.add_many(Policy(uid, subjects=['max'], actions=['get'], resources=['books']) for uid in '1213')
+    assert [None, None, None] == results[:2] + results[3:]
+    assert isinstance(results[2], PolicyExistsError)
+    assert 1 == len(calls)
+    assert ['1', '2', '3'] == sorted(p.uid for p in st.get_all(0, 0))
+    inquiry = Inquiry(subject='max', action='get', resource='books')
+    assert 3 == len(st.find_for_inquiry(inquiry, RegexChecker()))
+    assert isinstance(st.add_many([Policy('1')])[0], PolicyExistsError)
+    assert [] == st.add_many([])
+    assert 1 == len(calls)
+
+
+def test_update_many_and_delete_many(st):
+    st.add_many(Policy(uid, subjects=['max'], actions=['get'], resources=['books']) for uid in '123')
+    calls = []
+    st.on_change(lambda: calls.append(1))
+    assert [None, None] == st.update_many([Policy('1', subjects=['nina']), Policy('4', subjects=['max'])])
+    assert 1 == len(calls)
+    assert ['nina'] == st.get('1').subjects
+    assert '4' == st.get('4').uid
+    inquiry = Inquiry(subject='max', action='get', resource='books')
+    assert ['2', '3'] == sorted(p.uid for p in st.find_for_inquiry(inquiry, RegexChecker()))
+    assert [None, None, None] == st.delete_many(['2', '5', '4'])
+    assert 2 == len(calls)
+    assert ['1', '3'] == sorted(p.uid for p in st.get_all(0, 0))
+    assert ['3'] == [p.uid for p in st.find_for_inquiry(inquiry, RegexChecker())]
+    assert [None] == st.delete_many(['5'])
+    assert 2 == len(calls)
@@ -10,7 +10,7 @@ from bson.objectid import ObjectId
 
 from vakt.storage.mongo import *
 from vakt.storage.memory import MemoryStorage
-from vakt.effects import ALLOW_ACCESS
+from vakt.effects import ALLOW_ACCESS, DENY_ACCESS
 from vakt.policy import Policy
 from vakt.rules.string import Equal
 from vakt.rules.logic import Any
@@ -157,7 +157,7 @@ class TestMongoStorage:
 
     @pytest.mark.parametrize('checker, expect_number', [
         (None, 5),
-        (RegexChecker(), 3),
+        (RegexChecker(), 1),
         (RulesChecker(), 2),
         (StringExactChecker(), 1),
         (StringFuzzyChecker(), 1),
@@ -266,6 +266,85 @@ class TestMongoStorage:
         assert reference_answer == Guard(st, RegexChecker()).is_allowed(inquiry), \
             'Mongo storage should give the same answers as reference'
 
+    def test_find_for_inquiry_with_regex_checker_uses_literal_prefixes(self, st):
+        st.add(Policy('1', subjects=['max', '<[Nn]ina>'], actions=['get'], resources=['library:books:<.+>']))
+        st.add(Policy('2', subjects=['<.*>'], actions=['<get|list>'], resources=['library:<.+>']))
+        st.add(Policy('3', subjects=['max'], actions=['get'], resources=['office:<.+>']))
+        st.add(Policy('4', subjects=['max'], actions=['get'], resources=['library:books:' + 'x' * 200]))
+        st.add(Policy('5', subjects=['max'], actions=['get'], resources=['<[>']))
+        st.add(Policy('6', subjects=[Eq('max')], actions=[Eq('get')], resources=[Eq('library:books:1')]))
+        doc = st.collection.find_one({'_id': '1'})
+        assert {
+            'subjects': ['=max', '^'],
+            'actions': ['=get'],
+            'resources': ['^library:books:'],
+        } == doc['prefixes']
+        assert 'prefixes' not in vars(st.get('1'))
+
+        def found(subject, action, resource):
+            inquiry = Inquiry(subject=subject, action=action, resource=resource)
+            return sorted(p.uid for p in st.find_for_inquiry(inquiry, RegexChecker()))
+        assert ['1', '2', '5'] == found('max', 'get', 'library:books:1')
+        assert ['1', '2', '4', '5'] == found('max', 'get', 'library:books:' + 'x' * 300)
+        assert ['2'] == found('max', 'list', 'library:books:1')
+        assert ['3', '5'] == found('max', 'get', 'office:1')
+        assert ['2'] == found('Nina', 'list', 'library:1')
+        assert ['1', '2', '3', '4', '5'] == found('max', 'get', {'path': 'office:1'})
+        # policies stored without prefixes are always found
+        st.collection.update_one({'_id': '3'}, {'$unset': {'prefixes': ''}})
+        assert ['2', '3'] == found('Nina', 'list', 'library:1')
+
+    def test_find_for_inquiry_with_decision_only_fields(self, st):
+        st.add(Policy('1', subjects=['max'], actions=['get'], resources=['books'], description='foo bar'))
+        inquiry = Inquiry(subject='max', action='get', resource='books')
+        assert 'foo bar' == list(st.find_for_inquiry(inquiry, RegexChecker()))[0].description
+        light_st = MongoStorage(st.client, DB_NAME, collection=COLLECTION, decision_only=True)
+        found = list(light_st.find_for_inquiry(inquiry, RegexChecker()))
+        assert ['1'] == [p.uid for p in found]
+        assert None is found[0].description
+        assert ['max'] == found[0].subjects
+        assert 'foo bar' == light_st.get('1').description
+        assert 'foo bar' == list(light_st.get_all(10, 0))[0].description
+
+    def test_reads_with_batch_size(self, st):
+        st = MongoStorage(st.client, DB_NAME, collection=COLLECTION, batch_size=2)
+        for i in range(5):
+            st.add(Policy(str(i), subjects=['max'], actions=['get'], resources=['books']))
+        inquiry = Inquiry(subject='max', action='get', resource='books')
+        assert 5 == len(list(st.find_for_inquiry(inquiry, RegexChecker())))
+        assert 5 == len(list(st.get_all(0, 0)))
+
+    def test_add_many(self, st):
+        calls = []
+        st.on_change(lambda: calls.append(1))
+        st.add(Policy('2'))
+        policies = [Policy(str(i), subjects=['max'], actions=['get'], resources=['books']) for i in range(5)]
+        policies.append(Policy('1'))
+        results = st.add_many(policies)
+        assert [None, None, None, None] == [results[i] for i in (0, 1, 3, 4)]
+        assert isinstance(results[2], PolicyExistsError)
+        assert isinstance(results[5], PolicyExistsError)
+        assert 2 == len(calls)
+        assert ['0', '1', '2', '3', '4'] == sorted(p.uid for p in st.get_all(0, 0))
+        inquiry = Inquiry(subject='max', action='get', resource='books')
+        assert 4 == len(list(st.find_for_inquiry(inquiry, RegexChecker())))
+        assert [] == st.add_many([])
+        assert 2 == len(calls)
+
+    def test_update_many_and_delete_many(self, st):
+        st.add_many([Policy(str(i), subjects=['max'], actions=['get'], resources=['books']) for i in range(3)])
+        calls = []
+        st.on_change(lambda: calls.append(1))
+        assert [None, None] == st.update_many([Policy('1', subjects=['nina']), Policy('4', subjects=['max'])])
+        assert 1 == len(calls)
+        assert ['nina'] == st.get('1').subjects
+        assert None is st.get('4')
+        inquiry = Inquiry(subject='max', action='get', resource='books')
+        assert ['0', '2'] == sorted(p.uid for p in st.find_for_inquiry(inquiry, RegexChecker()))
+        assert [None, None] == st.delete_many(iter(['2', '5']))
+        assert 2 == len(calls)
+        assert ['0', '1'] == sorted(p.uid for p in st.get_all(0, 0))
+
     def test_find_for_inquiry_with_rules_checker(self, st):
         assertions = unittest.TestCase('__init__')
         st.add(Policy(1, subjects=[{'name': Equal('Max')}], actions=[{'foo': Equal('bar')}]))
@@ -279,6 +358,16 @@ class TestMongoStorage:
         assert 3 == len(found)
         assertions.assertListEqual([1, 2, 5], list(map(operator.attrgetter('uid'), found)))
 
+    def test_find_for_inquiry_by_effect(self, st):
+        st.add(Policy('1', subjects=['max'], actions=['get'], resources=['<.*>'], effect=ALLOW_ACCESS))
+        st.add(Policy('2', subjects=['<.*>'], actions=['get'], resources=['books'], effect=DENY_ACCESS))
+        st.add(Policy('3', subjects=['nina'], actions=['get'], resources=['books'], effect=DENY_ACCESS))
+        inquiry = Inquiry(subject='max', action='get', resource='books')
+        assert st.partitioned_by_effect
+        assert ['1'] == [p.uid for p in st.find_for_inquiry_by_effect(inquiry, ALLOW_ACCESS, RegexChecker())]
+        assert ['2'] == [p.uid for p in st.find_for_inquiry_by_effect(inquiry, DENY_ACCESS, RegexChecker())]
+        assert ['2', '3'] == sorted(p.uid for p in st.find_for_inquiry_by_effect(inquiry, DENY_ACCESS))
+
     def test_find_for_inquiry_with_unknown_checker(self, st):
         st.add(Policy('1'))
         inquiry = Inquiry(subject='sam', action='get', resource='books')
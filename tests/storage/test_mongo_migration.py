@@ -33,9 +33,9 @@ class TestMongoMigrationSet:
     def test_up_and_down(self, migration_set):
         migration_set.save_applied_number(0)
         migration_set.up()
-        assert 3 == migration_set.last_applied()
+        assert 4 == migration_set.last_applied()
         migration_set.up()
-        assert 3 == migration_set.last_applied()
+        assert 4 == migration_set.last_applied()
         migration_set.down()
         assert 0 == migration_set.last_applied()
         migration_set.down()
@@ -276,7 +276,7 @@ class TestMigration1x1x0To1x1x1:
         # set logger for capturing output
         l = logging.getLogger('vakt.storage.mongo')
         log_handler = self.MockLoggingHandler()
-        l.setLevel(logging.INFO)
+        l.setLevel(logging.DEBUG)
         l.addHandler(log_handler)
 
         migration.down()
@@ -294,9 +294,12 @@ class TestMigration1x1x0To1x1x1:
         # test failed policies report
         # info
         assert 'info' in log_handler.messages
-        assert 9 == len(log_handler.messages['info'])
-        assert 'Trying to migrate Policy with UID: 5' in log_handler.messages['info']
-        assert 'Policy with UID: 5 was migrated' in log_handler.messages['info']
+        assert 1 == len(log_handler.messages['info'])
+        assert 'Processed a batch of 6 Policies' in log_handler.messages['info'][0]
+        # debug
+        assert 9 == len(log_handler.messages['debug'])
+        assert 'Trying to migrate Policy with UID: 5' in log_handler.messages['debug']
+        assert 'Policy with UID: 5 was migrated' in log_handler.messages['debug']
         # warn
         assert 'warning' in log_handler.messages
         assert 2 == len(log_handler.messages['warning'])
@@ -423,7 +426,7 @@ class TestMigration1x1x1To1x2x0:
         # set logger for capturing output
         l = logging.getLogger('vakt.storage.mongo')
         log_handler = self.MockLoggingHandler()
-        l.setLevel(logging.INFO)
+        l.setLevel(logging.DEBUG)
         l.addHandler(log_handler)
 
         migration.up()
@@ -446,7 +449,8 @@ class TestMigration1x1x1To1x2x0:
         inq = Inquiry(action='foo', resource='bar', subject='Max', context={'val': 'foo', 'num': '123'})
         assert len(docs) == len(list(storage.find_for_inquiry(inq, RegexChecker())))
         # test failed policies report
-        assert 10 == len(log_handler.messages.get('info', []))
+        assert 1 == len(log_handler.messages.get('info', []))
+        assert 10 == len(log_handler.messages.get('debug', []))
         assert 0 == len(log_handler.messages.get('warning', []))
         assert 0 == len(log_handler.messages.get('error', []))
 
@@ -506,7 +510,7 @@ class TestMigration1x1x1To1x2x0:
         # set logger for capturing output
         l = logging.getLogger('vakt.storage.mongo')
         log_handler = self.MockLoggingHandler()
-        l.setLevel(logging.INFO)
+        l.setLevel(logging.DEBUG)
         l.addHandler(log_handler)
 
         migration.down()
@@ -527,10 +531,12 @@ class TestMigration1x1x1To1x2x0:
         # test failed policies report
         # info
         assert 'info' in log_handler.messages
-        assert 5 == len(log_handler.messages.get('info', []))
-        assert 'Trying to migrate Policy with UID: 10' in log_handler.messages['info']
-        assert 'Trying to migrate Policy with UID: 40' in log_handler.messages['info']
-        assert 'Policy with UID: 10 was migrated' in log_handler.messages['info']
+        assert 1 == len(log_handler.messages.get('info', []))
+        # debug
+        assert 5 == len(log_handler.messages.get('debug', []))
+        assert 'Trying to migrate Policy with UID: 10' in log_handler.messages['debug']
+        assert 'Trying to migrate Policy with UID: 40' in log_handler.messages['debug']
+        assert 'Policy with UID: 10 was migrated' in log_handler.messages['debug']
         # warn
         assert 'warning' in log_handler.messages
         assert 3 == len(log_handler.messages['warning'])
@@ -549,3 +555,131 @@ class TestMigration1x1x1To1x2x0:
         assert 'Migration was unable to convert some Policies, but' in log_handler.messages['error'][0]
         assert 'Mongo IDs of failed Policies are:' in log_handler.messages['error'][0]
         assert "[20, 30, 40]" in log_handler.messages['error'][0]
+
+
+@pytest.mark.integration
+class TestMigration1x2x1To1x3x0:
+
+    @pytest.fixture()
+    def storage(self):
+        client = create_client()
+        storage = MongoStorage(client, DB_NAME, collection=COLLECTION)
+        yield storage
+        client[DB_NAME][COLLECTION].delete_many({})
+        client.close()
+
+    def test_order(self, storage):
+        migration = Migration1x2x1To1x3x0(storage)
+        assert 4 == migration.order
+
+    def test_up(self, storage):
+        migration = Migration1x2x1To1x3x0(storage)
+        # prepare docs that might have been saved by users in v 1.2.1
+        docs = [
+            """
+            { "_id" : 10, "actions" : [ "get", "<get|list>" ], "context" : { }, "description" : null,
+            "effect" : "allow", "resources" : [ "library:<.+>" ], "subjects" : [ "<[Mm]ax>", "nina" ],
+            "type": 1, "uid" : 10 }
+            """,
+            """
+            { "_id" : 20, "actions" : [ ], "context" : { }, "description" : null, "effect" : "allow",
+            "resources" : [ ], "subjects" : [ {"py/object": "vakt.rules.operator.Eq", "val": "Max" } ],
+            "type": 2, "uid" : 20 }
+            """,
+        ]
+        for doc in docs:
+            storage.collection.insert_one(b_json.loads(doc))
+        migration.up()
+        created_indices = [i['name'] for i in storage.collection.list_indexes()]
+        assert created_indices == ['_id_', 'prefixes_actions_idx', 'prefixes_subjects_idx', 'prefixes_resources_idx',
+                                   'effect_idx']
+        assert {
+            'actions': ['=get', '^'],
+            'subjects': ['=nina', '^'],
+            'resources': ['^library:'],
+        } == storage.collection.find_one({'_id': 10})['prefixes']
+        assert {
+            'actions': [],
+            'subjects': [],
+            'resources': [],
+        } == storage.collection.find_one({'_id': 20})['prefixes']
+        inquiry = Inquiry(action='get', resource='library:books', subject='Max')
+        assert [10] == [p.uid for p in storage.find_for_inquiry(inquiry, RegexChecker())]
+        inquiry = Inquiry(action='get', resource='office:books', subject='Max')
+        assert [] == list(storage.find_for_inquiry(inquiry, RegexChecker()))
+
+    def test_down(self, storage):
+        migration = Migration1x2x1To1x3x0(storage)
+        migration.up()
+        storage.add(Policy(10, actions=['get'], resources=['library:<.+>'], subjects=['max']))
+        migration.down()
+        assert ['_id_'] == [i['name'] for i in storage.collection.list_indexes()]
+        assert 'prefixes' not in storage.collection.find_one({'_id': 10})
+        assert 10 == storage.get(10).uid
+
+
+class CountingMigration(MongoMigration):
+    """Migration that counts how many times each doc was processed"""
+
+    def __init__(self, storage, fail_on=None):
+        self.storage = storage
+        self.fail_on = fail_on
+
+    @property
+    def order(self):
+        return 100
+
+    def up(self):
+        def process(doc):
+            if doc['uid'] == self.fail_on:
+                self.fail_on = None
+                raise KeyboardInterrupt
+            doc['count'] = doc.get('count', 0) + 1
+            return doc
+        self._each_doc(processor=process)
+
+    def down(self):
+        pass
+
+
+@pytest.mark.integration
+class TestMongoMigration:
+
+    @pytest.fixture()
+    def storage(self):
+        client = create_client()
+        storage = MongoStorage(client, DB_NAME, collection=COLLECTION)
+        yield storage
+        client[DB_NAME][COLLECTION].delete_many({})
+        client[DB_NAME][DEFAULT_CHECKPOINT_COLLECTION].delete_many({})
+        client.close()
+
+    @pytest.fixture()
+    def uids(self, storage):
+        uids = [1, 2, 3, 4, 5, 'a', 'b', 'c']
+        storage.collection.insert_many([{'_id': uid, 'uid': uid} for uid in uids])
+        return uids
+
+    def counts(self, storage):
+        return {doc['_id']: doc.get('count', 0) for doc in storage.collection.find()}
+
+    @pytest.mark.parametrize('fail_on', [4, 'b', 'c'])
+    def test_interrupted_migration_is_resumed(self, storage, uids, fail_on):
+        migration = CountingMigration(storage, fail_on=fail_on)
+        migration.batch_size = 2
+        with pytest.raises(KeyboardInterrupt):
+            migration.up()
+        assert 0 == self.counts(storage)[fail_on]
+        migration.up()
+        assert {uid: 1 for uid in uids} == self.counts(storage)
+        # checkpoint is removed after migration is finished
+        assert 0 == storage.database[DEFAULT_CHECKPOINT_COLLECTION].count_documents({})
+        migration.up()
+        assert {uid: 2 for uid in uids} == self.counts(storage)
+
+    def test_migration_in_processes(self, storage, uids):
+        migration = CountingMigration(storage)
+        migration.batch_size = 3
+        migration.processes = 2
+        migration.up()
+        assert {uid: 1 for uid in uids} == self.counts(storage)
@@ -0,0 +1,96 @@
+import logging
+import threading
+
+import pytest
+
+from vakt.audit import DecisionLog, DecisionRecord
+from vakt.guard import Inquiry
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+        self.decisions = []
+
+    def emit(self, record):
+        self.messages.append(self.format(record))
+        self.decisions.append(record.decision)
+
+
+def test_decision_record():
+    r = DecisionRecord(1.5, Inquiry(subject='Max', action='get'), True)
+    assert {
+        'time': 1.5, 'answer': True,
+        'inquiry': {'subject': 'Max', 'action': 'get', 'resource': '', 'context': {}},
+    } == r.to_dict()
+    assert str(r).startswith('Incoming Inquiry was allowed. Inquiry: ')
+    assert str(r._replace(answer=False)).startswith('Incoming Inquiry was rejected. Inquiry: ')
+
+
+def test_sampling_and_ring_buffer():
+    d = DecisionLog(sample_every=3, buffer_size=2)
+    for i in range(9):
+        d.record(Inquiry(subject=str(i)), i % 2 == 0)
+    assert [('5', False), ('8', True)] == [(r.inquiry.subject, r.answer) for r in d.records()]
+    d.stop()
+
+
+def test_records_are_formatted_by_handlers_in_background():
+    formatted = []
+
+    class Tracking(Inquiry):
+        def __str__(self):
+            formatted.append(self.subject)
+            return super().__str__()
+    handler = ListHandler()
+    d = DecisionLog(handlers=[handler])
+    d.record(Tracking(subject='Max'), True)
+    d.record(Tracking(subject='Nina'), False)
+    d.stop()
+    d.stop()
+    assert ['Max', 'Nina'] == formatted
+    assert 2 == len(handler.messages)
+    assert handler.messages[0].startswith('Incoming Inquiry was allowed. Inquiry: ')
+    assert d.records() == handler.decisions
+    d.record(Inquiry(), True)
+    assert 2 == len(handler.messages)
+    assert 3 == len(d.records())
+
+
+def test_records_are_dropped_if_queue_is_full():
+    release = threading.Event()
+
+    class SlowHandler(ListHandler):
+        def emit(self, record):
+            release.wait(5)
+            super().emit(record)
+    handler = SlowHandler()
+    d = DecisionLog(handlers=[handler], queue_size=2)
+    for i in range(10):
+        d.record(Inquiry(subject=str(i)), True)
+    release.set()
+    d.stop()
+    assert 10 == len(d.records())
+    assert 10 == len(handler.decisions) + d.dropped
+    assert 7 <= d.dropped
+
+
+def test_handler_levels_are_respected():
+    info, warning = ListHandler(), ListHandler()
+    warning.setLevel(logging.WARNING)
+    d = DecisionLog(handlers=[info, warning])
+    d.record(Inquiry(), True)
+    d.stop()
+    assert 1 == len(info.decisions)
+    assert 0 == len(warning.decisions)
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'sample_every': 0},
+    {'sample_every': -1},
+    {'queue_size': 0},
+])
+def test_incorrect_arguments(kwargs):
+    with pytest.raises(ValueError):
+        DecisionLog(**kwargs)
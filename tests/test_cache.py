@@ -0,0 +1,115 @@
+import time
+
+import pytest
+
+from vakt.cache import DecisionCache, PatternCache
+from vakt.exceptions import InvalidPatternError
+
+
+def test_get_and_set():
+    c = DecisionCache()
+    assert None is c.get('a')
+    c.set('a', True)
+    c.set('b', False)
+    assert c.get('a') is True
+    assert c.get('b') is False
+    assert 2 == c.hits
+    assert 1 == c.misses
+    assert 2 == len(c)
+
+
+def test_lru_eviction():
+    c = DecisionCache(maxsize=2)
+    c.set('a', True)
+    c.set('b', True)
+    c.get('a')
+    c.set('c', True)
+    assert 2 == len(c)
+    assert c.get('a')
+    assert c.get('c')
+    assert None is c.get('b')
+
+
+def test_ttl():
+    c = DecisionCache(ttl=0.05)
+    c.set('a', True)
+    assert c.get('a')
+    time.sleep(0.06)
+    assert None is c.get('a')
+    assert 0 == len(c)
+
+
+def test_clear():
+    c = DecisionCache()
+    c.set('a', True)
+    generation = c.generation
+    c.clear()
+    assert 0 == len(c)
+    assert None is c.get('a')
+    c.set('a', True, generation)
+    assert None is c.get('a')
+    c.set('a', True, c.generation)
+    assert c.get('a')
+
+
+@pytest.mark.parametrize('size, ttl', [
+    (0, None),
+    (-1, None),
+    (10, 0),
+    (10, -5),
+])
+def test_incorrect_arguments(size, ttl):
+    with pytest.raises(ValueError):
+        DecisionCache(size, ttl)
+
+
+def test_pattern_cache_compile():
+    c = PatternCache(maxsize=2)
+    p = c.compile('<[0-9]+>', '<', '>')
+    assert p.match('123')
+    assert p is c.compile('<[0-9]+>', '<', '>')
+    assert 1 == c.hits
+    assert 1 == c.misses
+    with pytest.raises(InvalidPatternError):
+        c.compile('<foo', '<', '>')
+    assert 1 == len(c)
+
+
+def test_pattern_cache_lru_eviction_and_pinning():
+    c = PatternCache(maxsize=2)
+    pinned = c.pin('<a+>', '<', '>')
+    c.compile('<b+>', '<', '>')
+    c.compile('<c+>', '<', '>')
+    c.compile('<b+>', '<', '>')
+    c.compile('<d+>', '<', '>')
+    assert 3 == len(c)
+    misses = c.misses
+    assert pinned is c.compile('<a+>', '<', '>')
+    c.compile('<b+>', '<', '>')
+    assert misses == c.misses
+    c.compile('<c+>', '<', '>')
+    assert misses + 1 == c.misses
+    c.clear()
+    assert 1 == len(c)
+    assert pinned is c.compile('<a+>', '<', '>')
+    c.unpin('<a+>', '<', '>')
+    c.unpin('<a+>', '<', '>')
+    c.compile('<b+>', '<', '>')
+    c.compile('<c+>', '<', '>')
+    assert 2 == len(c)
+    misses = c.misses
+    c.compile('<a+>', '<', '>')
+    assert misses + 1 == c.misses
+
+
+def test_pattern_cache_unlimited():
+    c = PatternCache(maxsize=None)
+    for i in range(100):
+        c.compile('<%d+>' % i, '<', '>')
+    assert 100 == len(c)
+
+
+@pytest.mark.parametrize('size', [0, -1])
+def test_pattern_cache_incorrect_size(size):
+    with pytest.raises(ValueError):
+        PatternCache(size)
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+import jsonpickle
+
+from vakt import codec
+from vakt.policy import Policy
+from vakt.effects import ALLOW_ACCESS
+from vakt.rules.base import Rule
+from vakt.rules.net import CIDR
+from vakt.rules.operator import Eq, Greater, Less
+from vakt.rules.logic import And, Or, Not, Any
+from vakt.rules.list import In, AnyIn
+from vakt.rules.string import Equal, RegexMatch, PairsEqual
+
+
+class Custom(Rule):
+    def __init__(self, value):
+        self.value = value
+
+    def satisfied(self, what, inquiry=None):
+        return what == self.value
+
+
+def rules_policy():
+    return Policy(
+        uid='1',
+        effect=ALLOW_ACCESS,
+        subjects=[{'name': Or(Eq('Max'), Equal('Nina', ci=True)), 'stars': And(Greater(1), Less(100))}],
+        actions=[Any(), {'method': AnyIn('get', 'post')}],
+        resources=[{'path': Not(In('a', 'b')), 'owner': Custom({'id': [1, 2]})}, PairsEqual()],
+        context={'ip': CIDR('127.0.0.1/32')},
+        description='Привет',
+    )
+
+
+def strings_policy():
+    return Policy(uid=2, subjects=('<[Mm]ax>', 'Nina'), actions=['get'], resources=['books:<.+>'])
+
+
+@pytest.mark.parametrize('obj', [
+    rules_policy()._data(),
+    strings_policy()._data(),
+    Eq(1),
+    And(Greater(1), Less(3)),
+    In(1, 2, 3),
+    Custom((1, 'a', None, 1.5, True)),
+    {'a': [1, (2, 3), {4}]},
+    [1, 'a', None],
+    'foo',
+])
+def test_encode_is_the_same_as_jsonpickle(obj):
+    assert jsonpickle.Pickler().flatten(obj) == codec.encode(obj)
+
+
+@pytest.mark.parametrize('obj', [
+    rules_policy()._data(),
+    strings_policy()._data(),
+    Custom(Eq(1)),
+    {'a': [1, (2, 3), {4}]},
+])
+def test_decode_jsonpickle_data(obj):
+    data = json.loads(jsonpickle.encode(obj))
+    decoded = codec.decode(data)
+    assert type(jsonpickle.decode(json.dumps(data))) == type(decoded)
+    assert data == jsonpickle.Pickler().flatten(decoded)
+
+
+def test_decoded_policy_makes_the_same_decisions():
+    policy = Policy.from_dict(codec.decode(json.loads(rules_policy().to_json())))
+    assert isinstance(policy.subjects[0]['stars'], And)
+    assert policy.subjects[0]['stars'].satisfied(50)
+    assert not policy.subjects[0]['stars'].satisfied(500)
+    assert policy.resources[0]['owner'].satisfied({'id': [1, 2]})
+    assert policy.context['ip'].satisfied('127.0.0.1')
+    assert not policy.context['ip'].satisfied('127.0.0.2')
+    assert 'Привет' == policy.description
+
+
+def test_data_that_codec_does_not_support_is_handled_by_jsonpickle():
+    rule = Eq(1)
+    shared = {'a': rule, 'b': [rule]}
+    data = codec.encode(shared)
+    assert jsonpickle.Pickler().flatten(shared) == data
+    decoded = codec.decode(data)
+    assert decoded['a'] is decoded['b'][0]
+    regex = RegexMatch('fo+')
+    decoded = codec.decode(codec.encode(regex))
+    assert decoded.satisfied('foo')
+    assert {'py/object': 'foo.Bar', 'x': 1} == codec.decode({'py/object': 'foo.Bar', 'x': 1})
+
+
+def test_register():
+    name = '%s.%s' % (Custom.__module__, Custom.__name__)
+    assert isinstance(codec.decode({'py/object': name, 'value': 1}), Custom)
+    assert Custom is codec.register(Custom)
+    with pytest.raises(TypeError):
+        codec.register(dict)
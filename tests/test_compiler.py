@@ -0,0 +1,116 @@
+import pytest
+
+from vakt.compiler import CompiledPolicy, compile_policy, Selectivity
+from vakt.checker import RegexChecker, RulesChecker, StringExactChecker, StringFuzzyChecker
+from vakt.policy import Policy
+from vakt.guard import Inquiry, Guard
+from vakt.effects import ALLOW_ACCESS
+from vakt.rules.operator import Eq, Greater
+from vakt.rules.list import In
+from vakt.rules.logic import Any, Not
+from vakt.rules.string import Equal, RegexMatch
+from vakt.rules.inquiry import SubjectEqual
+
+
+POLICIES = [
+    Policy('1'),
+    Policy('2', subjects=['max', '<[mM]ax>', 'nina'], actions=['get'], resources=['<.*>', 'books:<\\d+>']),
+    Policy('3', subjects=['<get', 'max'], actions=['<[>', 'get'], resources=['books', '<b.*>', '<<x>']),
+    Policy('4', subjects=['max', '<(?i)max>'], actions=['get', ''], resources=['', 'books']),
+    Policy('5', subjects=['<max>', 'ni'], actions=['<get>', 'et'], resources=['books:1', 'oks']),
+    Policy('6', subjects=[Eq('max'), {'name': Eq('max'), 'stars': Greater(5)}, {}], actions=[Any()]),
+    Policy('7', subjects=[{'name': Not(Eq('max'))}, {'name': RegexMatch('ni.*')}], resources=[Eq('books')]),
+    Policy('8', subjects=[{'stars': Greater(5)}], resources=[Equal('books')]),
+]
+
+VALUES = ['max', 'Max', 'nina', 'ni', 'get', 'et', 'books', 'books:1', 'oks', '', 5, None, [1],
+          {'name': 'max'}, {'name': 'max', 'stars': 10}, {'name': 'nina'}, {'stars': 'x'}, {'stars': 1}]
+
+
+def _result(func, *args):
+    try:
+        return func(*args)
+    except Exception as e:
+        return type(e)
+
+
+@pytest.mark.parametrize('checker', [
+    RegexChecker(),
+    RulesChecker(),
+    StringExactChecker(),
+    StringFuzzyChecker(),
+])
+@pytest.mark.parametrize('policy', POLICIES)
+@pytest.mark.parametrize('field', ['subjects', 'actions', 'resources', 'non_existing_field'])
+def test_matcher_is_the_same_as_fits(checker, policy, field):
+    matcher = checker.matcher(policy, field)
+    for what in VALUES:
+        assert _result(checker.fits, policy, field, what) == _result(matcher, what)
+
+
+def test_matcher_of_checker_with_custom_fits():
+    class CustomChecker(RegexChecker):
+        def fits(self, policy, field, what):
+            return what == 'custom'
+    matcher = CustomChecker().matcher(POLICIES[1], 'subjects')
+    assert matcher('custom')
+    assert not matcher('max')
+
+
+def test_compiled_policy():
+    p = Policy('1', subjects=['max'], actions=['<get|list>'], resources=['books'], effect=ALLOW_ACCESS,
+               context={'user': SubjectEqual(), 'ip': Equal('127.0.0.1')})
+    checker = RegexChecker()
+    cp = compile_policy(p, checker)
+    assert isinstance(cp, CompiledPolicy)
+    assert cp.policy is p
+    assert cp.checker is checker
+    assert cp.allow
+    assert cp.fits(Inquiry(subject='max', action='list', resource='books', context={'user': 'max', 'ip': '127.0.0.1'}))
+    assert not cp.fits(Inquiry(subject='max', action='put', resource='books', context={'user': 'max', 'ip': '127.0.0.1'}))
+    assert not cp.fits(Inquiry(subject='max', action='get', resource='books', context={'user': 'max'}))
+    assert not cp.fits(Inquiry(subject='max', action='get', resource='books', context={'user': 'x', 'ip': '127.0.0.1'}))
+    with pytest.raises(AttributeError):
+        cp.allow = False
+    with pytest.raises(AttributeError):
+        cp.foo = 1
+
+
+def test_compiled_context_is_the_same_as_guard_check():
+    p = Policy('1', context={'user': SubjectEqual(), 'stars': Greater(5)})
+    cp = compile_policy(p, RegexChecker())
+    for ctx in [{}, {'user': 'max'}, {'user': 'max', 'stars': 6}, {'user': 'nina', 'stars': 6}, {'user': 'max', 'stars': 'x'}]:
+        inquiry = Inquiry(subject='max', context=ctx)
+        assert _result(Guard.check_context_restriction, p, inquiry) == _result(cp.context_satisfied, inquiry)
+
+
+@pytest.mark.parametrize('policy, order, expect', [
+    (Policy('1', subjects=['max'], actions=['get'], resources=['books']), None, ['action', 'subject', 'resource']),
+    (Policy('1', subjects=['max'], actions=['get'], resources=['books']), ['resources', 'subjects', 'actions'],
+     ['resource', 'subject', 'action']),
+    (Policy('1', subjects=['max'], actions=['<get|list>'], resources=['books']), None, ['subject', 'resource', 'action']),
+    (Policy('1', subjects=['max'], actions=['<get|list>'], resources=['<.*>']), ['resources', 'actions'],
+     ['subject', 'resource', 'action']),
+    (Policy('1', subjects=[{'name': Eq('max')}], actions=[Any()], resources=[In('a', 'b')]), None,
+     ['subject', 'resource', 'action']),
+])
+def test_compiled_policy_checks_cheap_fields_first(policy, order, expect):
+    cp = compile_policy(policy, RegexChecker()) if order is None else compile_policy(policy, RegexChecker(), order)
+    assert expect == [attr for attr, _ in cp.checks]
+
+
+def test_selectivity():
+    s = Selectivity(sample_every=2, reorder_every=2)
+    assert ('actions', 'subjects', 'resources') == s.order
+    assert [False, True, False, True] == [s.sample() for _ in range(4)]
+    checker = RegexChecker()
+    compiled = [compile_policy(Policy(str(i), subjects=['max'], actions=['get'], resources=['<b.*>']), checker)
+                for i in range(2)]
+    assert not s.observe(Inquiry(subject='nina', action='get', resource='comics'), compiled)
+    assert s.observe(Inquiry(subject='nina', action='get', resource='books'), compiled)
+    assert ('subjects', 'resources', 'actions') == s.order
+    assert {'subjects': 4, 'actions': 0, 'resources': 2} == s.rejects
+    # broken policies are skipped
+    broken = compile_policy(Policy('x', subjects=['<[>'], actions=['get']), checker)
+    s.observe(Inquiry(subject='nina', action='list'), [broken])
+    assert {'subjects': 4, 'actions': 1, 'resources': 3} == s.rejects
@@ -0,0 +1,34 @@
+from vakt.metrics import DecisionStats, Histogram, MetricsCollector
+from vakt.guard import Inquiry
+
+
+def test_decision_stats_derived_times():
+    stats = DecisionStats(Inquiry())
+    stats.fetch_time, stats.context_time, stats.total_time = 0.5, 0.25, 1.0
+    assert 0.5 == stats.check_time
+    assert 0.25 == stats.filter_time
+
+
+def test_histogram():
+    h = Histogram(bounds=(1, 10))
+    for value in [0, 1, 2, 10, 11, 100]:
+        h.observe(value)
+    assert [2, 2, 2] == h.counts
+    assert {'buckets': [(1, 2), (10, 4), (float('inf'), 6)], 'sum': 124, 'count': 6} == h.snapshot()
+
+
+def test_metrics_collector():
+    c = MetricsCollector(time_bounds=(0.1, 1), count_bounds=(1, 10))
+    for answer, cached, candidates in [(True, None, 3), (False, True, 0), (False, False, 20)]:
+        stats = DecisionStats(Inquiry())
+        stats.answer, stats.cached, stats.candidates = answer, cached, candidates
+        stats.fetch_time, stats.total_time = 0.5, 2.0
+        c.on_decision(stats)
+    snapshot = c.snapshot()
+    assert {
+        'decisions': 3, 'allowed': 1, 'denied': 2, 'candidates': 23, 'checked': 0, 'matched': 0,
+        'cache_hits': 1, 'cache_misses': 1, 'exceptions': 0,
+    } == snapshot['counters']
+    assert [(0.1, 0), (1, 3), (float('inf'), 3)] == snapshot['timings']['fetch']['buckets']
+    assert [(0.1, 0), (1, 0), (float('inf'), 3)] == snapshot['timings']['filter']['buckets']
+    assert [(1, 1), (10, 2), (float('inf'), 3)] == snapshot['candidates']['buckets']
@@ -1,6 +1,6 @@
 import pytest
 
-from vakt.parser import compile_regex
+from vakt.parser import compile_regex, get_literal_prefix
 from vakt.exceptions import InvalidPatternError
 
 
@@ -53,3 +53,20 @@ def test_compile_regex_output_matches_correctly(phrase, start, end, match_agains
         assert result.match(match_against)
     else:
         assert not result.match(match_against)
+
+
+@pytest.mark.parametrize('phrase, start, end, output', [
+    ('library:books:<.+>', '<', '>', 'library:books:'),
+    ('library:books:<.+>:<\\d+>', '<', '>', 'library:books:'),
+    ('<.+>:books', '<', '>', ''),
+    ('books', '<', '>', 'books'),
+    ('', '<', '>', ''),
+    ('a-[[abc]+]-b', '[', ']', 'a-'),
+])
+def test_get_literal_prefix(phrase, start, end, output):
+    assert output == get_literal_prefix(phrase, start, end)
+
+
+def test_get_literal_prefix_fails_on_unbalanced_pattern():
+    with pytest.raises(InvalidPatternError):
+        get_literal_prefix('foo:<bar', '<', '>')
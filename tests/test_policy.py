@@ -276,3 +276,33 @@ def test_policy_field_type_check(args, msg):
     with pytest.raises(PolicyCreationError) as excinfo:
         Policy(1, **args)
     assert msg in str(excinfo.value)
+
+
+def test_from_dict():
+    data = {
+        'uid': '1',
+        'type': TYPE_RULE_BASED,
+        'subjects': ['<[Mm]ax>'],
+        'actions': ['get'],
+        'rules': {'ip': CIDR('127.0.0.1')},
+    }
+    p = Policy.from_dict(data)
+    assert '1' == p.uid
+    assert ['<[Mm]ax>'] == p.subjects
+    assert TYPE_STRING_BASED == p.type
+    assert isinstance(p.context['ip'], CIDR)
+    assert 'rules' in data and 'type' in data
+
+
+def test_from_dict_not_create_policy_without_uid():
+    with pytest.raises(PolicyCreationError) as excinfo:
+        Policy.from_dict({'subjects': ['foo']})
+    assert "'uid'" in str(excinfo.value)
+
+
+def test_from_dicts():
+    policies = Policy.from_dicts([{'uid': 1}, {'uid': 2, 'effect': ALLOW_ACCESS}, {}])
+    assert 1 == next(policies).uid
+    assert next(policies).allow_access()
+    with pytest.raises(PolicyCreationError):
+        next(policies)
@@ -1,4 +1,6 @@
-from vakt.util import JsonSerializer
+import pytest
+
+from vakt.util import JsonSerializer, make_hashable
 
 
 class AB(JsonSerializer):
@@ -22,3 +24,24 @@ def test_json_serializer_from_json():
     cd = CD.from_json(js)
     assert isinstance(cd, dict)
     assert cd == {'x': 1}
+
+
+@pytest.mark.parametrize('a, b, equal', [
+    ('a', 'a', True),
+    ('1', 1, False),
+    (1, True, False),
+    ([1, 2], [1, 2], True),
+    ([1, 2], (1, 2), False),
+    ({'a': [1, {'b': {2, 3}}]}, {'a': [1, {'b': {3, 2}}]}, True),
+    ({'a': [1]}, {'a': [2]}, False),
+    ({'a': 1, 'b': 2}, {'b': 2, 'a': 1}, True),
+])
+def test_make_hashable(a, b, equal):
+    assert equal == (make_hashable(a) == make_hashable(b))
+    if equal:
+        assert hash(make_hashable(a)) == hash(make_hashable(b))
+
+
+def test_make_hashable_fails_for_unhashable_data():
+    with pytest.raises(TypeError):
+        make_hashable([bytearray(b'abc')])
@@ -15,6 +15,7 @@ from .policy import Policy
 from .guard import (
     Inquiry,
     Guard,
+    CachingGuard,
 )
 
 from .effects import (
@@ -31,6 +32,8 @@ from .checker import (
 
 from . import rules
 
+from . import codec
+
 from .storage.memory import MemoryStorage
 
 
@@ -0,0 +1,11 @@
+"""
+Asyncio versions of Guard and Storages.
+Requires Python 3.5+.
+"""
+
+from .guard import AsyncGuard
+
+from .storage import (
+    AsyncStorage,
+    AsyncMemoryStorage,
+)
@@ -0,0 +1,84 @@
+"""
+Guard for asyncio applications.
+"""
+
+import asyncio
+import logging
+from timeit import default_timer
+
+from ..guard import BaseGuard, _account_fetch
+
+
+log = logging.getLogger(__name__)
+
+
+class AsyncGuard(BaseGuard):
+    """
+    Executor of policy checks for asyncio applications.
+    Works with an AsyncStorage: `is_allowed` and `is_allowed_many` are coroutines that don't block the event loop
+    while policies are fetched. Policies are checked right in the event loop, since checks don't do any I/O.
+    Makes the same decisions as `vakt.Guard` does.
+    """
+
+    async def is_allowed(self, inquiry):
+        """Is given inquiry intent allowed or not?"""
+        return await self._decide(inquiry, self._find_for_inquiry)
+
+    async def is_allowed_many(self, inquiries):
+        """
+        Are given inquiries intents allowed or not?
+        Returns a list of answers in the same order as inquiries were given.
+        Storage is queried only once for all inquiries that have the same subject, action, resource and context.
+        Queries for different inquiries are run concurrently.
+        """
+        fetched = {}
+
+        async def find_for_inquiry(inquiry, checker, effect=None):
+            key = self._batch_key(inquiry, effect)
+            if key is None:
+                return await self._find_for_inquiry(inquiry, checker, effect)
+            if key not in fetched:
+                fetched[key] = asyncio.ensure_future(self._find_for_inquiry(inquiry, checker, effect))
+            return await fetched[key]
+
+        return list(await asyncio.gather(*[self._decide(inquiry, find_for_inquiry) for inquiry in inquiries]))
+
+    async def _find_for_inquiry(self, inquiry, checker, effect=None):
+        """Get policies for inquiry from the storage: only the ones of a given effect if it's given"""
+        if effect is None:
+            return await self.storage.find_for_inquiry(inquiry, checker)
+        return await self.storage.find_for_inquiry_by_effect(inquiry, effect, checker)
+
+    async def _check(self, inquiry, find_for_inquiry):
+        """Check inquiry against policies returned by a given find coroutine function. May raise exceptions"""
+        steps = self._check_steps(inquiry, getattr(find_for_inquiry, 'stats', None))
+        done, result = self._step(steps, None)
+        while not done:
+            done, result = self._step(steps, await find_for_inquiry(inquiry, self.checker, result))
+        return result
+
+    async def _decide(self, inquiry, find_for_inquiry):
+        """Make a decision for inquiry based on policies returned by a given find coroutine function"""
+        stats = self._start_decision(inquiry)
+        if stats is not None:
+            find_for_inquiry = _AsyncObservedFind(find_for_inquiry, stats)
+        try:
+            answer = await self._check(inquiry, find_for_inquiry)
+        except Exception as e:
+            answer = self._fail_decision(inquiry, e, stats)
+        return self._finish_decision(inquiry, answer, stats)
+
+
+class _AsyncObservedFind:
+    """Find coroutine function that accounts time spent fetching policies and their number in DecisionStats"""
+
+    __slots__ = ('find', 'stats')
+
+    def __init__(self, find, stats):
+        self.find = find
+        self.stats = stats
+
+    async def __call__(self, inquiry, checker, effect=None):
+        start = default_timer()
+        policies = await self.find(inquiry, checker, effect)
+        return _account_fetch(self.stats, policies, start)
@@ -0,0 +1,89 @@
+"""
+MongoDB Storage for Policies used in asyncio applications.
+"""
+
+import logging
+
+from pymongo.errors import DuplicateKeyError, BulkWriteError
+
+from ..aio.storage import AsyncStorage
+from ..storage.mongo import MongoPolicies
+
+
+log = logging.getLogger(__name__)
+
+
+class AsyncMongoStorage(MongoPolicies, AsyncStorage):
+    """
+    Stores all policies in MongoDB via asyncio driver Motor:
+    `client` should be a `motor.motor_asyncio.AsyncIOMotorClient`.
+    Policies are stored the same way MongoStorage stores them, so both storages can work with the same collection
+    and MongoMigrationSet of MongoStorage is used for its migrations.
+    See `MongoPolicies` for the description of arguments.
+    """
+
+    async def add(self, policy):
+        try:
+            await self.collection.insert_one(self._prepare_doc(policy))
+        except DuplicateKeyError:
+            raise self._policy_exists(policy)
+        self._changed('Added Policy: %s', policy)
+
+    async def add_many(self, policies):
+        bulk = self._prepare_bulk(policies, self._prepare_doc, 'insertion')
+        added = await self.__write_bulk(self.collection.insert_many, bulk)
+        return self._changed_many('Added %d Policies', bulk, added)
+
+    async def get(self, uid):
+        ret = await self.collection.find_one(uid, self.projection)
+        return self._prepare_from_doc(ret) if ret else None
+
+    async def get_all(self, limit, offset):
+        self._check_limit_and_offset(limit, offset)
+        return await self.__fetch_policies(self._find_window(limit, offset))
+
+    async def find_for_inquiry(self, inquiry, checker=None):
+        q_filter = self._create_filter(inquiry, checker)
+        return await self.__fetch_policies(self._find_for_decision(q_filter))
+
+    async def find_for_inquiry_by_effect(self, inquiry, effect, checker=None):
+        q_filter = self._create_effect_filter(inquiry, effect, checker)
+        return await self.__fetch_policies(self._find_for_decision(q_filter))
+
+    async def update(self, policy):
+        await self.collection.update_one({'_id': policy.uid}, {'$set': self._prepare_doc(policy)}, upsert=False)
+        self._changed('Updated Policy with UID=%s. New value is: %s', policy.uid, policy)
+
+    async def update_many(self, policies):
+        bulk = self._prepare_bulk(policies, self._prepare_update, 'update')
+        updated = await self.__write_bulk(self.collection.bulk_write, bulk)
+        return self._changed_many('Updated %d Policies', bulk, updated)
+
+    async def delete(self, uid):
+        await self.collection.delete_one({'_id': uid})
+        self._changed('Deleted Policy with UID=%s.', uid)
+
+    async def delete_many(self, uids):
+        bulk = self._prepare_delete_bulk(uids)
+        deleted = await self.__write_bulk(self.collection.bulk_write, bulk)
+        return self._changed_many('Deleted %d Policies', bulk, deleted)
+
+    async def __fetch_policies(self, cursor):
+        """
+        Get list of Policies from the given cursor.
+        """
+        return [self._prepare_from_doc(doc) for doc in await cursor.to_list(None)]
+
+    @classmethod
+    async def __write_bulk(cls, write, bulk):
+        """
+        Run unordered bulk write of requests. Errors of requests are put into results of the bulk.
+        Returns number of successful requests.
+        """
+        if not bulk.requests:
+            return 0
+        try:
+            await write(bulk.requests, ordered=False)
+        except BulkWriteError as e:
+            return len(bulk.requests) - cls._bulk_write_errors(e, bulk)
+        return len(bulk.requests)
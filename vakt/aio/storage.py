@@ -0,0 +1,119 @@
+"""
+Interface of asyncio Storages and asyncio Memory storage for Policies.
+"""
+
+import asyncio
+from abc import ABCMeta, abstractmethod
+
+from ..storage.abc import BaseStorage
+from ..storage.memory import MemoryStorage
+
+
+class AsyncStorage(BaseStorage, metaclass=ABCMeta):
+    """
+    Interface for any storage that persists policies and is used in asyncio applications.
+    Mirrors `vakt.storage.abc.Storage`, but all the methods that access policies are coroutines.
+    See the methods of `Storage` for their description.
+    """
+
+    @abstractmethod
+    async def add(self, policy):
+        """See `Storage.add`"""
+
+    @abstractmethod
+    async def get(self, uid):
+        """See `Storage.get`"""
+
+    @abstractmethod
+    async def get_all(self, limit, offset):
+        """See `Storage.get_all`. Returns list"""
+
+    @abstractmethod
+    async def find_for_inquiry(self, inquiry, checker=None):
+        """See `Storage.find_for_inquiry`. Returns list"""
+
+    async def find_for_inquiry_by_effect(self, inquiry, effect, checker=None):
+        """See `Storage.find_for_inquiry_by_effect`. Returns list"""
+        return self._of_effect(await self.find_for_inquiry(inquiry, checker), effect)
+
+    @abstractmethod
+    async def update(self, policy):
+        """See `Storage.update`"""
+
+    @abstractmethod
+    async def delete(self, uid):
+        """See `Storage.delete`"""
+
+    async def add_many(self, policies):
+        """See `Storage.add_many`"""
+        return await self._each(self.add, policies)
+
+    async def update_many(self, policies):
+        """See `Storage.update_many`"""
+        return await self._each(self.update, policies)
+
+    async def delete_many(self, uids):
+        """See `Storage.delete_many`"""
+        return await self._each(self.delete, uids)
+
+    @staticmethod
+    async def _each(method, items):
+        """Await coroutine method with each of the items and collect results for bulk operations"""
+        results = []
+        for item in items:
+            try:
+                await method(item)
+                results.append(None)
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+class AsyncMemoryStorage(AsyncStorage):
+    """
+    Asyncio interface to MemoryStorage.
+    Reads are served right in the event loop, since MemoryStorage never blocks them.
+    Writes take the lock of MemoryStorage and may copy its indices, so they are run in `executor`
+    (the default executor of the event loop if None).
+    The wrapped storage can be used directly as well: its changes are seen by on-change callbacks.
+    """
+
+    def __init__(self, storage=None, executor=None):
+        self.storage = MemoryStorage() if storage is None else storage
+        self.executor = executor
+
+    async def add(self, policy):
+        await self._write(self.storage.add, policy)
+
+    async def add_many(self, policies):
+        return await self._write(self.storage.add_many, policies)
+
+    async def get(self, uid):
+        return self.storage.get(uid)
+
+    async def get_all(self, limit, offset):
+        return self.storage.get_all(limit, offset)
+
+    async def find_for_inquiry(self, inquiry, checker=None):
+        return self.storage.find_for_inquiry(inquiry, checker)
+
+    async def find_for_inquiry_by_effect(self, inquiry, effect, checker=None):
+        return self.storage.find_for_inquiry_by_effect(inquiry, effect, checker)
+
+    async def update(self, policy):
+        await self._write(self.storage.update, policy)
+
+    async def update_many(self, policies):
+        return await self._write(self.storage.update_many, policies)
+
+    async def delete(self, uid):
+        await self._write(self.storage.delete, uid)
+
+    async def delete_many(self, uids):
+        return await self._write(self.storage.delete_many, uids)
+
+    def on_change(self, callback):
+        self.storage.on_change(callback)
+
+    def _write(self, method, *args):
+        return asyncio.get_event_loop().run_in_executor(self.executor, method, *args)
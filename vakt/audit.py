@@ -0,0 +1,97 @@
+"""
+Cheap logging of Guard decisions for high request rates.
+"""
+
+import itertools
+import logging
+import queue
+import time
+from collections import deque, namedtuple
+from logging.handlers import QueueListener
+
+
+log = logging.getLogger(__name__)
+
+
+__all__ = ['DecisionRecord', 'DecisionLog']
+
+
+class DecisionRecord(namedtuple('DecisionRecord', ['time', 'inquiry', 'answer'])):
+    """
+    Decision of a Guard: its time (seconds since the epoch), inquiry and answer.
+    Inquiry is formatted only when the record is turned into a string or a dictionary.
+    """
+
+    __slots__ = ()
+
+    def to_dict(self):
+        """Get structured representation of the decision"""
+        return {
+            'time': self.time,
+            'answer': self.answer,
+            'inquiry': dict(vars(self.inquiry)),
+        }
+
+    def __str__(self):
+        return 'Incoming Inquiry was %s. Inquiry: %s' % ('allowed' if self.answer else 'rejected', self.inquiry)
+
+
+class DecisionLog:
+    """
+    Log of Guard decisions that replaces a formatted log message per decision.
+    Only every `sample_every`-th decision is recorded. Records are kept in a ring buffer of the last `buffer_size`
+    ones and, if logging `handlers` are given, are passed to them via a queue in a background thread.
+    The queue holds up to `queue_size` records: if handlers can't keep up, new records are dropped and counted
+    in `dropped`. Handlers get only records of levels they are set to handle.
+    Nothing is formatted in the thread that made the decision: records are formatted by handlers when they are emitted.
+    Log records have `decision` attribute holding DecisionRecord for structured formatters.
+    Call `stop` to emit all the queued records and stop the background thread.
+    """
+
+    def __init__(self, sample_every=1, buffer_size=1024, handlers=(), level=logging.INFO, queue_size=10000):
+        if sample_every <= 0:
+            raise ValueError('Sampling rate should be positive')
+        if queue_size <= 0:
+            raise ValueError('Queue size should be positive')
+        self.sample_every = sample_every
+        self.level = level
+        self.buffer = deque(maxlen=buffer_size)
+        self.dropped = 0
+        self._counter = itertools.count(1)
+        self._queue = None
+        self._listener = None
+        if handlers:
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._listener = _Listener(self._queue, *handlers, respect_handler_level=True)
+            self._listener.start()
+
+    def record(self, inquiry, answer):
+        """Record a decision if it's sampled"""
+        if self.sample_every > 1 and next(self._counter) % self.sample_every:
+            return
+        decision = DecisionRecord(time.time(), inquiry, answer)
+        self.buffer.append(decision)
+        if self._queue is not None:
+            record = logging.LogRecord(log.name, self.level, __file__, 0, '%s', (decision,), None)
+            record.decision = decision
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+
+    def records(self):
+        """Get decisions kept in the buffer: from the oldest to the latest one"""
+        return list(self.buffer)
+
+    def stop(self):
+        """Emit all the queued records and stop passing new ones to handlers"""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener, self._queue = None, None
+
+
+class _Listener(QueueListener):
+    """QueueListener that waits for a free place in the queue to stop"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
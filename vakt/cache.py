@@ -0,0 +1,147 @@
+"""
+Caching utilities for Vakt decisions.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from timeit import default_timer
+
+from .parser import compile_regex
+
+
+log = logging.getLogger(__name__)
+
+
+class DecisionCache:
+    """
+    Thread-safe LRU-cache of decisions with an optional time-to-live (in seconds) of its entries.
+    Keeps counters of cache hits and misses.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        if maxsize <= 0:
+            raise ValueError('Cache size should be positive')
+        if ttl is not None and ttl <= 0:
+            raise ValueError('Cache TTL should be positive')
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Get cached value by key. Returns None if there is no such key or its value has expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > default_timer():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, generation=None):
+        """
+        Put value to the cache.
+        If generation is given and the cache was cleared since that generation was obtained - value is discarded.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            expires = None if self.ttl is None else default_timer() + self.ttl
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Drop all the cached values"""
+        with self._lock:
+            self._data.clear()
+            self.generation += 1
+        log.debug('Decision cache was cleared')
+
+    def __len__(self):
+        return len(self._data)
+
+
+class PatternCache:
+    """
+    Thread-safe LRU-cache of regular expressions compiled from tag-denoted policy values (see `compile_regex`).
+    Holds up to `maxsize` patterns (unlimited if maxsize is None), pinned patterns are held on top of them
+    and are never evicted. Keeps counters of cache hits and misses.
+    Errors of compilation are not cached: they are raised on every attempt to compile an invalid pattern.
+    """
+
+    def __init__(self, maxsize=4096):
+        if maxsize is not None and maxsize <= 0:
+            raise ValueError('Cache size should be positive')
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._pinned = {}
+        self._lock = threading.Lock()
+
+    def compile(self, phrase, start_tag, end_tag):
+        """Get regular expression compiled from a string denoted by tags. Compiles it only if it's not cached"""
+        key = (phrase, start_tag, end_tag)
+        with self._lock:
+            pattern = self._pinned.get(key)
+            if pattern is None:
+                pattern = self._data.get(key)
+                if pattern is not None:
+                    self._data.move_to_end(key)
+            if pattern is not None:
+                self.hits += 1
+                return pattern
+            self.misses += 1
+        # compile outside the lock: at worst the same pattern is compiled twice by concurrent threads
+        pattern = compile_regex(phrase, start_tag, end_tag)
+        with self._lock:
+            if key not in self._pinned:
+                self._data[key] = pattern
+                self._data.move_to_end(key)
+                while self.maxsize is not None and len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        return pattern
+
+    def pin(self, phrase, start_tag, end_tag):
+        """Compile pattern if it's not cached and keep it in the cache until it's unpinned"""
+        pattern = self.compile(phrase, start_tag, end_tag)
+        key = (phrase, start_tag, end_tag)
+        with self._lock:
+            self._data.pop(key, None)
+            self._pinned[key] = pattern
+        return pattern
+
+    def unpin(self, phrase, start_tag, end_tag):
+        """Let pinned pattern be evicted as any other one"""
+        key = (phrase, start_tag, end_tag)
+        with self._lock:
+            pattern = self._pinned.pop(key, None)
+            if pattern is None:
+                return
+            self._data[key] = pattern
+            while self.maxsize is not None and len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Drop all the cached patterns except the pinned ones and reset counters"""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._data) + len(self._pinned)
+
+
+# Process-wide cache of compiled patterns shared by RegexCheckers and storages
+regex_cache = PatternCache()
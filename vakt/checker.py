@@ -4,10 +4,10 @@ Module for various checkers.
 
 import re
 import logging
-from functools import lru_cache
+from functools import partial
 from abc import ABCMeta, abstractmethod
 
-from .parser import compile_regex
+from .cache import PatternCache, regex_cache
 from .exceptions import InvalidPatternError
 
 
@@ -25,6 +25,13 @@ class Checker(metaclass=ABCMeta):
         """
         pass
 
+    def matcher(self, policy, field):
+        """
+        Get a function of one argument 'what' that does the same check as `fits` for the given policy and field.
+        Checkers may override it in order to do all the preparations once and not on each check.
+        """
+        return partial(self.fits, policy, field)
+
 
 class RegexChecker(Checker):
     """
@@ -33,9 +40,16 @@ class RegexChecker(Checker):
          'Dogger' doesn't fit <Dog[se]?>
     """
 
-    def __init__(self, cache_size=1024):
-        """Set up LRU-cache size for compiled regular expressions."""
-        self.compile = lru_cache(maxsize=cache_size)(compile_regex)
+    def __init__(self, cache_size=None, cache=None):
+        """
+        Set up LRU-cache for compiled regular expressions.
+        By default the process-wide `vakt.cache.regex_cache` is used, so that checkers share compiled patterns.
+        If `cache_size` is given - checker uses its own cache of that size. Or an explicit `cache` can be given.
+        """
+        if cache is None:
+            cache = regex_cache if cache_size is None else PatternCache(maxsize=cache_size)
+        self.cache = cache
+        self.compile = cache.compile
 
     def fits(self, policy, field, what):
         """Does Policy fit the given 'what' value by its 'field' property"""
@@ -59,6 +73,40 @@ class RegexChecker(Checker):
                 return True
         return False
 
+    def matcher(self, policy, field):
+        if type(self).fits is not RegexChecker.fits:
+            return super().matcher(policy, field)
+        literals, patterns, error = set(), [], None
+        for i in getattr(policy, field, []):
+            if type(i) != str:
+                continue
+            if policy.start_tag not in i and policy.end_tag not in i:
+                literals.add(i)
+                continue
+            try:
+                patterns.append(self.compile(i, policy.start_tag, policy.end_tag))
+            except InvalidPatternError:
+                # the rest of the values are never checked by `fits` because of the failed one
+                log.exception('Error matching policy, because of failed regex %s compilation', i)
+                break
+            except re.error as e:
+                error = e
+                break
+
+        def fits(what):
+            try:
+                if what in literals:
+                    return True
+            except TypeError:
+                pass
+            for pattern in patterns:
+                if pattern.match(what):
+                    return True
+            if error is not None:
+                raise error
+            return False
+        return fits
+
 
 class StringChecker(Checker):
     """
@@ -79,6 +127,38 @@ class StringChecker(Checker):
                 return True
         return False
 
+    def matcher(self, policy, field):
+        if type(self).fits is not StringChecker.fits:
+            return super().matcher(policy, field)
+        values, broken = self._prepare_values(policy, field)
+        compare = self.compare
+
+        def fits(what):
+            for item in values:
+                if compare(what, item):
+                    return True
+            if broken:
+                raise IndexError('Policy %s has empty string in %s' % (policy.uid, field))
+            return False
+        return fits
+
+    @staticmethod
+    def _prepare_values(policy, field):
+        """
+        Get values of a policy field stripped of tags.
+        Values after an empty string are omitted since `fits` fails on it, so the flag of this failure is returned too.
+        """
+        values = []
+        for item in getattr(policy, field, []):
+            if type(item) != str:
+                continue
+            if not item:
+                return values, True
+            if policy.start_tag == item[0] and policy.end_tag == item[-1]:
+                item = item[1:-1]
+            values.append(item)
+        return values, False
+
     @abstractmethod
     def compare(self, needle, haystack):
         """Compares two string values. Override it in a subclass"""
@@ -95,6 +175,23 @@ class StringExactChecker(StringChecker):
     def compare(self, needle, haystack):
         return needle == haystack
 
+    def matcher(self, policy, field):
+        if type(self).fits is not StringChecker.fits or type(self).compare is not StringExactChecker.compare:
+            return super().matcher(policy, field)
+        values, broken = self._prepare_values(policy, field)
+        values = set(values)
+
+        def fits(what):
+            try:
+                if what in values:
+                    return True
+            except TypeError:
+                pass
+            if broken:
+                raise IndexError('Policy %s has empty string in %s' % (policy.uid, field))
+            return False
+        return fits
+
 
 class StringFuzzyChecker(StringChecker):
     """
@@ -142,6 +239,36 @@ class RulesChecker(Checker):
                 return True
         return False
 
+    def matcher(self, policy, field):
+        if type(self).fits is not RulesChecker.fits:
+            return super().matcher(policy, field)
+        # pairs of (is dict, item) where item is a tuple of dict items or a Rule
+        items = []
+        for i in getattr(policy, field, []):
+            if type(i) == dict:
+                if i:
+                    items.append((True, tuple(i.items())))
+            elif callable(getattr(i, 'satisfied', '')):
+                items.append((False, i))
+        check = self._check_satisfied
+
+        def fits(what):
+            is_what_dict = isinstance(what, dict)
+            for is_dict, item in items:
+                if not is_dict:
+                    if check(item, what_value=what):
+                        return True
+                    continue
+                if not is_what_dict:
+                    continue
+                for key, rule in item:
+                    if key not in what or not check(rule, what_value=what[key]):
+                        break
+                else:
+                    return True
+            return False
+        return fits
+
     @staticmethod
     def _check_satisfied(rule, what_value):
         try:
@@ -0,0 +1,156 @@
+"""
+Fast codec of Policies and Rules into JSON-compatible data and back.
+Produces and understands the same "py/object"-tagged format that is produced by jsonpickle,
+but maps data directly to objects using a registry of known Rule classes.
+Data the codec doesn't know how to handle (e.g. objects that are not Rules or references to the same object)
+is handed over to jsonpickle, so that the format stays fully compatible.
+"""
+
+import logging
+
+import jsonpickle
+from jsonpickle import tags
+
+from .rules.base import Rule
+from .util import register_codec
+
+
+log = logging.getLogger(__name__)
+
+
+__all__ = ['encode', 'decode', 'register']
+
+
+# Registry of Rule classes by their importable names
+_registry = {}
+
+_PRIMITIVES = (str, bool, int, float, type(None))
+
+
+class _Unsupported(Exception):
+    """Data can't be processed by the codec and should be processed by jsonpickle"""
+    pass
+
+
+def _class_name(cls):
+    """Get name of a class that is used in "py/object" tag"""
+    return '%s.%s' % (cls.__module__, cls.__name__)
+
+
+def register(cls):
+    """
+    Register Rule class in the codec.
+    All subclasses of vakt Rule are found automatically, so this is needed only for classes
+    that are created after their objects were first encoded or decoded.
+    """
+    if not issubclass(cls, Rule):
+        raise TypeError('Only Rule classes can be registered. Given %s' % cls)
+    _registry[_class_name(cls)] = cls
+    return cls
+
+
+def _load_registry():
+    classes = list(Rule.__subclasses__())
+    while classes:
+        cls = classes.pop()
+        if cls.__qualname__ == cls.__name__:
+            _registry.setdefault(_class_name(cls), cls)
+        classes.extend(cls.__subclasses__())
+
+
+def _find_class(name):
+    cls = _registry.get(name)
+    if cls is None:
+        _load_registry()
+        cls = _registry.get(name)
+    return cls
+
+
+def encode(obj):
+    """
+    Get JSON-compatible representation of an object.
+    The result is the same as the one produced by jsonpickle.
+    """
+    try:
+        return _encode(obj, set())
+    except _Unsupported:
+        log.debug('Falling back to jsonpickle for encoding %s', type(obj))
+        return jsonpickle.Pickler().flatten(obj)
+
+
+def _encode(obj, seen):
+    if type(obj) in _PRIMITIVES:
+        return obj
+    # jsonpickle replaces repeated objects with references
+    if id(obj) in seen:
+        raise _Unsupported
+    seen.add(id(obj))
+    if type(obj) == list:
+        return [_encode(x, seen) for x in obj]
+    if type(obj) == dict:
+        data = {}
+        for k, v in obj.items():
+            if type(k) != str or k in tags.RESERVED:
+                raise _Unsupported
+            data[k] = _encode(v, seen)
+        return data
+    if type(obj) == tuple:
+        return {tags.TUPLE: [_encode(x, seen) for x in obj]}
+    if type(obj) == set:
+        return {tags.SET: [_encode(x, seen) for x in obj]}
+    cls = type(obj)
+    if isinstance(obj, Rule) and cls.__qualname__ == cls.__name__ and \
+            not hasattr(cls, '__getnewargs__') and not hasattr(cls, '__setstate__'):
+        data = {tags.OBJECT: _class_name(cls)}
+        for k, v in vars(obj).items():
+            if k in tags.RESERVED:
+                raise _Unsupported
+            data[k] = _encode(v, seen)
+        return data
+    raise _Unsupported
+
+
+def decode(data):
+    """
+    Create objects from their JSON-compatible representation produced by `encode` or by jsonpickle.
+    """
+    try:
+        return _decode(data)
+    except _Unsupported:
+        log.debug('Falling back to jsonpickle for decoding')
+        return jsonpickle.Unpickler().restore(data)
+
+
+def _decode(data):
+    if type(data) == list:
+        return [_decode(x) for x in data]
+    if not isinstance(data, dict):
+        return data
+    if tags.OBJECT in data:
+        cls = _find_class(data[tags.OBJECT])
+        if cls is None or hasattr(cls, '__setstate__'):
+            raise _Unsupported
+        obj = cls.__new__(cls)
+        for k, v in data.items():
+            if k != tags.OBJECT:
+                if k in tags.RESERVED:
+                    raise _Unsupported
+                setattr(obj, k, _decode(v))
+        return obj
+    if tags.TUPLE in data:
+        if len(data) != 1:
+            raise _Unsupported
+        return tuple(_decode(x) for x in data[tags.TUPLE])
+    if tags.SET in data:
+        if len(data) != 1:
+            raise _Unsupported
+        return set(_decode(x) for x in data[tags.SET])
+    result = {}
+    for k, v in data.items():
+        if k in tags.RESERVED:
+            raise _Unsupported
+        result[k] = _decode(v)
+    return result
+
+
+register_codec(encode, decode)
@@ -0,0 +1,155 @@
+"""
+Compilation of Policies into ready-to-check form.
+"""
+
+import logging
+
+from .rules.operator import Eq
+from .rules.list import In
+
+
+log = logging.getLogger(__name__)
+
+
+__all__ = ['CompiledPolicy', 'compile_policy', 'Selectivity']
+
+
+# Policy fields checked by a Checker along with the corresponding Inquiry attributes in the default order of checks.
+FIELDS = (
+    ('actions', 'action'),
+    ('subjects', 'subject'),
+    ('resources', 'resource'),
+)
+
+FIELD_NAMES = tuple(field for field, _ in FIELDS)
+
+# Costs of checking a policy field
+COST_LITERAL = 0
+COST_COMPLEX = 1
+
+
+class CompiledPolicy:
+    """
+    Immutable representation of a Policy prepared for checks by a particular Checker.
+    All the type checks, tags parsing, regex compilation, etc. are done once upon its creation,
+    so that a check of an inquiry only calls the prepared matchers.
+    Fields are checked from the cheapest to the most expensive ones: fields having only literal values
+    (strings without tags, `Eq` and `In` rules) go before fields with regexes or other rules, context is checked last.
+    Fields of the same cost are checked in the given `order` of field names.
+    """
+
+    __slots__ = ('policy', 'checker', 'allow', 'subjects', 'actions', 'resources', 'context', 'checks')
+
+    def __init__(self, policy, checker, order=FIELD_NAMES):
+        self.policy = policy
+        self.checker = checker
+        self.allow = policy.allow_access()
+        self.subjects = checker.matcher(policy, 'subjects')
+        self.actions = checker.matcher(policy, 'actions')
+        self.resources = checker.matcher(policy, 'resources')
+        self.context = tuple((key, rule.satisfied) for key, rule in policy.context.items())
+        rank = {field: i for i, field in enumerate(order)}
+        fields = sorted(FIELDS, key=lambda f: (_field_cost(policy, f[0]), rank.get(f[0], len(rank))))
+        self.checks = tuple((attr, getattr(self, field)) for field, attr in fields)
+
+    def __setattr__(self, name, value):
+        # attributes are set only once: upon creation
+        if hasattr(self, name):
+            raise AttributeError('%s is immutable' % type(self).__name__)
+        super().__setattr__(name, value)
+
+    def fits(self, inquiry):
+        """Does policy fit the inquiry?"""
+        for attr, matcher in self.checks:
+            if not matcher(getattr(inquiry, attr)):
+                return False
+        return self.context_satisfied(inquiry)
+
+    def fields_fit(self, inquiry):
+        """Does policy fit the inquiry by subject, action and resource, not taking its context into account?"""
+        for attr, matcher in self.checks:
+            if not matcher(getattr(inquiry, attr)):
+                return False
+        return True
+
+    def context_satisfied(self, inquiry):
+        """
+        Check if context restriction in the policy is satisfied for a given inquiry's context.
+        The same as `Guard.check_context_restriction`.
+        """
+        context = inquiry.context
+        for key, satisfied in self.context:
+            try:
+                ctx_value = context[key]
+            except KeyError:
+                log.debug("No key '%s' found in Inquiry context", key)
+                return False
+            if not satisfied(ctx_value, inquiry):
+                return False
+        return True
+
+
+def compile_policy(policy, checker, order=FIELD_NAMES):
+    """Compile policy for checks by a given checker. Fields of the same cost are checked in a given order"""
+    return CompiledPolicy(policy, checker, order)
+
+
+def _field_cost(policy, field):
+    """Estimate the cost of checking a policy field"""
+    start_tag, end_tag = getattr(policy, 'start_tag', None), getattr(policy, 'end_tag', None)
+    for value in getattr(policy, field, ()):
+        if type(value) == str:
+            if start_tag in value or end_tag in value:
+                return COST_COMPLEX
+        elif type(value) == dict:
+            if not all(type(rule) in (Eq, In) for rule in value.values()):
+                return COST_COMPLEX
+        elif type(value) not in (Eq, In):
+            return COST_COMPLEX
+    return COST_LITERAL
+
+
+class Selectivity:
+    """
+    Observed selectivity of policy fields: how often a field of a policy doesn't fit an inquiry.
+    Every `sample_every`-th check is sampled: all fields of its policies are checked one by one.
+    Every `reorder_every` samples fields are ordered from the most selective to the least selective one,
+    so that checks of compiled policies can fail as early as possible.
+    """
+
+    def __init__(self, sample_every=64, reorder_every=16):
+        self.sample_every = sample_every
+        self.reorder_every = reorder_every
+        self.order = FIELD_NAMES
+        self.rejects = dict.fromkeys(FIELD_NAMES, 0)
+        self._checks = 0
+        self._samples = 0
+
+    def sample(self):
+        """Should the current check be sampled?"""
+        self._checks += 1
+        return self._checks % self.sample_every == 0
+
+    def observe(self, inquiry, compiled_policies):
+        """
+        Check fields of the compiled policies separately and count the ones that don't fit the inquiry.
+        Returns True if the order of fields was changed.
+        """
+        for compiled in compiled_policies:
+            for field, attr in FIELDS:
+                try:
+                    if not getattr(compiled, field)(getattr(inquiry, attr)):
+                        self.rejects[field] += 1
+                except Exception:
+                    # fails of broken policies tell nothing about selectivity
+                    pass
+        self._samples += 1
+        if self._samples % self.reorder_every:
+            return False
+        # sort is stable, so the order of equally selective fields isn't changed
+        order = tuple(sorted(self.order, key=lambda field: -self.rejects[field]))
+        if order == self.order:
+            return False
+        log.debug('Policy fields are reordered by selectivity: %s', order)
+        self.order = order
+        return True
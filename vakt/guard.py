@@ -4,8 +4,15 @@ Also contains Inquiry class.
 """
 
 import logging
+import threading
+import weakref
+from timeit import default_timer
 
-from .util import JsonSerializer, PrettyPrint
+from .util import JsonSerializer, PrettyPrint, make_hashable
+from .cache import DecisionCache
+from .compiler import compile_policy, Selectivity
+from .effects import ALLOW_ACCESS, DENY_ACCESS
+from .metrics import DecisionStats
 
 
 log = logging.getLogger(__name__)
@@ -28,50 +35,164 @@ class Inquiry(JsonSerializer, PrettyPrint):
         return cls(**props)
 
 
-class Guard:
+class BaseGuard:
     """
-    Executor of policy checks.
-    Given a storage and a checker it can decide via `is_allowed` method if a given inquiry allowed or not.
+    Functionality common to all guards: blocking and asyncio ones. Everything that doesn't do I/O.
+    Policies are compiled for the checker on their first check. Compiled policies are dropped
+    every time policies are changed via the storage.
+    Guard samples checks in order to find out the selectivity of policy fields, so that policies are recompiled
+    to check the most selective fields first every time the selectivity order is changed.
+    If an `observer` (see `vakt.metrics`) is given, statistics of every decision are gathered and passed to it.
+    Without an observer decisions are not instrumented at all.
+    Every decision is logged at INFO level, unless a `decision_log` (see `vakt.audit`) is given: then decisions
+    are recorded by it instead.
     """
 
-    def __init__(self, storage, checker):
+    def __init__(self, storage, checker, observer=None, decision_log=None):
         self.storage = storage
         self.checker = checker
+        self.observer = observer
+        self.decision_log = decision_log
+        self.selectivity = Selectivity()
+        self._compiled = weakref.WeakKeyDictionary()
+        self._compiled_generation = 0
+        self._compiled_lock = threading.Lock()
+        storage.on_change(self._drop_compiled)
 
-    def is_allowed(self, inquiry):
-        """Is given inquiry intent allowed or not?"""
+    @staticmethod
+    def _batch_key(inquiry, effect):
+        """Get key of policies fetched for inquiry in a batch of decisions. None if inquiry data is unhashable"""
         try:
-            policies = self.storage.find_for_inquiry(inquiry, self.checker)
-            # Storage is not obliged to do the exact policies match. It's up to the storage
-            # to decide what policies to return. So we need a more correct programmatically done check.
-            answer = self.check_policies_allow(inquiry, policies)
-        except Exception:
-            log.exception('Unexpected exception occurred while checking Inquiry %s', inquiry)
-            answer = False
-
-        if answer:
+            return make_hashable((inquiry.subject, inquiry.action, inquiry.resource, inquiry.context, effect))
+        except TypeError:
+            return None
+
+    def _start_decision(self, inquiry):
+        """Get statistics of the decision to be gathered if there is an observer, None otherwise"""
+        if self.observer is None:
+            return None
+        return DecisionStats(inquiry)
+
+    @staticmethod
+    def _fail_decision(inquiry, exception, stats):
+        """Handle unexpected exception that occurred while checking inquiry. Returns the answer: deny access"""
+        log.exception('Unexpected exception occurred while checking Inquiry %s', inquiry)
+        if stats is not None:
+            stats.exception = exception
+        return False
+
+    def _finish_decision(self, inquiry, answer, stats):
+        """Log the answer for inquiry and pass the statistics of the decision (if any) to the observer"""
+        if stats is not None:
+            stats.total_time = default_timer() - stats.started
+            stats.answer = answer
+        self._log_answer(inquiry, answer)
+        if stats is not None:
+            try:
+                self.observer.on_decision(stats)
+            except Exception:
+                log.exception('Unexpected exception occurred in decisions observer %s', self.observer)
+        return answer
+
+    def _log_answer(self, inquiry, answer):
+        if self.decision_log is not None:
+            self.decision_log.record(inquiry, answer)
+        elif answer:
             log.info('Incoming Inquiry was allowed. Inquiry: %s', inquiry)
         else:
             log.info('Incoming Inquiry was rejected. Inquiry: %s', inquiry)
 
-        return answer
+    def _check_steps(self, inquiry, stats):
+        """
+        Check of inquiry without I/O: a generator that yields effects of policies that should be fetched for inquiry
+        (None for policies of any effect), is sent the fetched policies and returns the answer. May raise exceptions.
+        If the storage keeps allow and deny policies apart, allow policies are requested only if no deny policy fits.
+        """
+        if getattr(self.storage, 'partitioned_by_effect', False):
+            # if at least one deny policy fits the inquiry - allow policies aren't needed: deny access!
+            if self._any_fits(inquiry, (yield DENY_ACCESS), False, stats):
+                return False
+            return self._any_fits(inquiry, (yield ALLOW_ACCESS), True, stats)
+        policies = yield None
+        # Storage is not obliged to do the exact policies match. It's up to the storage
+        # to decide what policies to return. So we need a more correct programmatically done check.
+        return self.check_policies_allow(inquiry, policies, stats)
 
-    def check_policies_allow(self, inquiry, policies):
-        """Check if any of a given policy allows a specified inquiry"""
+    @staticmethod
+    def _step(steps, policies):
+        """
+        Send fetched policies (None at the start) to a check started by `_check_steps`.
+        Returns tuple (True, answer) if the check is finished, (False, effect of policies to fetch) otherwise.
+        """
+        try:
+            return False, steps.send(policies)
+        except StopIteration as e:
+            return True, e.value
+
+    def check_policies_allow(self, inquiry, policies, stats=None):
+        """
+        Check if any of a given policy allows a specified inquiry.
+        Deny policies are checked first: the check stops on the first one that fits the inquiry.
+        Checks are accounted in DecisionStats if they are given.
+        """
         # If no policies found or None is given -> deny access!
         if not policies:
             return False
 
-        # Filter policies that fit Inquiry by its attributes.
-        filtered = [p for p in policies if
-                    self.checker.fits(p, 'actions', inquiry.action) and
-                    self.checker.fits(p, 'subjects', inquiry.subject) and
-                    self.checker.fits(p, 'resources', inquiry.resource) and
-                    self.check_context_restriction(p, inquiry)]
+        compiled = self._compile_all(inquiry, policies)
 
-        # no policies -> deny access!
-        # if we have 2 or more similar policies - all of them should have allow effect, otherwise -> deny access!
-        return len(filtered) > 0 and all(p.allow_access() for p in filtered)
+        # if at least one deny policy fits the inquiry - it decides the answer: deny access!
+        if self._first_fits(inquiry, compiled, False, stats):
+            return False
+
+        # no fitting policies -> deny access!
+        return self._first_fits(inquiry, compiled, True, stats)
+
+    def _any_fits(self, inquiry, policies, allow, stats=None):
+        """Does any of given policies with a given effect fit the inquiry?"""
+        if not policies:
+            return False
+        # storage may return policies of other effect, since it's not obliged to do the exact match
+        return self._first_fits(inquiry, self._compile_all(inquiry, policies), allow, stats)
+
+    @staticmethod
+    def _first_fits(inquiry, compiled, allow, stats):
+        """Does any of given compiled policies with a given effect fit the inquiry? Stops on the first fitting one"""
+        if stats is not None:
+            return _first_fits_observed(inquiry, compiled, allow, stats)
+        for policy in compiled:
+            if policy.allow == allow and policy.fits(inquiry):
+                return True
+        return False
+
+    def _compile_all(self, inquiry, policies):
+        """Get policies compiled for the current checker. Checks of some inquiries are sampled for selectivity"""
+        compiled = [self._compile(p) for p in policies]
+        if self.selectivity.sample() and self.selectivity.observe(inquiry, compiled):
+            self._drop_compiled()
+        return compiled
+
+    def _drop_compiled(self):
+        """Drop all the compiled policies, so that policies compiled before that are not stored"""
+        with self._compiled_lock:
+            self._compiled.clear()
+            self._compiled_generation += 1
+
+    def _compile(self, policy):
+        """Get policy compiled for the current checker"""
+        try:
+            compiled = self._compiled.get(policy)
+        except TypeError:
+            # policy can't be weak-referenced or hashed
+            return compile_policy(policy, self.checker, self.selectivity.order)
+        if compiled is None or compiled.checker is not self.checker:
+            generation = self._compiled_generation
+            compiled = compile_policy(policy, self.checker, self.selectivity.order)
+            with self._compiled_lock:
+                # policy may have been changed while it was compiled
+                if generation == self._compiled_generation:
+                    self._compiled[policy] = compiled
+        return compiled
 
     @staticmethod
     def check_context_restriction(policy, inquiry):
@@ -89,3 +210,136 @@ class Guard:
             if not rule.satisfied(ctx_value, inquiry):
                 return False
         return True
+
+
+class Guard(BaseGuard):
+    """
+    Executor of policy checks.
+    Given a storage and a checker it can decide via `is_allowed` method if a given inquiry allowed or not.
+    If the storage keeps allow and deny policies apart, deny policies are fetched and checked first,
+    and allow policies are fetched only if none of the deny ones fit the inquiry.
+    See `BaseGuard` for compilation of policies, observers and decision logs.
+    """
+
+    def is_allowed(self, inquiry):
+        """Is given inquiry intent allowed or not?"""
+        return self._decide(inquiry, self._find_for_inquiry)
+
+    def is_allowed_many(self, inquiries):
+        """
+        Are given inquiries intents allowed or not?
+        Returns a list of answers in the same order as inquiries were given.
+        Storage is queried only once for all inquiries that have the same subject, action, resource and context.
+        """
+        fetched = {}
+
+        def find_for_inquiry(inquiry, checker, effect=None):
+            key = self._batch_key(inquiry, effect)
+            if key is None:
+                return self._find_for_inquiry(inquiry, checker, effect)
+            if key not in fetched:
+                fetched[key] = list(self._find_for_inquiry(inquiry, checker, effect))
+            return fetched[key]
+
+        return [self._decide(inquiry, find_for_inquiry) for inquiry in inquiries]
+
+    def _find_for_inquiry(self, inquiry, checker, effect=None):
+        """Get policies for inquiry from the storage: only the ones of a given effect if it's given"""
+        if effect is None:
+            return self.storage.find_for_inquiry(inquiry, checker)
+        return self.storage.find_for_inquiry_by_effect(inquiry, effect, checker)
+
+    def _decide(self, inquiry, find_for_inquiry):
+        """Make a decision for inquiry based on policies returned by a given find function"""
+        stats = self._start_decision(inquiry)
+        if stats is not None:
+            find_for_inquiry = _ObservedFind(find_for_inquiry, stats)
+        try:
+            answer = self._check(inquiry, find_for_inquiry)
+        except Exception as e:
+            answer = self._fail_decision(inquiry, e, stats)
+        return self._finish_decision(inquiry, answer, stats)
+
+    def _check(self, inquiry, find_for_inquiry):
+        """Check inquiry against policies returned by a given find function. May raise exceptions"""
+        steps = self._check_steps(inquiry, getattr(find_for_inquiry, 'stats', None))
+        done, result = self._step(steps, None)
+        while not done:
+            done, result = self._step(steps, find_for_inquiry(inquiry, self.checker, result))
+        return result
+
+
+class CachingGuard(Guard):
+    """
+    Guard that caches its decisions in LRU-cache of `cache_size` entries, each living for `ttl` seconds
+    (forever if ttl is None).
+    Cache is cleared every time policies are changed via the storage this guard was created with.
+    Note, that changes done to the storage data not via its methods (e.g. by another process) can't be seen,
+    so use `ttl` to limit the staleness of decisions in this case.
+    Inquiries holding unhashable data are not cached.
+    Decisions that failed because of unexpected exceptions are not cached.
+    Observer is informed whether each decision was taken from the cache.
+    """
+
+    def __init__(self, storage, checker, cache_size=1024, ttl=None, observer=None, decision_log=None):
+        super().__init__(storage, checker, observer, decision_log)
+        self.cache = DecisionCache(maxsize=cache_size, ttl=ttl)
+        storage.on_change(self.cache.clear)
+
+    def _check(self, inquiry, find_for_inquiry):
+        stats = getattr(find_for_inquiry, 'stats', None)
+        try:
+            key = make_hashable((type(inquiry), vars(inquiry)))
+        except TypeError:
+            log.debug('Inquiry has unhashable data, so it can not be cached. Inquiry: %s', inquiry)
+            return super()._check(inquiry, find_for_inquiry)
+        answer = self.cache.get(key)
+        if stats is not None:
+            stats.cached = answer is not None
+        if answer is None:
+            generation = self.cache.generation
+            answer = super()._check(inquiry, find_for_inquiry)
+            self.cache.set(key, answer, generation)
+        return answer
+
+
+class _ObservedFind:
+    """Find function that accounts time spent fetching policies and their number in DecisionStats"""
+
+    __slots__ = ('find', 'stats')
+
+    def __init__(self, find, stats):
+        self.find = find
+        self.stats = stats
+
+    def __call__(self, inquiry, checker, effect=None):
+        start = default_timer()
+        policies = self.find(inquiry, checker, effect)
+        return _account_fetch(self.stats, policies, start)
+
+
+def _account_fetch(stats, policies, start):
+    """Account policies fetched since a given start time in DecisionStats"""
+    if policies is not None and not isinstance(policies, list):
+        policies = list(policies)
+    stats.fetch_time += default_timer() - start
+    stats.fetches += 1
+    stats.candidates += len(policies or ())
+    return policies
+
+
+def _first_fits_observed(inquiry, compiled, allow, stats):
+    """The same as `Guard._first_fits` that accounts checked and matched policies and context checks in DecisionStats"""
+    for policy in compiled:
+        if policy.allow != allow:
+            continue
+        stats.checked += 1
+        if not policy.fields_fit(inquiry):
+            continue
+        start = default_timer()
+        fits = policy.context_satisfied(inquiry)
+        stats.context_time += default_timer() - start
+        if fits:
+            stats.matched += 1
+            return True
+    return False
@@ -0,0 +1,153 @@
+"""
+Instrumentation of Guard decisions: per-decision statistics, observers of them and an in-process collector.
+"""
+
+import bisect
+import logging
+import threading
+from timeit import default_timer
+
+
+log = logging.getLogger(__name__)
+
+
+__all__ = ['DecisionStats', 'Observer', 'Histogram', 'MetricsCollector']
+
+
+# Upper bounds (in seconds) of histogram buckets for timings of decision phases
+TIME_BOUNDS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+# Upper bounds of histogram buckets for numbers of policies fetched for a decision
+COUNT_BOUNDS = (0, 1, 2, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+
+
+class DecisionStats:
+    """
+    Statistics of a single Guard decision.
+    Times are in seconds: `fetch_time` - spent in the storage fetching policies, `context_time` - spent checking
+    context rules, `total_time` - the whole decision. `check_time` (all but fetch) and `filter_time` (all but fetch
+    and context, i.e. compilation and checks of policy fields) are derived from them.
+    `candidates` - number of policies fetched, `checked` - number of them checked against the inquiry,
+    `matched` - number of them that fit it. Checks stop on the first fitting policy, so it's at most 2 (deny and allow).
+    `cached` - whether decision was taken from the cache (None if the guard doesn't cache decisions),
+    `exception` - unexpected exception that made the guard deny access,
+    `started` - the moment (by `timeit.default_timer`) the decision was started.
+    """
+
+    __slots__ = ('inquiry', 'answer', 'cached', 'exception', 'fetches', 'candidates', 'checked', 'matched',
+                 'fetch_time', 'context_time', 'total_time', 'started')
+
+    def __init__(self, inquiry):
+        self.started = default_timer()
+        self.inquiry = inquiry
+        self.answer = None
+        self.cached = None
+        self.exception = None
+        self.fetches = 0
+        self.candidates = 0
+        self.checked = 0
+        self.matched = 0
+        self.fetch_time = 0.0
+        self.context_time = 0.0
+        self.total_time = 0.0
+
+    @property
+    def check_time(self):
+        """Time spent on everything but fetching policies"""
+        return self.total_time - self.fetch_time
+
+    @property
+    def filter_time(self):
+        """Time spent compiling and checking policy fields: everything but fetching policies and checking context"""
+        return self.total_time - self.fetch_time - self.context_time
+
+
+class Observer:
+    """
+    Observer of Guard decisions. Does nothing: override `on_decision` in a subclass.
+    It's called in the thread (or the event loop) that made the decision, so it should be quick.
+    """
+
+    def on_decision(self, stats):
+        """Receive statistics of a decision that was just made"""
+        pass
+
+
+class Histogram:
+    """
+    Histogram of observed values over buckets with given upper bounds (the last bucket is unbounded).
+    Keeps the sum and the number of observed values. Not thread-safe.
+    """
+
+    def __init__(self, bounds=TIME_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        """Count a value in its bucket"""
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        """Get cumulative counts of values less or equal to each bound (Prometheus-style), sum and count"""
+        buckets, total = [], 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            buckets.append((bound, total))
+        return {'buckets': buckets, 'sum': self.sum, 'count': self.count}
+
+
+class MetricsCollector(Observer):
+    """
+    Thread-safe observer that collects statistics of decisions in memory:
+    histograms of phases timings and of numbers of fetched policies, and counters of decisions, their answers,
+    cache hits and misses, fetched and matched policies, and exceptions.
+    Use `snapshot` to scrape them.
+    """
+
+    PHASES = ('fetch', 'filter', 'context', 'total')
+
+    def __init__(self, time_bounds=TIME_BOUNDS, count_bounds=COUNT_BOUNDS):
+        self.time_bounds = time_bounds
+        self.count_bounds = count_bounds
+        self._lock = threading.Lock()
+        self.reset()
+
+    def on_decision(self, stats):
+        with self._lock:
+            self.timings['fetch'].observe(stats.fetch_time)
+            self.timings['filter'].observe(stats.filter_time)
+            self.timings['context'].observe(stats.context_time)
+            self.timings['total'].observe(stats.total_time)
+            self.candidates.observe(stats.candidates)
+            counters = self.counters
+            counters['decisions'] += 1
+            counters['allowed' if stats.answer else 'denied'] += 1
+            counters['candidates'] += stats.candidates
+            counters['checked'] += stats.checked
+            counters['matched'] += stats.matched
+            if stats.cached is not None:
+                counters['cache_hits' if stats.cached else 'cache_misses'] += 1
+            if stats.exception is not None:
+                counters['exceptions'] += 1
+
+    def snapshot(self):
+        """Get current values of all the counters and histograms"""
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'timings': {phase: histogram.snapshot() for phase, histogram in self.timings.items()},
+                'candidates': self.candidates.snapshot(),
+            }
+
+    def reset(self):
+        """Drop all the collected statistics"""
+        with self._lock:
+            self.timings = {phase: Histogram(self.time_bounds) for phase in self.PHASES}
+            self.candidates = Histogram(self.count_bounds)
+            self.counters = dict.fromkeys(
+                ('decisions', 'allowed', 'denied', 'candidates', 'checked', 'matched',
+                 'cache_hits', 'cache_misses', 'exceptions'), 0)
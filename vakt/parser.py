@@ -24,6 +24,17 @@ def compile_regex(phrase, start_tag, end_tag):
     return re.compile('^%s%s$' % (pattern, re.escape(raw)))
 
 
+def get_literal_prefix(phrase, start_tag, end_tag):
+    """
+    Get the literal (not regex) part of a string denoted by tags that precedes the first tag.
+    E.g. 'library:books:<.+>' -> 'library:books:'
+    """
+    indices = get_tag_indices(phrase, start_tag, end_tag)
+    if not indices:
+        return phrase
+    return phrase[:indices[0]]
+
+
 def get_tag_indices(string, start, end):
     """
     Find and return list of tag indices in the given string.
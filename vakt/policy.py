@@ -4,7 +4,6 @@ Namespace for a basic Policy class.
 
 import logging
 import warnings
-import copy
 
 from .effects import ALLOW_ACCESS, DENY_ACCESS
 from .exceptions import PolicyCreationError
@@ -49,14 +48,22 @@ class Policy(JsonSerializer, PrettyPrint):
             context = {}
         self.context = context
         self.description = description
-        self.type = None
 
     @classmethod
     def from_json(cls, data):
         props = cls._parse(data)
-        if 'uid' not in props:
-            log.error("Error creating policy from json. 'uid' attribute is required")
-            raise PolicyCreationError("Error creating policy from json. 'uid' attribute is required")
+        return cls.from_dict(props)
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Create Policy from a dictionary of its attributes (e.g. received from a storage).
+        Dictionary is not changed.
+        """
+        if 'uid' not in data:
+            log.error("Error creating policy. 'uid' attribute is required")
+            raise PolicyCreationError("Error creating policy. 'uid' attribute is required")
+        props = dict(data)
         context_rules = {}
         if 'context' in props:
             context_rules = props['context']
@@ -68,6 +75,15 @@ class Policy(JsonSerializer, PrettyPrint):
             del props['type']
         return cls(**props)
 
+    @classmethod
+    def from_dicts(cls, data):
+        """
+        Create Policies from an iterable of dictionaries of their attributes.
+        Policies are yielded one by one, so that large amounts of data can be processed lazily.
+        """
+        for item in data:
+            yield cls.from_dict(item)
+
     def allow_access(self):
         """Does policy imply allow-access?"""
         return self.effect == ALLOW_ACCESS
@@ -91,16 +107,22 @@ class Policy(JsonSerializer, PrettyPrint):
     def __setattr__(self, name, value):
         self._check_field_type(name, value)
         # Always calculate type. Even if type is set explicitly.
-        calculated_type = self._calculate_type(name, value)
+        # Type can change only if a definition field is changed, so other fields reuse the calculated one.
+        if name in self._definition_fields or name == 'type' or 'type' not in self.__dict__:
+            calculated_type = self._calculate_type(name, value)
+        else:
+            calculated_type = self.__dict__['type']
         object.__setattr__(self, name, value)
         # Dict assign eliminates recursion
         self.__dict__['type'] = calculated_type
 
     def _calculate_type(self, new_element_name, new_element_value):
         all_elements = rule_elements = str_elements = 0
-        self_copy = copy.copy(self)
-        self_copy.__dict__[new_element_name] = new_element_value
-        for elements in [getattr(self_copy, f, ()) for f in self._definition_fields]:
+        for field in self._definition_fields:
+            if field == new_element_name:
+                elements = new_element_value
+            else:
+                elements = getattr(self, field, ())
             for e in elements:
                 all_elements += 1
                 if isinstance(e, (dict, Rule)):
@@ -117,7 +139,7 @@ class Policy(JsonSerializer, PrettyPrint):
 
     def _check_field_type(self, name, value):
         """Checks type of a field that defines Policy"""
-        if name in self._definition_fields and not all(map(lambda x: isinstance(x, (str, dict, Rule)), value)):
+        if name in self._definition_fields and not all(isinstance(x, (str, dict, Rule)) for x in value):
             raise PolicyCreationError(
                 'Field "%s" element must be of `str`, `dict` or `Rule` type. But given: %s' % (name, value)
             )
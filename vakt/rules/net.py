@@ -14,6 +14,7 @@ log = logging.getLogger(__name__)
 
 __all__ = [
     'CIDR',
+    'AnyCIDR',
 ]
 
 
@@ -23,19 +24,116 @@ class CIDR(Rule):
     For example: context={'ip': CIDR('127.0.0.1/32')}
     """
 
+    # Parsed network is kept out of the instance __dict__, so that it isn't serialized
+    __slots__ = ('_range',)
+
     def __init__(self, cidr):
         self.cidr = cidr
 
+    @property
+    def cidr(self):
+        """CIDR the IP address should be in. Setting it parses the network"""
+        return self.__dict__['cidr']
+
+    @cidr.setter
+    def cidr(self, value):
+        self.__dict__['cidr'] = value
+        network = _parse_network(value, type(self).__name__)
+        if network is None:
+            self._range = None
+        else:
+            self._range = (network.version, int(network.network_address), int(network.broadcast_address))
+
+    def satisfied(self, what, inquiry=None):
+        if not isinstance(what, str) or self._range is None:
+            return False
+        ip = _parse_ip(what, type(self).__name__)
+        if ip is None:
+            return False
+        version, first, last = self._range
+        return ip.version == version and first <= int(ip) <= last
+
+
+class AnyCIDR(Rule):
+    """
+    Rule that is satisfied when inquiry's IP address is in any of the provided CIDRs.
+    Networks are kept in a radix tree, so the check takes time proportional to the prefix length
+    and not to the number of networks.
+    For example: context={'ip': AnyCIDR('127.0.0.1/32', '192.168.2.0/24', '2001:db8::/32')}
+    """
+
+    # Radix trees are kept out of the instance __dict__, so that they aren't serialized
+    __slots__ = ('_trees',)
+
+    def __init__(self, *cidrs):
+        self.cidrs = tuple(cidrs)
+
+    @property
+    def cidrs(self):
+        """CIDRs any of which the IP address should be in. Setting them rebuilds the radix trees"""
+        return self.__dict__['cidrs']
+
+    @cidrs.setter
+    def cidrs(self, value):
+        self.__dict__['cidrs'] = value
+        trees = {}
+        for cidr in value:
+            network = _parse_network(cidr, type(self).__name__)
+            if network is not None:
+                trees[network.version] = _radix_insert(
+                    trees.get(network.version),
+                    int(network.network_address) >> (network.max_prefixlen - network.prefixlen),
+                    network.prefixlen,
+                )
+        self._trees = trees
+
     def satisfied(self, what, inquiry=None):
         if not isinstance(what, str):
             return False
-        try:
-            ip = ipaddress.ip_address(what)
-            net = ipaddress.ip_network(self.cidr)
-        except ValueError:
-            log.exception('Error %s satisfied', type(self).__name__)
+        ip = _parse_ip(what, type(self).__name__)
+        if ip is None:
             return False
-        return ip in net
+        return _radix_contains(self._trees.get(ip.version), int(ip), ip.max_prefixlen)
+
+
+def _parse_network(cidr, rule_name):
+    try:
+        return ipaddress.ip_network(cidr)
+    except (TypeError, ValueError):
+        log.exception('Error %s network %r', rule_name, cidr)
+        return None
+
+
+def _parse_ip(what, rule_name):
+    try:
+        return ipaddress.ip_address(what)
+    except ValueError:
+        log.exception('Error %s satisfied', rule_name)
+        return None
+
+
+# Radix tree is a binary tree of [zero, one] nodes indexed by bits of an address starting from the highest one.
+# True in place of a node means that the whole subtree is covered by some network, None - that nothing is there.
+
+def _radix_insert(node, prefix, length):
+    """Add network given by its first `length` bits to the tree and return the new root"""
+    if length == 0 or node is True:
+        return True
+    if node is None:
+        node = [None, None]
+    bit = (prefix >> (length - 1)) & 1
+    node[bit] = _radix_insert(node[bit], prefix, length - 1)
+    return node
+
+
+def _radix_contains(node, address, bits):
+    """Is address with given number of bits covered by any network in the tree?"""
+    while node is not None:
+        if node is True:
+            return True
+        bits -= 1
+        node = node[(address >> bits) & 1]
+    return False
 
 
 # Classes marked for removal in next releases
@@ -2,10 +2,65 @@
 Contains interfaces that all Storages should implement.
 """
 
+import inspect
+import weakref
 from abc import ABCMeta, abstractmethod
+from functools import lru_cache
 
+from ..effects import ALLOW_ACCESS
 
-class Storage(metaclass=ABCMeta):
+
+class BaseStorage:
+    """
+    Functionality common to all storages: blocking and asyncio ones.
+    """
+
+    @property
+    def partitioned_by_effect(self):
+        """
+        Does storage keep allow and deny policies apart, so that they should be fetched separately
+        via `find_for_inquiry_by_effect`?
+        It's so if the storage class implements `find_for_inquiry_by_effect` along with or after `find_for_inquiry`,
+        so that subclasses overriding only `find_for_inquiry` are still queried by it.
+        """
+        return _partitioned_by_effect(type(self))
+
+    def on_change(self, callback):
+        """
+        Register a callable (without arguments) that is called every time policies are changed
+        via add, update or delete (or their bulk versions). Bound methods are held by weak references.
+        """
+        ref = weakref.WeakMethod(callback) if inspect.ismethod(callback) else (lambda: callback)
+        self.__dict__.setdefault('_change_callbacks', []).append(ref)
+
+    def _notify_change(self):
+        """
+        Call all registered on-change callbacks.
+        Every storage should call it after it has changed policies.
+        """
+        refs = self.__dict__.get('_change_callbacks', [])
+        for ref in list(refs):
+            callback = ref()
+            if callback is None:
+                refs.remove(ref)
+            else:
+                callback()
+
+    @staticmethod
+    def _of_effect(policies, effect):
+        """Get list of the policies that have a given effect"""
+        allow = effect == ALLOW_ACCESS
+        return [p for p in policies if p.allow_access() == allow]
+
+    @staticmethod
+    def _check_limit_and_offset(limit, offset):
+        if limit < 0:
+            raise ValueError("Limit can't be negative")
+        if offset < 0:
+            raise ValueError("Offset can't be negative")
+
+
+class Storage(BaseStorage, metaclass=ABCMeta):
     """
     Interface for any storage that persists policies.
     Every storage should implement all the specified methods, but how, it's up to it to decide:
@@ -47,6 +102,18 @@ class Storage(metaclass=ABCMeta):
         """
         pass
 
+    def find_for_inquiry_by_effect(self, inquiry, effect, checker=None):
+        """
+        Get potential policies for a given inquiry that have a given effect:
+        ALLOW_ACCESS - policies that allow access, DENY_ACCESS - all the other ones.
+        Storages that keep allow and deny policies apart should override it, so that Guard fetches deny policies first
+        and fetches allow policies only if none of the deny ones fit the inquiry.
+        By default policies returned by `find_for_inquiry` are filtered by their effect.
+
+        Returns Iterable
+        """
+        return self._of_effect(self.find_for_inquiry(inquiry, checker), effect)
+
     @abstractmethod
     def update(self, policy):
         """Update a policy"""
@@ -57,9 +124,46 @@ class Storage(metaclass=ABCMeta):
         """Delete a policy"""
         pass
 
+    def add_many(self, policies):
+        """
+        Store policies.
+        Returns list of results for each policy in the same order: None if policy was stored,
+        otherwise an exception that prevented it from being stored (e.g. PolicyExistsError).
+        Storages should override it with an efficient bulk implementation.
+        """
+        return self._each(self.add, policies)
+
+    def update_many(self, policies):
+        """
+        Update policies.
+        Returns list of results for each policy in the same order: None if policy was updated, otherwise an exception.
+        """
+        return self._each(self.update, policies)
+
+    def delete_many(self, uids):
+        """
+        Delete policies by their UIDs.
+        Returns list of results for each UID in the same order: None if policy was deleted, otherwise an exception.
+        """
+        return self._each(self.delete, uids)
+
     @staticmethod
-    def _check_limit_and_offset(limit, offset):
-        if limit < 0:
-            raise ValueError("Limit can't be negative")
-        if offset < 0:
-            raise ValueError("Offset can't be negative")
+    def _each(method, items):
+        """Call method with each of the items and collect results for bulk operations"""
+        results = []
+        for item in items:
+            try:
+                method(item)
+                results.append(None)
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+@lru_cache(maxsize=None)
+def _partitioned_by_effect(cls):
+    """Is `find_for_inquiry_by_effect` defined in the same class as `find_for_inquiry` or in its subclass?"""
+    def defined_in(name):
+        return next((c for c in cls.__mro__ if name in c.__dict__), None)
+    by_effect, plain = defined_in('find_for_inquiry_by_effect'), defined_in('find_for_inquiry')
+    return by_effect is not None and plain is not None and issubclass(by_effect, plain)
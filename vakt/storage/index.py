@@ -0,0 +1,1100 @@
+"""
+Indices of Policies used by storages for quick retrieval of the policies that may fit an Inquiry.
+"""
+
+import re
+import copy
+import math
+import itertools
+import logging
+from abc import ABCMeta, abstractmethod
+from collections import namedtuple
+
+from ..policy import TYPE_RULE_BASED
+from ..rules.operator import Eq, Greater, Less, GreaterOrEqual, LessOrEqual
+from ..rules.list import In
+from ..rules.logic import And
+from ..cache import regex_cache
+from ..parser import get_literal_prefix
+from ..exceptions import InvalidPatternError
+
+
+log = logging.getLogger(__name__)
+
+
+# Policy fields that define policy match along with the corresponding Inquiry attributes.
+FIELDS = (
+    ('subjects', 'subject'),
+    ('actions', 'action'),
+    ('resources', 'resource'),
+)
+
+
+EMPTY = frozenset()
+
+# Number of shards large collections are split into, so that a change of a collection copies only one of its shards
+SHARDS = 64
+
+
+class PolicyIndex(metaclass=ABCMeta):
+    """
+    Abstract index of policies.
+    Index doesn't do the exact match of policies: it returns UIDs of all policies that can possibly fit the inquiry,
+    so the found policies should be checked by Checker afterwards.
+    """
+
+    @abstractmethod
+    def add(self, policy):
+        """Index a policy"""
+        pass
+
+    @abstractmethod
+    def remove(self, uid):
+        """Remove a policy from index by its UID"""
+        pass
+
+    @abstractmethod
+    def find(self, inquiry):
+        """
+        Get UIDs of the policies that can possibly fit the inquiry.
+
+        Returns set
+        """
+        pass
+
+    @abstractmethod
+    def copy(self):
+        """Get a copy of the index that can be changed independently of the original one"""
+        pass
+
+
+class _CopyOnWrite:
+    """
+    Structure that is copied in O(1): a copy shares all the containers (dictionaries, sets and nested structures)
+    with the original one, and each of them copies a shared container before changing it.
+    So a change costs as much as the containers it touches and never affects other copies.
+    All the changes should be done via `_writable_attr` and `_writable`.
+    """
+
+    def __init__(self):
+        # IDs of containers created by this structure after it was copied last time: only they can be changed in place.
+        # Shared containers are referenced by other copies, so they are alive and their IDs can't be reused.
+        self._owned = set()
+
+    def copy(self):
+        """Get a copy that can be changed independently of the original one"""
+        # after copying all the containers are shared by both copies, so none of them is owned by either of the copies
+        self._owned = set()
+        clone = copy.copy(self)
+        self._owned = set()
+        return clone
+
+    def _writable_attr(self, name):
+        """Get a container held in attribute `name` that can be changed in place"""
+        value = getattr(self, name)
+        if id(value) not in self._owned:
+            value = value.copy()
+            self._owned.add(id(value))
+            setattr(self, name, value)
+        return value
+
+    def _writable(self, parent, key, factory=None):
+        """
+        Get a container held by `parent` (that should be writable itself) under `key` that can be changed in place.
+        Missing container is created by `factory`.
+        """
+        value = parent.get(key)
+        if value is None:
+            value = factory()
+        elif id(value) in self._owned:
+            return value
+        else:
+            value = value.copy()
+        self._owned.add(id(value))
+        parent[key] = value
+        return value
+
+
+class _ShardedDict(_CopyOnWrite):
+    """
+    Dictionary split into SHARDS dictionaries by hashes of its keys, so that a change copies only one of them.
+    Values that are containers should be changed only via `writable`.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.shards = {}
+
+    def __len__(self):
+        return sum(map(len, self.shards.values()))
+
+    def __contains__(self, key):
+        return key in self.shards.get(_shard(key), EMPTY)
+
+    def __getitem__(self, key):
+        values = self.shards.get(_shard(key))
+        if values is None:
+            raise KeyError(key)
+        return values[key]
+
+    def get(self, key, default=None):
+        """Get value of a key or `default` if there's no such key"""
+        values = self.shards.get(_shard(key))
+        return default if values is None else values.get(key, default)
+
+    def values(self):
+        """Get iterator over all the values"""
+        return itertools.chain.from_iterable(values.values() for values in self.shards.values())
+
+    def __setitem__(self, key, value):
+        self._writable(self._writable_attr('shards'), _shard(key), dict)[key] = value
+
+    def __delitem__(self, key):
+        shard = _shard(key)
+        values = self._writable(self._writable_attr('shards'), shard)
+        del values[key]
+        if not values:
+            del self.shards[shard]
+
+    def writable(self, key, factory=None):
+        """Get a container held under `key` that can be changed in place. Missing container is created by `factory`"""
+        return self._writable(self._writable(self._writable_attr('shards'), _shard(key), dict), key, factory)
+
+
+class _ShardedSet(_CopyOnWrite):
+    """Set split into SHARDS sets by hashes of its values, so that a change copies only one of them"""
+
+    def __init__(self, values=()):
+        super().__init__()
+        self.shards = {}
+        self.size = 0
+        for value in values:
+            self.add(value)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.shards.values())
+
+    def __contains__(self, value):
+        return value in self.shards.get(_shard(value), EMPTY)
+
+    def add(self, value):
+        """Add a value to the set"""
+        shard = _shard(value)
+        if value in self.shards.get(shard, EMPTY):
+            return
+        self._writable(self._writable_attr('shards'), shard, set).add(value)
+        self.size += 1
+
+    def discard(self, value):
+        """Remove a value from the set if it's there"""
+        shard = _shard(value)
+        if value not in self.shards.get(shard, EMPTY):
+            return
+        values = self._writable(self._writable_attr('shards'), shard)
+        values.discard(value)
+        if not values:
+            del self.shards[shard]
+        self.size -= 1
+
+
+def _shard(value):
+    """Get a shard of a value in a collection split into SHARDS shards"""
+    return hash(value) % SHARDS
+
+
+class EffectIndex(_CopyOnWrite, PolicyIndex):
+    """
+    Index that keeps allow and deny policies apart: in separate indices created by `factory`,
+    so that policies of each effect can be found separately.
+    """
+
+    def __init__(self, factory):
+        super().__init__()
+        self.allow = factory()
+        self.deny = factory()
+
+    def add(self, policy):
+        self._writable_attr('allow' if policy.allow_access() else 'deny').add(policy)
+
+    def remove(self, uid):
+        self._writable_attr('allow').remove(uid)
+        self._writable_attr('deny').remove(uid)
+
+    def find(self, inquiry):
+        return self.deny.find(inquiry) | self.allow.find(inquiry)
+
+    def find_by_effect(self, inquiry, allow):
+        """Get UIDs of allow (if `allow` is True) or deny policies that can possibly fit the inquiry"""
+        return self.allow.find(inquiry) if allow else self.deny.find(inquiry)
+
+
+class RegexIndex(_CopyOnWrite, PolicyIndex):
+    """
+    Index for policies checked by RegexChecker.
+    For every policy field it keeps a hash-index of literal (not regex-tagged) values
+    and a RegexSet of regex-tagged values, so that all the patterns of a field are matched at once
+    and every distinct pattern is matched only once regardless of the number of policies that use it.
+    Policies that have no string values in some field can never fit, so they are not indexed at all.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.literals = {field: _ShardedDict() for field, _ in FIELDS}
+        self.patterns = {field: _ShardedDict() for field, _ in FIELDS}
+        self.regex_sets = {field: RegexSet() for field, _ in FIELDS}
+        self._indexed = _ShardedDict()
+
+    def add(self, policy):
+        uid = policy.uid
+        entries = []
+        for field, _ in FIELDS:
+            for item in getattr(policy, field, ()):
+                if type(item) != str:
+                    continue
+                if policy.start_tag in item or policy.end_tag in item:
+                    key = (item, policy.start_tag, policy.end_tag)
+                    patterns = self._writable(self._writable_attr('patterns'), field)
+                    if key not in patterns:
+                        self._writable(self._writable_attr('regex_sets'), field).add(key)
+                    patterns.writable(key, set).add(uid)
+                    entries.append((field, True, key))
+                else:
+                    literals = self._writable(self._writable_attr('literals'), field)
+                    literals.writable(item, set).add(uid)
+                    entries.append((field, False, item))
+        self._writable_attr('_indexed')[uid] = tuple(entries)
+
+    def remove(self, uid):
+        if uid not in self._indexed:
+            return
+        entries = self._indexed[uid]
+        del self._writable_attr('_indexed')[uid]
+        for field, is_pattern, key in entries:
+            storage = self._writable(self._writable_attr('patterns' if is_pattern else 'literals'), field)
+            if key not in storage:
+                continue
+            uids = storage.writable(key)
+            uids.discard(uid)
+            if not uids:
+                del storage[key]
+                if is_pattern:
+                    self._writable(self._writable_attr('regex_sets'), field).remove(key)
+
+    def find(self, inquiry):
+        buckets = []
+        for field, attr in FIELDS:
+            value = getattr(inquiry, attr, None)
+            patterns = self.patterns[field]
+            if isinstance(value, str):
+                bucket = [patterns[key] for key in self.regex_sets[field].match(value)]
+                bucket.append(self.literals[field].get(value, EMPTY))
+            else:
+                # Let the checker decide on values of unexpected type
+                bucket = list(patterns.values())
+            if not any(bucket):
+                return set()
+            buckets.append(bucket)
+        return _intersect(buckets)
+
+
+class StringExactIndex(_CopyOnWrite, PolicyIndex):
+    """
+    Index for policies checked by StringExactChecker.
+    For every policy field it keeps a hash-index of string values (stripped of tags as the checker does),
+    so that candidates are found by a lookup of the inquiry value in each field.
+    Policies that have empty strings in some field make the checker fail, so they are always returned for the field.
+    Policies that have no string values in some field can never fit, so they are not indexed at all.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.values = {field: _ShardedDict() for field, _ in FIELDS}
+        self.broken = {field: set() for field, _ in FIELDS}
+        self._indexed = _ShardedDict()
+
+    def add(self, policy):
+        uid = policy.uid
+        entries = []
+        for field, _ in FIELDS:
+            for item in getattr(policy, field, ()):
+                if type(item) != str:
+                    continue
+                if not item:
+                    self._writable(self._writable_attr('broken'), field).add(uid)
+                    entries.append((field, None))
+                    continue
+                if policy.start_tag == item[0] and policy.end_tag == item[-1]:
+                    item = item[1:-1]
+                self._writable(self._writable_attr('values'), field).writable(item, set).add(uid)
+                entries.append((field, item))
+        self._writable_attr('_indexed')[uid] = tuple(entries)
+
+    def remove(self, uid):
+        if uid not in self._indexed:
+            return
+        entries = self._indexed[uid]
+        del self._writable_attr('_indexed')[uid]
+        for field, key in entries:
+            if key is None:
+                self._writable(self._writable_attr('broken'), field).discard(uid)
+                continue
+            values = self._writable(self._writable_attr('values'), field)
+            if key not in values:
+                continue
+            uids = values.writable(key)
+            uids.discard(uid)
+            if not uids:
+                del values[key]
+
+    def find(self, inquiry):
+        buckets = []
+        for field, attr in FIELDS:
+            value = getattr(inquiry, attr, None)
+            if isinstance(value, str):
+                bucket = [self.values[field].get(value, EMPTY), self.broken[field]]
+            else:
+                # Let the checker decide on values of unexpected type
+                bucket = list(self.values[field].values())
+                bucket.append(self.broken[field])
+            if not any(bucket):
+                return set()
+            buckets.append(bucket)
+        return _intersect(buckets)
+
+
+class StringFuzzyIndex(_CopyOnWrite, PolicyIndex):
+    """
+    Index for policies checked by StringFuzzyChecker.
+    For every policy field it keeps string values (stripped of tags as the checker does) in a substring index,
+    so that candidates are the policies whose values contain the inquiry value,
+    found without scanning all the values.
+    Policies that have empty strings in some field make the checker fail, so they are always returned for the field.
+    Policies that have no string values in some field can never fit, so they are not indexed at all.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.values = {field: _ShardedDict() for field, _ in FIELDS}
+        self.substrings = {field: SubstringIndex() for field, _ in FIELDS}
+        self.broken = {field: set() for field, _ in FIELDS}
+        self._indexed = _ShardedDict()
+
+    def add(self, policy):
+        uid = policy.uid
+        entries = []
+        for field, _ in FIELDS:
+            for item in getattr(policy, field, ()):
+                if type(item) != str:
+                    continue
+                if not item:
+                    self._writable(self._writable_attr('broken'), field).add(uid)
+                    entries.append((field, None))
+                    continue
+                if policy.start_tag == item[0] and policy.end_tag == item[-1]:
+                    item = item[1:-1]
+                values = self._writable(self._writable_attr('values'), field)
+                if item not in values:
+                    self._writable(self._writable_attr('substrings'), field).add(item)
+                values.writable(item, set).add(uid)
+                entries.append((field, item))
+        self._writable_attr('_indexed')[uid] = tuple(entries)
+
+    def remove(self, uid):
+        if uid not in self._indexed:
+            return
+        entries = self._indexed[uid]
+        del self._writable_attr('_indexed')[uid]
+        for field, key in entries:
+            if key is None:
+                self._writable(self._writable_attr('broken'), field).discard(uid)
+                continue
+            values = self._writable(self._writable_attr('values'), field)
+            if key not in values:
+                continue
+            uids = values.writable(key)
+            uids.discard(uid)
+            if not uids:
+                del values[key]
+                self._writable(self._writable_attr('substrings'), field).remove(key)
+
+    def find(self, inquiry):
+        buckets = []
+        for field, attr in FIELDS:
+            value = getattr(inquiry, attr, None)
+            values = self.values[field]
+            if isinstance(value, str):
+                bucket = [values[key] for key in self.substrings[field].containing(value)]
+            else:
+                # Let the checker decide on values of unexpected type
+                bucket = list(values.values())
+            bucket.append(self.broken[field])
+            if not any(bucket):
+                return set()
+            buckets.append(bucket)
+        return _intersect(buckets)
+
+
+class SubstringIndex(_CopyOnWrite):
+    """
+    Index of strings that allows to find all the stored strings containing a given substring.
+    Every stored string is indexed by all its substrings of up to `gram_size` characters (n-grams),
+    so a short substring is found by a single lookup, and a longer one is looked up by its n-gram
+    that is the rarest among the stored strings - only strings having it are checked for containing the substring.
+    Strings of n-grams that are common to more than `shard_above` strings are kept in sharded sets,
+    so that a change copies only a small part of them.
+    """
+
+    shard_above = 4 * SHARDS
+
+    def __init__(self, gram_size=3):
+        super().__init__()
+        self.gram_size = gram_size
+        self.grams = {}
+        self.strings = _ShardedSet()
+
+    def __len__(self):
+        return len(self.strings)
+
+    def add(self, string):
+        """Index a string by all its n-grams"""
+        if string in self.strings:
+            return
+        self._writable_attr('strings').add(string)
+        grams = self._writable_attr('grams')
+        for gram in self._grams_of(string):
+            strings = self._writable(grams, gram, set)
+            strings.add(string)
+            if isinstance(strings, set) and len(strings) > self.shard_above:
+                strings = grams[gram] = _ShardedSet(strings)
+                self._owned.add(id(strings))
+
+    def remove(self, string):
+        """Remove a string from the index if it's there"""
+        if string not in self.strings:
+            return
+        self._writable_attr('strings').discard(string)
+        grams = self._writable_attr('grams')
+        for gram in self._grams_of(string):
+            strings = self._writable(grams, gram)
+            strings.discard(string)
+            if not strings:
+                del grams[gram]
+
+    def containing(self, substring):
+        """Get all the stored strings that contain a given substring"""
+        if not substring:
+            return self.strings
+        if len(substring) <= self.gram_size:
+            return self.grams.get(substring, EMPTY)
+        size = self.gram_size
+        rarest = None
+        for i in range(len(substring) - size + 1):
+            strings = self.grams.get(substring[i:i+size])
+            if not strings:
+                return EMPTY
+            if rarest is None or len(strings) < len(rarest):
+                rarest = strings
+        return [string for string in rarest if substring in string]
+
+    def _grams_of(self, string):
+        """Get all distinct substrings of a string of up to `gram_size` characters"""
+        return {
+            string[i:i+size]
+            for size in range(1, self.gram_size + 1)
+            for i in range(len(string) - size + 1)
+        }
+
+
+class RegexSet(_CopyOnWrite):
+    """
+    Set of policy patterns that are matched against a string all at once.
+    Patterns are grouped by their literal prefix (a part before the first tag) in a PrefixTrie,
+    so only patterns whose prefix is a prefix of the string are ever run.
+    Patterns of a group are stored in chunks. Each chunk is compiled into one regular expression
+    (alternation of its patterns), so the whole chunk is discarded by a single regex run if none of its patterns match.
+    Chunks are (re)compiled lazily and only if they were changed.
+    """
+
+    chunk_size = 64
+
+    # Numbered and named back-references change their meaning when patterns are joined together
+    _not_joinable = re.compile(r'\\[1-9]|\(\?P[=<]')
+
+    def __init__(self):
+        super().__init__()
+        self.groups = PrefixTrie()
+        self.singles = {}
+        self.failing = set()
+        self._prefix_of = _ShardedDict()
+
+    def add(self, key):
+        """Add a pattern defined by a key: tuple of (phrase, start_tag, end_tag)"""
+        try:
+            regex = regex_cache.compile(*key)
+            prefix = get_literal_prefix(*key)
+        except InvalidPatternError:
+            # RegexChecker treats invalid patterns as not matching ones
+            log.debug('Pattern %s is invalid and will not be matched', key[0])
+            return
+        except re.error:
+            # RegexChecker will raise an error on such pattern, so it always should be returned as matched
+            log.warning('Pattern %s can not be compiled', key[0])
+            self._writable_attr('failing').add(key)
+            return
+        if self._not_joinable.search(regex.pattern):
+            self._writable_attr('singles')[key] = regex
+            return
+        self._writable_group(prefix).add(key, regex)
+        self._writable_attr('_prefix_of')[key] = prefix
+
+    def remove(self, key):
+        """Remove a pattern by its key"""
+        if key in self.singles:
+            del self._writable_attr('singles')[key]
+        if key in self.failing:
+            self._writable_attr('failing').discard(key)
+        if key in self._prefix_of:
+            prefix = self._prefix_of[key]
+            del self._writable_attr('_prefix_of')[key]
+            group = self._writable_group(prefix)
+            group.remove(key)
+            if not group.chunks:
+                self.groups.remove(prefix)
+
+    def match(self, value):
+        """Get keys of all patterns that match the value"""
+        found = list(self.failing)
+        for key, regex in self.singles.items():
+            if regex.match(value):
+                found.append(key)
+        for group in self.groups.prefixes_of(value):
+            found.extend(group.match(value))
+        return found
+
+    def __len__(self):
+        return len(self._prefix_of) + len(self.singles) + len(self.failing)
+
+    def _writable_group(self, prefix):
+        """Get a group of patterns with a given prefix that can be changed in place. Missing group is created"""
+        groups = self._writable_attr('groups')
+        group = groups.get(prefix)
+        if group is None:
+            group = _PatternGroup(self.chunk_size)
+        elif id(group) in self._owned:
+            return group
+        else:
+            group = group.copy()
+        self._owned.add(id(group))
+        groups.set(prefix, group)
+        return group
+
+
+class _PatternGroup(_CopyOnWrite):
+    """Patterns of RegexSet that have the same literal prefix"""
+
+    def __init__(self, chunk_size):
+        super().__init__()
+        self.chunk_size = chunk_size
+        # chunks by their numbers: new patterns go to the last one
+        self.chunks = {}
+        self._chunk_of = _ShardedDict()
+        self._last = 0
+
+    def add(self, key, regex):
+        """Add a compiled pattern stored under `key` to the last chunk or to a new one if the last chunk is full"""
+        last = self.chunks.get(self._last)
+        if last is None or len(last.patterns) >= self.chunk_size:
+            self._last += 1
+        self._writable(self._writable_attr('chunks'), self._last, _Chunk).add(key, regex)
+        self._writable_attr('_chunk_of')[key] = self._last
+
+    def remove(self, key):
+        """Remove a pattern stored under `key` from its chunk"""
+        number = self._chunk_of[key]
+        del self._writable_attr('_chunk_of')[key]
+        chunks = self._writable_attr('chunks')
+        chunk = self._writable(chunks, number)
+        chunk.remove(key)
+        if not chunk.patterns:
+            del chunks[number]
+
+    def match(self, value):
+        """Get keys of all the patterns of the group that match the value"""
+        found = []
+        for chunk in self.chunks.values():
+            found.extend(chunk.match(value))
+        return found
+
+
+class _Chunk:
+    """
+    A chunk of RegexSet patterns.
+    Joined regex is compiled lazily by readers, so it's kept in a single attribute that is read and set atomically:
+    a copy of the chunk gets either a regex compiled from the same patterns or NOT_COMPILED.
+    """
+
+    NOT_COMPILED = object()
+
+    def __init__(self, patterns=None):
+        self.patterns = {} if patterns is None else patterns
+        # joined regex of the patterns, None if they can't be joined
+        self.regex = self.NOT_COMPILED
+
+    def add(self, key, regex):
+        """Add a compiled pattern stored under `key`"""
+        self.patterns[key] = regex
+        self.regex = self.NOT_COMPILED
+
+    def remove(self, key):
+        """Remove a pattern stored under `key`"""
+        del self.patterns[key]
+        self.regex = self.NOT_COMPILED
+
+    def match(self, value):
+        """Get keys of all the patterns of the chunk that match the value"""
+        joined = self.regex
+        if joined is self.NOT_COMPILED:
+            joined = self.regex = self._compile()
+        if joined is not None and not joined.match(value):
+            return []
+        return [key for key, regex in self.patterns.items() if regex.match(value)]
+
+    def _compile(self):
+        if len(self.patterns) > 1:
+            try:
+                return re.compile('|'.join('(?:%s)' % r.pattern for r in self.patterns.values()))
+            except re.error:
+                log.debug('Patterns chunk can not be joined. Patterns will be matched one by one')
+        return None
+
+    def copy(self):
+        """Get a copy of the chunk that can be changed independently of the original one"""
+        return _Chunk(dict(self.patterns))
+
+
+class RulesIndex(_CopyOnWrite, PolicyIndex):
+    """
+    Index for policies checked by RulesChecker.
+    Only rule-based policies can fit RulesChecker, so only they are indexed.
+    Rules `Eq` and `In` are satisfied only by values equal to the ones they hold,
+    so for every policy field and the context it keeps a hash-index of (key, value) pairs required by such rules.
+    Comparison rules `Greater`, `Less`, `GreaterOrEqual`, `LessOrEqual` with numeric values (also composed with `And`)
+    are satisfied only by numbers from some interval, so for every key it keeps an IntervalTree of such intervals.
+    An item of a field is indexed by one of its rules: by the rule itself if the item is a Rule
+    or by a key of the dictionary and its rule if the item is a dictionary.
+    Policies that have items that can't be indexed this way are kept in a bucket that is always returned for the field.
+    Items that can never fit (e.g. strings or empty dictionaries) are not indexed at all.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # field -> key -> value -> UIDs
+        self.values = {field: {} for field, _ in RULE_FIELDS}
+        # field -> key -> IntervalTree
+        self.intervals = {field: {} for field, _ in RULE_FIELDS}
+        # field -> UIDs of policies not indexed by values of the field
+        self.others = {field: set() for field, _ in RULE_FIELDS}
+        self._indexed = _ShardedDict()
+
+    def add(self, policy):
+        if policy.type != TYPE_RULE_BASED:
+            return
+        entries = []
+        for field, _ in RULE_FIELDS:
+            if field == 'context':
+                items = [policy.context] if policy.context else None
+            else:
+                items = getattr(policy, field, ())
+            field_entries = _rules_index_entries(items, is_context=field == 'context')
+            if field_entries is None:
+                self._writable(self._writable_attr('others'), field).add(policy.uid)
+                entries.append((field, None, None))
+                continue
+            for key, value in field_entries:
+                if type(value) == Interval:
+                    trees = self._writable(self._writable_attr('intervals'), field)
+                    self._writable(trees, key, IntervalTree).add(value, policy.uid)
+                else:
+                    by_key = self._writable(self._writable_attr('values'), field)
+                    self._writable(by_key, key, _ShardedDict).writable(value, set).add(policy.uid)
+                entries.append((field, key, value))
+        self._writable_attr('_indexed')[policy.uid] = tuple(entries)
+
+    def remove(self, uid):
+        if uid not in self._indexed:
+            return
+        entries = self._indexed[uid]
+        del self._writable_attr('_indexed')[uid]
+        for field, key, value in entries:
+            if key is None:
+                self._writable(self._writable_attr('others'), field).discard(uid)
+                continue
+            if type(value) == Interval:
+                trees = self._writable(self._writable_attr('intervals'), field)
+                if key in trees:
+                    tree = self._writable(trees, key)
+                    tree.remove(value, uid)
+                    if not tree:
+                        del trees[key]
+                continue
+            by_key = self._writable(self._writable_attr('values'), field)
+            if key not in by_key or value not in by_key[key]:
+                continue
+            by_value = self._writable(by_key, key)
+            uids = by_value.writable(value)
+            uids.discard(uid)
+            if not uids:
+                del by_value[value]
+                if not by_value:
+                    del by_key[key]
+
+    def find(self, inquiry):
+        buckets = []
+        for field, attr in RULE_FIELDS:
+            what = getattr(inquiry, attr, None)
+            is_what_dict = isinstance(what, dict)
+            bucket = [self.others[field]]
+            for key, by_value in self.values[field].items():
+                if key is WHOLE_VALUE:
+                    value = what
+                elif is_what_dict and key in what:
+                    value = what[key]
+                else:
+                    continue
+                if type(value) in LITERAL_TYPES:
+                    bucket.append(by_value.get(value, EMPTY))
+                else:
+                    # Let the checker decide on values that may be equal to literals without having the same hash
+                    bucket.extend(by_value.values())
+            for key, tree in self.intervals[field].items():
+                if key is WHOLE_VALUE:
+                    value = what
+                elif is_what_dict and key in what:
+                    value = what[key]
+                else:
+                    continue
+                if type(value) in NUMBER_TYPES:
+                    bucket.extend(tree.find(value))
+                else:
+                    # Let the checker decide on values that may be comparable to numbers
+                    bucket.extend(tree.intervals.values())
+            if not any(bucket):
+                return set()
+            buckets.append(bucket)
+        return _intersect(buckets)
+
+
+# Policy fields checked by RulesChecker and the context along with the corresponding Inquiry attributes.
+RULE_FIELDS = FIELDS + (('context', 'context'),)
+
+# Key of RulesIndex values required from the whole Inquiry attribute and not from its key
+WHOLE_VALUE = object()
+
+# Types of values that are equal only if their hashes are equal
+LITERAL_TYPES = frozenset((str, bytes, int, float, bool, type(None)))
+
+# Types of values that are indexed by intervals
+NUMBER_TYPES = frozenset((int, float, bool))
+
+INFINITY = float('inf')
+
+
+def _rules_index_entries(items, is_context=False):
+    """
+    Get (key, value) pairs by which items of a policy field should be indexed. Value is either a literal or an Interval.
+    Returns None if the field can't be indexed by values.
+    """
+    if items is None:
+        return None
+    entries = []
+    for item in items:
+        if type(item) == dict:
+            required = [(key, _required_values(rule)) for key, rule in item.items()]
+            required = [(key, values) for key, values in required if values is not None]
+            if not required:
+                # empty dictionary of a policy field never fits
+                if not item and not is_context:
+                    continue
+                return None
+            # hash lookup is cheaper than interval one
+            key, values = min(required, key=lambda pair: any(type(v) == Interval for v in pair[1]))
+        elif callable(getattr(item, 'satisfied', '')):
+            key, values = WHOLE_VALUE, _required_values(item)
+            if values is None:
+                return None
+        else:
+            continue
+        entries.extend((key, value) for value in values)
+    return entries
+
+
+def _required_values(rule):
+    """
+    Get values one of which is required to satisfy the rule or None if any value may satisfy it.
+    Values are either literals or Intervals.
+    """
+    if type(rule) == Eq:
+        values = (rule.val,)
+    elif type(rule) == In:
+        values = rule.data
+    else:
+        interval = _required_interval(rule)
+        if interval is None:
+            return None
+        # empty interval can't be satisfied by any value
+        return (interval,) if interval else ()
+    if not all(type(value) in LITERAL_TYPES for value in values):
+        return None
+    return tuple(values)
+
+
+def _required_interval(rule):
+    """Get Interval of numbers that can satisfy the rule or None if the rule may be satisfied by any value"""
+    rule_type = type(rule)
+    if rule_type in _BOUNDS:
+        val = rule.val
+        # NaN can't be ordered
+        if type(val) not in NUMBER_TYPES or math.isnan(val):
+            return None
+        is_low, closed = _BOUNDS[rule_type]
+        if is_low:
+            return Interval(val, closed, INFINITY, True)
+        return Interval(-INFINITY, True, val, closed)
+    if rule_type == And:
+        intervals = [i for i in map(_required_interval, rule.rules) if i is not None]
+        if not intervals:
+            return None
+        result = intervals[0]
+        for interval in intervals[1:]:
+            result = result.intersect(interval)
+        return result
+    return None
+
+
+# Comparison rules that define a bound of an interval: is it a lower bound, is it included in interval
+_BOUNDS = {
+    Greater: (True, False),
+    GreaterOrEqual: (True, True),
+    Less: (False, False),
+    LessOrEqual: (False, True),
+}
+
+
+class Interval(namedtuple('Interval', ['low', 'low_closed', 'high', 'high_closed'])):
+    """Interval of numbers with bounds that are either included in it (closed) or not"""
+
+    __slots__ = ()
+
+    def __contains__(self, number):
+        return (self.low < number or self.low_closed and self.low == number) and \
+            (number < self.high or self.high_closed and number == self.high)
+
+    def __bool__(self):
+        return self.low < self.high or self.low == self.high and self.low_closed and self.high_closed
+
+    def intersect(self, other):
+        """Get intersection with another interval"""
+        if other.low > self.low or other.low == self.low and not other.low_closed:
+            low, low_closed = other.low, other.low_closed
+        else:
+            low, low_closed = self.low, self.low_closed
+        if other.high < self.high or other.high == self.high and not other.high_closed:
+            high, high_closed = other.high, other.high_closed
+        else:
+            high, high_closed = self.high, self.high_closed
+        return Interval(low, low_closed, high, high_closed)
+
+
+class IntervalTree(_CopyOnWrite):
+    """
+    Intervals mapped to UIDs of policies, that allows to find all the intervals containing a number
+    in O(log n + k) time, where k is the number of found intervals.
+    The tree is a centered interval tree: every node keeps intervals that contain its center
+    sorted by their low and by their high bounds, intervals to the left and to the right of the center
+    go to the child nodes. The tree is (re)built lazily by readers and only if intervals were changed,
+    so its root is kept in a single attribute that is read and set atomically:
+    a copy of the tree gets either a root built from the same intervals or NOT_BUILT.
+    """
+
+    NOT_BUILT = object()
+
+    def __init__(self):
+        super().__init__()
+        self.intervals = {}
+        self.root = None
+
+    def add(self, interval, uid):
+        """Map an interval to a policy UID"""
+        intervals = self._writable_attr('intervals')
+        if interval not in intervals:
+            self.root = self.NOT_BUILT
+        self._writable(intervals, interval, set).add(uid)
+
+    def remove(self, interval, uid):
+        """Remove mapping of an interval to a policy UID. Interval that is mapped to no UIDs is removed"""
+        if interval not in self.intervals:
+            return
+        intervals = self._writable_attr('intervals')
+        uids = self._writable(intervals, interval)
+        uids.discard(uid)
+        if not uids:
+            del intervals[interval]
+            self.root = self.NOT_BUILT
+
+    def find(self, number):
+        """Get sets of UIDs of all the intervals that contain the number"""
+        node = self.root
+        if node is self.NOT_BUILT:
+            node = self.root = _IntervalNode.build(list(self.intervals))
+        found = []
+        while node is not None:
+            if number < node.center:
+                for interval in node.by_low:
+                    if interval.low > number:
+                        break
+                    if number in interval:
+                        found.append(self.intervals[interval])
+                node = node.left
+            elif number > node.center:
+                for interval in node.by_high:
+                    if interval.high < number:
+                        break
+                    if number in interval:
+                        found.append(self.intervals[interval])
+                node = node.right
+            else:
+                found.extend(self.intervals[interval] for interval in node.by_low if number in interval)
+                break
+        return found
+
+    def __len__(self):
+        return len(self.intervals)
+
+
+class _IntervalNode:
+    """Node of IntervalTree"""
+
+    __slots__ = ('center', 'by_low', 'by_high', 'left', 'right')
+
+    def __init__(self, center, by_low, by_high, left, right):
+        self.center = center
+        self.by_low = by_low
+        self.by_high = by_high
+        self.left = left
+        self.right = right
+
+    @classmethod
+    def build(cls, intervals):
+        """Build a tree of intervals and return its root"""
+        if not intervals:
+            return None
+        bounds = sorted(b for i in intervals for b in (i.low, i.high) if b not in (INFINITY, -INFINITY))
+        center = bounds[len(bounds) // 2] if bounds else 0
+        here, left, right = [], [], []
+        for interval in intervals:
+            if interval.high < center:
+                left.append(interval)
+            elif interval.low > center:
+                right.append(interval)
+            else:
+                here.append(interval)
+        return cls(
+            center,
+            sorted(here, key=lambda i: i.low),
+            sorted(here, key=lambda i: i.high, reverse=True),
+            cls.build(left),
+            cls.build(right),
+        )
+
+
+def _intersect(buckets):
+    """
+    Intersect unions of sets. Each bucket is a tuple of sets which union represents candidates for a policy field.
+    Iterates only over the smallest bucket, so that no large unions are ever built.
+    """
+    buckets = sorted(buckets, key=lambda sets: sum(map(len, sets)))
+    smallest, rest = buckets[0], buckets[1:]
+    return {
+        uid for uids in smallest for uid in uids
+        if all(any(uid in s for s in sets) for sets in rest)
+    }
+
+
+class PrefixTrie(_CopyOnWrite):
+    """
+    Trie that maps string prefixes to values.
+    Allows to find values of all the stored prefixes of a given string in O(length of the string).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.root = _TrieNode()
+        self._size = 0
+
+    def set(self, prefix, value):
+        """Set value for a prefix"""
+        node = self._writable_attr('root')
+        for char in prefix:
+            node = self._writable(node.children, char, _TrieNode)
+        if node.value is _TrieNode.EMPTY:
+            self._size += 1
+        node.value = value
+
+    def get(self, prefix, default=None):
+        """Get value of a prefix"""
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return default
+        return default if node.value is _TrieNode.EMPTY else node.value
+
+    def remove(self, prefix):
+        """Remove a prefix with its value. Nodes that become useless are pruned"""
+        if self.get(prefix, _TrieNode.EMPTY) is _TrieNode.EMPTY:
+            return
+        path, node = [], self._writable_attr('root')
+        for char in prefix:
+            path.append((node, char))
+            node = self._writable(node.children, char)
+        node.value = _TrieNode.EMPTY
+        self._size -= 1
+        for parent, char in reversed(path):
+            child = parent.children[char]
+            if child.children or child.value is not _TrieNode.EMPTY:
+                break
+            del parent.children[char]
+
+    def prefixes_of(self, string):
+        """Yield values of all the stored prefixes of a string, the shortest prefix goes first"""
+        node = self.root
+        if node.value is not _TrieNode.EMPTY:
+            yield node.value
+        for char in string:
+            node = node.children.get(char)
+            if node is None:
+                return
+            if node.value is not _TrieNode.EMPTY:
+                yield node.value
+
+    def __len__(self):
+        return self._size
+
+
+class _TrieNode:
+    """Node of PrefixTrie"""
+
+    EMPTY = object()
+
+    __slots__ = ('children', 'value')
+
+    def __init__(self, children=None, value=EMPTY):
+        self.children = {} if children is None else children
+        self.value = value
+
+    def copy(self):
+        """Get a copy of the node that shares its children and value with the original one"""
+        return _TrieNode(dict(self.children), self.value)
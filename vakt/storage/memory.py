@@ -6,18 +6,42 @@ import threading
 import logging
 
 from ..storage.abc import Storage
+from ..storage.index import EffectIndex, RegexIndex, RulesIndex, StringExactIndex, StringFuzzyIndex
 from ..exceptions import PolicyExistsError
+from ..checker import RegexChecker, RulesChecker, StringExactChecker, StringFuzzyChecker
+from ..effects import ALLOW_ACCESS
 
 
 log = logging.getLogger(__name__)
 
 
 class MemoryStorage(Storage):
-    """Stores all policies in memory"""
+    """
+    Stores all policies in memory.
+    Keeps indices of policies, so that `find_for_inquiry` returns only policies that can possibly fit the inquiry
+    for RegexChecker, RulesChecker, StringExactChecker and StringFuzzyChecker.
+    For other checkers, including subclasses of those that may check policies differently, all policies are returned.
+    Allow and deny policies are indexed apart, so that they are found separately by `find_for_inquiry_by_effect`.
+
+    Reads never take a lock: they are served from an immutable snapshot of policies and their indices.
+    Writers change a copy of policies and indices under a lock and publish it as a new snapshot at the end of the write,
+    so reads never wait for writes, always see a consistent set of policies and see every finished write.
+    Policies and indices of a published snapshot are never changed: a write copies the parts of them it changes.
+    Readers only fill lazily built caches of indices (joined regexes, interval trees) that are each read and set
+    by a single atomic assignment, so a copy of an index never misses its patterns or intervals.
+    """
 
     def __init__(self):
         self.policies = {}
         self.lock = threading.Lock()
+        self.indices = {
+            RegexChecker: EffectIndex(RegexIndex),
+            RulesChecker: EffectIndex(RulesIndex),
+            StringExactChecker: EffectIndex(StringExactIndex),
+            StringFuzzyChecker: EffectIndex(StringFuzzyIndex),
+        }
+        self._snapshot = _Snapshot(self.policies, self.indices)
+        self._shared = True
 
     def add(self, policy):
         uid = policy.uid
@@ -25,15 +49,38 @@ class MemoryStorage(Storage):
             if uid in self.policies:
                 log.error('Error trying to create already existing policy with UID=%s', uid)
                 raise PolicyExistsError(uid)
+            self._prepare_write()
             self.policies[uid] = policy
+            self._index(policy)
+            self._publish()
             log.info('Added Policy: %s', policy)
+        self._notify_change()
+
+    def add_many(self, policies):
+        results = []
+        with self.lock:
+            for policy in policies:
+                uid = policy.uid
+                if uid in self.policies:
+                    log.error('Error trying to create already existing policy with UID=%s', uid)
+                    results.append(PolicyExistsError(uid))
+                    continue
+                self._prepare_write()
+                self.policies[uid] = policy
+                self._index(policy)
+                results.append(None)
+            self._publish()
+            log.info('Added %d Policies', results.count(None))
+        if None in results:
+            self._notify_change()
+        return results
 
     def get(self, uid):
-        return self.policies.get(uid)
+        return self._read().policies.get(uid)
 
     def get_all(self, limit, offset):
         self._check_limit_and_offset(limit, offset)
-        result = [v for v in self.policies.values()]
+        result = [v for v in self._read().policies.values()]
         if offset > len(result):
             return []
         if limit == 0:
@@ -41,14 +88,104 @@ class MemoryStorage(Storage):
         return result[offset:limit+offset]
 
     def find_for_inquiry(self, inquiry, checker=None):
-        with self.lock:
-            return self.policies.values()
+        snapshot = self._read()
+        index = snapshot.indices.get(type(checker))
+        if index is not None:
+            return [snapshot.policies[uid] for uid in index.find(inquiry)]
+        return list(snapshot.policies.values())
+
+    def find_for_inquiry_by_effect(self, inquiry, effect, checker=None):
+        snapshot = self._read()
+        allow = effect == ALLOW_ACCESS
+        index = snapshot.indices.get(type(checker))
+        if index is not None:
+            return [snapshot.policies[uid] for uid in index.find_by_effect(inquiry, allow)]
+        return [p for p in snapshot.policies.values() if p.allow_access() == allow]
 
     def update(self, policy):
-        self.policies[policy.uid] = policy
-        log.info('Updated Policy with UID=%s. New value is: %s', policy.uid, policy)
+        with self.lock:
+            self._prepare_write()
+            self.policies[policy.uid] = policy
+            self._unindex(policy.uid)
+            self._index(policy)
+            self._publish()
+            log.info('Updated Policy with UID=%s. New value is: %s', policy.uid, policy)
+        self._notify_change()
+
+    def update_many(self, policies):
+        results = []
+        with self.lock:
+            for policy in policies:
+                self._prepare_write()
+                self.policies[policy.uid] = policy
+                self._unindex(policy.uid)
+                self._index(policy)
+                results.append(None)
+            self._publish()
+            log.info('Updated %d Policies', len(results))
+        if results:
+            self._notify_change()
+        return results
 
     def delete(self, uid):
-        if uid in self.policies:
+        with self.lock:
+            if uid not in self.policies:
+                return
+            self._prepare_write()
             del self.policies[uid]
+            self._unindex(uid)
+            self._publish()
             log.info('Policy with UID %s was deleted', uid)
+        self._notify_change()
+
+    def delete_many(self, uids):
+        results, deleted = [], 0
+        with self.lock:
+            for uid in uids:
+                results.append(None)
+                if uid not in self.policies:
+                    continue
+                self._prepare_write()
+                del self.policies[uid]
+                self._unindex(uid)
+                deleted += 1
+            self._publish()
+            log.info('%d Policies were deleted', deleted)
+        if deleted:
+            self._notify_change()
+        return results
+
+    def _read(self):
+        """Get the latest published snapshot of policies. Never blocks"""
+        return self._snapshot
+
+    def _prepare_write(self):
+        """Should be called under the lock before any change of policies or indices"""
+        if self._shared:
+            self.policies = dict(self.policies)
+            self.indices = {checker_class: index.copy() for checker_class, index in self.indices.items()}
+            self._shared = False
+
+    def _publish(self):
+        """Should be called under the lock at the end of a write: makes its changes (if any) visible to reads"""
+        if not self._shared:
+            self._snapshot = _Snapshot(self.policies, self.indices)
+            self._shared = True
+
+    def _index(self, policy):
+        for index in self.indices.values():
+            index.add(policy)
+
+    def _unindex(self, uid):
+        for index in self.indices.values():
+            index.remove(uid)
+
+
+class _Snapshot:
+    """Immutable state of MemoryStorage: policies by their UIDs and indices of policies by checker classes"""
+
+    __slots__ = ('policies', 'indices')
+
+    def __init__(self, policies, indices):
+        self.policies = policies
+        self.indices = indices
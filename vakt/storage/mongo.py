@@ -2,33 +2,60 @@
 MongoDB Storage and Migrations for Policies.
 """
 
+import re
 import logging
 import copy
+import datetime
+import multiprocessing
 from abc import ABCMeta
+from collections import namedtuple
 
 import bson.json_util as b_json
-from pymongo.errors import DuplicateKeyError
+from bson.objectid import ObjectId
+from bson.decimal128 import Decimal128
+from pymongo import UpdateOne, DeleteOne, ReplaceOne
+from pymongo.errors import DuplicateKeyError, BulkWriteError, WriteError
 import jsonpickle.tags
 
-from ..storage.abc import Storage
+from .. import codec
+from ..storage.abc import BaseStorage, Storage
 from ..storage.migration import Migration, MigrationSet
 from ..exceptions import PolicyExistsError, UnknownCheckerType, Irreversible
 from ..policy import Policy
 from ..rules.base import Rule
 from ..checker import StringExactChecker, StringFuzzyChecker, RegexChecker, RulesChecker
 from ..policy import TYPE_STRING_BASED, TYPE_RULE_BASED
+from ..effects import ALLOW_ACCESS
+from ..cache import regex_cache
+from ..parser import get_literal_prefix
+from ..exceptions import InvalidPatternError
 
 
 DEFAULT_COLLECTION = 'vakt_policies'
 DEFAULT_MIGRATION_COLLECTION = 'vakt_policies_migration_version'
+DEFAULT_CHECKPOINT_COLLECTION = 'vakt_policies_migration_checkpoint'
 
 log = logging.getLogger(__name__)
 
 
-class MongoStorage(Storage):
-    """Stores all policies in MongoDB"""
+# Bulk write: results for each policy (errors of policies that can't be prepared), requests,
+# UIDs of policies of the requests and positions of results of the requests.
+_Bulk = namedtuple('_Bulk', ['results', 'requests', 'uids', 'positions'])
 
-    def __init__(self, client, db_name, collection=DEFAULT_COLLECTION):
+
+class MongoPolicies(BaseStorage):
+    """
+    Representation of Policies as MongoDB documents and queries for them,
+    so that the blocking and the asyncio MongoDB storages store Policies in the same way.
+    Along with each policy its literal prefixes are stored,
+    so that policies for RegexChecker are prefiltered by MongoDB.
+
+    batch_size - number of documents in each batch of a cursor returned by MongoDB (0 means MongoDB's default).
+    decision_only - fetch only the fields of policies needed for making a decision in `find_for_inquiry`,
+    so that policies found for an inquiry have no description.
+    """
+
+    def __init__(self, client, db_name, collection=DEFAULT_COLLECTION, batch_size=0, decision_only=False):
         self.client = client
         self.database = self.client[db_name]
         self.collection = self.database[collection]
@@ -37,42 +64,13 @@ class MongoStorage(Storage):
             'subjects',
             'resources',
         ]
-
-    def add(self, policy):
-        try:
-            self.collection.insert_one(self.__prepare_doc(policy))
-        except DuplicateKeyError:
-            log.error('Error trying to create already existing policy with UID=%s.', policy.uid)
-            raise PolicyExistsError(policy.uid)
-        log.info('Added Policy: %s', policy)
-
-    def get(self, uid):
-        ret = self.collection.find_one(uid)
-        if not ret:
-            return None
-        return self.__prepare_from_doc(ret)
-
-    def get_all(self, limit, offset):
-        self._check_limit_and_offset(limit, offset)
-        cur = self.collection.find(limit=limit, skip=offset)
-        return self.__feed_policies(cur)
-
-    def find_for_inquiry(self, inquiry, checker=None):
-        q_filter = self._create_filter(inquiry, checker)
-        cur = self.collection.find(q_filter)
-        return self.__feed_policies(cur)
-
-    def update(self, policy):
-        uid = policy.uid
-        self.collection.update_one(
-            {'_id': uid},
-            {"$set": self.__prepare_doc(policy)},
-            upsert=False)
-        log.info('Updated Policy with UID=%s. New value is: %s', uid, policy)
-
-    def delete(self, uid):
-        self.collection.delete_one({'_id': uid})
-        log.info('Deleted Policy with UID=%s.', uid)
+        self.prefixes_field = 'prefixes'
+        self.prefix_max_length = 128
+        self.batch_size = batch_size
+        self.decision_only = decision_only
+        # Fields that are not needed for creating policies
+        self.projection = {'_id': False, self.prefixes_field: False}
+        self.decision_projection = dict(self.projection, description=False)
 
     def _create_filter(self, inquiry, checker):
         """
@@ -86,7 +84,7 @@ class MongoStorage(Storage):
             # Doing it via Javascript function gives no benefits over Vakt final Guard check.
             # See: https://jira.mongodb.org/browse/SERVER-11947
         elif isinstance(checker, RegexChecker):
-            return {'type': TYPE_STRING_BASED}
+            return self.__prefixes_query(inquiry)
         elif isinstance(checker, RulesChecker):
             return {'type': TYPE_RULE_BASED}
         elif not checker:
@@ -95,6 +93,20 @@ class MongoStorage(Storage):
             log.error('Provided Checker type is not supported.')
             raise UnknownCheckerType(checker)
 
+    def _create_effect_filter(self, inquiry, effect, checker):
+        """
+        Returns query-filter based on the checker type that finds only policies of the given effect:
+        ALLOW_ACCESS - policies that allow access, DENY_ACCESS - all the other ones.
+        """
+        q_filter = self._create_filter(inquiry, checker)
+        if effect == ALLOW_ACCESS:
+            effect_filter = {'effect': ALLOW_ACCESS}
+        else:
+            effect_filter = {'effect': {'$ne': ALLOW_ACCESS}}
+        if not q_filter:
+            return effect_filter
+        return {'$and': [effect_filter, q_filter]}
+
     def __string_query_on_conditions(self, operator, get_value):
         """
         Construct MongoDB query.
@@ -114,31 +126,226 @@ class MongoStorage(Storage):
             )
         return {"$and": conditions}
 
-    @staticmethod
-    def __prepare_doc(policy):
+    def __prefixes_query(self, inquiry):
+        """
+        Construct MongoDB query that finds policies which literal prefixes are prefixes of the inquiry values.
+        """
+        conditions = [
+            {'type': TYPE_STRING_BASED}
+        ]
+        for field in self.condition_fields:
+            value = getattr(inquiry, field.rstrip('s'))
+            # Let the checker decide on values of unexpected type
+            if not isinstance(value, str):
+                continue
+            keys = ['^' + value[:i] for i in range(min(len(value), self.prefix_max_length) + 1)]
+            if len(value) <= self.prefix_max_length:
+                keys.append('=' + value)
+            # Policies stored before prefixes were introduced don't have them, so they are always returned
+            keys.append(None)
+            conditions.append({'%s.%s' % (self.prefixes_field, field): {'$in': keys}})
+        return {"$and": conditions}
+
+    def _get_prefixes(self, policy):
+        """
+        Get literal prefixes of policy values for each condition field.
+        Literal values are stored as '=value', regex-tagged values as '^prefix',
+        where prefix is a part of a value before the first tag. Too long values are stored as prefixes of them.
+        """
+        prefixes = {}
+        for field in self.condition_fields:
+            keys = set()
+            for item in getattr(policy, field, []):
+                if type(item) != str:
+                    continue
+                if policy.start_tag not in item and policy.end_tag not in item:
+                    if len(item) <= self.prefix_max_length:
+                        keys.add('=' + item)
+                        continue
+                    prefix = item
+                else:
+                    try:
+                        regex_cache.compile(item, policy.start_tag, policy.end_tag)
+                        prefix = get_literal_prefix(item, policy.start_tag, policy.end_tag)
+                    except InvalidPatternError:
+                        # RegexChecker treats invalid patterns as not matching ones
+                        continue
+                    except re.error:
+                        # RegexChecker will raise an error on such pattern, so it should always be found
+                        prefix = ''
+                keys.add('^' + prefix[:self.prefix_max_length])
+            prefixes[field] = sorted(keys)
+        return prefixes
+
+    def _prepare_doc(self, policy):
         """
         Prepare Policy object as a document for insertion.
         """
-        # todo - add dict inheritance
-        doc = b_json.loads(policy.to_json())
+        doc = codec.encode(policy._data())
         doc['_id'] = policy.uid
+        doc[self.prefixes_field] = self._get_prefixes(policy)
         return doc
 
-    @staticmethod
-    def __prepare_from_doc(doc):
+    def _prepare_from_doc(self, doc):
         """
         Prepare Policy object as a return from MongoDB.
         """
-        # todo - add dict inheritance
-        del doc['_id']
-        return Policy.from_json(b_json.dumps(doc))
+        doc.pop('_id', None)
+        doc.pop(self.prefixes_field, None)
+        return Policy.from_dict(codec.decode(doc))
+
+    def _prepare_update(self, policy):
+        """
+        Prepare update request of a Policy for a bulk write.
+        """
+        return UpdateOne({'_id': policy.uid}, {'$set': self._prepare_doc(policy)}, upsert=False)
+
+    @staticmethod
+    def _prepare_bulk(policies, prepare, action):
+        """
+        Prepare requests of a bulk write of policies.
+        Returns _Bulk.
+        """
+        results, requests, uids, positions = [], [], [], []
+        for policy in policies:
+            try:
+                requests.append(prepare(policy))
+            except Exception as e:
+                log.exception('Error preparing Policy with UID=%s for %s', policy.uid, action)
+                results.append(e)
+                continue
+            uids.append(policy.uid)
+            positions.append(len(results))
+            results.append(None)
+        return _Bulk(results, requests, uids, positions)
+
+    @staticmethod
+    def _bulk_write_errors(error, bulk):
+        """
+        Put errors of requests of a failed bulk write into its results at the corresponding positions.
+        Returns number of failed requests.
+        """
+        errors = error.details.get('writeErrors', [])
+        for err in errors:
+            uid = bulk.uids[err['index']]
+            if err.get('code') == 11000:
+                log.error('Error trying to create already existing policy with UID=%s.', uid)
+                result = PolicyExistsError(uid)
+            else:
+                log.error('Error writing Policy with UID=%s: %s', uid, err.get('errmsg'))
+                result = WriteError(err.get('errmsg'), err.get('code'), err)
+            bulk.results[bulk.positions[err['index']]] = result
+        return len(errors)
+
+    @staticmethod
+    def _prepare_delete_bulk(uids):
+        """
+        Prepare requests of a bulk deletion of policies by their UIDs.
+        Returns _Bulk.
+        """
+        uids = list(uids)
+        return _Bulk([None] * len(uids), [DeleteOne({'_id': uid}) for uid in uids], uids, range(len(uids)))
+
+    @staticmethod
+    def _policy_exists(policy):
+        """Log and get an error of inserting a policy with UID that is already taken"""
+        log.error('Error trying to create already existing policy with UID=%s.', policy.uid)
+        return PolicyExistsError(policy.uid)
+
+    def _find_for_decision(self, q_filter):
+        """Get cursor of the policies found by a query filter for making a decision"""
+        projection = self.decision_projection if self.decision_only else self.projection
+        return self.collection.find(q_filter, projection, batch_size=self.batch_size)
+
+    def _find_window(self, limit, offset):
+        """Get cursor of all the policies within a window"""
+        return self.collection.find(projection=self.projection, limit=limit, skip=offset, batch_size=self.batch_size)
+
+    def _changed(self, msg, *args):
+        """Log a change of policies and notify about it"""
+        log.info(msg, *args)
+        self._notify_change()
+
+    def _changed_many(self, msg, bulk, number):
+        """Log a bulk change of a number of policies and notify about it if any were changed. Returns bulk results"""
+        log.info(msg, number)
+        if number:
+            self._notify_change()
+        return bulk.results
+
+
+class MongoStorage(MongoPolicies, Storage):
+    """
+    Stores all policies in MongoDB.
+    See `MongoPolicies` for the description of arguments.
+    """
+
+    def add(self, policy):
+        try:
+            self.collection.insert_one(self._prepare_doc(policy))
+        except DuplicateKeyError:
+            raise self._policy_exists(policy)
+        self._changed('Added Policy: %s', policy)
+
+    def add_many(self, policies):
+        bulk = self._prepare_bulk(policies, self._prepare_doc, 'insertion')
+        added = self.__write_bulk(self.collection.insert_many, bulk)
+        return self._changed_many('Added %d Policies', bulk, added)
+
+    def get(self, uid):
+        ret = self.collection.find_one(uid, self.projection)
+        return self._prepare_from_doc(ret) if ret else None
+
+    def get_all(self, limit, offset):
+        self._check_limit_and_offset(limit, offset)
+        return self.__feed_policies(self._find_window(limit, offset))
+
+    def find_for_inquiry(self, inquiry, checker=None):
+        q_filter = self._create_filter(inquiry, checker)
+        return self.__feed_policies(self._find_for_decision(q_filter))
+
+    def find_for_inquiry_by_effect(self, inquiry, effect, checker=None):
+        q_filter = self._create_effect_filter(inquiry, effect, checker)
+        return self.__feed_policies(self._find_for_decision(q_filter))
+
+    def update(self, policy):
+        self.collection.update_one({'_id': policy.uid}, {'$set': self._prepare_doc(policy)}, upsert=False)
+        self._changed('Updated Policy with UID=%s. New value is: %s', policy.uid, policy)
+
+    def update_many(self, policies):
+        bulk = self._prepare_bulk(policies, self._prepare_update, 'update')
+        updated = self.__write_bulk(self.collection.bulk_write, bulk)
+        return self._changed_many('Updated %d Policies', bulk, updated)
+
+    def delete(self, uid):
+        self.collection.delete_one({'_id': uid})
+        self._changed('Deleted Policy with UID=%s.', uid)
+
+    def delete_many(self, uids):
+        bulk = self._prepare_delete_bulk(uids)
+        deleted = self.__write_bulk(self.collection.bulk_write, bulk)
+        return self._changed_many('Deleted %d Policies', bulk, deleted)
 
     def __feed_policies(self, cursor):
         """
         Yields Policies from the given cursor.
         """
         for doc in cursor:
-            yield self.__prepare_from_doc(doc)
+            yield self._prepare_from_doc(doc)
+
+    @classmethod
+    def __write_bulk(cls, write, bulk):
+        """
+        Run unordered bulk write of requests. Errors of requests are put into results of the bulk.
+        Returns number of successful requests.
+        """
+        if not bulk.requests:
+            return 0
+        try:
+            write(bulk.requests, ordered=False)
+        except BulkWriteError as e:
+            return len(bulk.requests) - cls._bulk_write_errors(e, bulk)
+        return len(bulk.requests)
 
 
 ##############
@@ -160,6 +367,7 @@ class MongoMigrationSet(MigrationSet):
             Migration0To1x1x0(self.storage),
             Migration1x1x0To1x1x1(self.storage),
             Migration1x1x1To1x2x0(self.storage),
+            Migration1x2x1To1x3x0(self.storage),
         ]
 
     def save_applied_number(self, number):
@@ -174,27 +382,60 @@ class MongoMigrationSet(MigrationSet):
 
 class MongoMigration(Migration, metaclass=ABCMeta):
     """
-    Mongo DB migration abstract base class
+    Mongo DB migration abstract base class.
+    Documents are processed in batches of `batch_size` documents and are replaced by bulk writes.
+    After each batch the progress is saved, so if a migration was interrupted, its next run continues
+    from the last processed batch. If `processes` is greater than 1, documents are processed in a pool of processes.
     """
+
+    batch_size = 1000
+    processes = None
+    checkpoint_collection = DEFAULT_CHECKPOINT_COLLECTION
+
     def _each_doc(self, processor):
         """
         Iterate each doc in the DB and run processor function with it
         """
         failed_policies = []
         storage = getattr(self, 'storage')
-        cur = storage.collection.find()
-        for doc in cur:
-            try:
-                log.info('Trying to migrate Policy with UID: %s', doc['uid'])
-                new_doc = processor(doc)
-                storage.collection.replace_one({'_id': new_doc['uid']}, new_doc)
-                log.info('Policy with UID: %s was migrated', doc['uid'])
-            except Irreversible as e:
-                log.warning('Irreversible Policy. %s. Mongo doc: %s', e, doc)
-                failed_policies.append(doc)
-            except Exception as e:
-                log.exception('Unexpected exception occurred while migrating Policy: %s', doc)
-                failed_policies.append(doc)
+        checkpoints = storage.database[self.checkpoint_collection]
+        checkpoint_id = '%s:%s' % (storage.collection.name, type(self).__name__)
+        # checkpoint is valid only for the same processor, e.g. it's ignored by 'down' after interrupted 'up'
+        processor_name = getattr(processor, '__qualname__', repr(processor))
+        checkpoint = checkpoints.find_one({'_id': checkpoint_id, 'processor': processor_name})
+        q_filter = {}
+        if checkpoint:
+            log.info('Resuming migration after Policy with _id: %s', checkpoint['last_id'])
+            q_filter = _after_id_filter(checkpoint['last_id'])
+        cur = storage.collection.find(q_filter, batch_size=self.batch_size).sort('_id', 1)
+        with _DocProcessor(processor, self.processes) as process:
+            for docs in _batches(cur, self.batch_size):
+                requests, request_docs = [], []
+                for doc, (new_doc, error) in zip(docs, process(docs)):
+                    if error is None:
+                        requests.append(ReplaceOne({'_id': doc['_id']}, new_doc))
+                        request_docs.append(doc)
+                    elif isinstance(error, Irreversible):
+                        log.warning('Irreversible Policy. %s. Mongo doc: %s', error, doc)
+                        failed_policies.append(doc)
+                    else:
+                        log.error('Unexpected exception occurred while migrating Policy: %s', doc,
+                                  exc_info=(type(error), error, error.__traceback__))
+                        failed_policies.append(doc)
+                if requests:
+                    try:
+                        storage.collection.bulk_write(requests, ordered=False)
+                    except BulkWriteError as e:
+                        for error in e.details.get('writeErrors', []):
+                            doc = request_docs[error['index']]
+                            log.error('Error saving migrated Policy: %s. Error: %s', doc, error.get('errmsg'))
+                            failed_policies.append(doc)
+                checkpoints.replace_one(
+                    {'_id': checkpoint_id},
+                    {'processor': processor_name, 'last_id': docs[-1]['_id']},
+                    upsert=True)
+                log.info('Processed a batch of %d Policies. Last processed Policy _id: %s', len(docs), docs[-1]['_id'])
+        checkpoints.delete_one({'_id': checkpoint_id})
         if failed_policies:
             msg = "\n".join([
                 'Migration was unable to convert some Policies, but they were left in the database as-is. ' +
@@ -205,6 +446,111 @@ class MongoMigration(Migration, metaclass=ABCMeta):
             log.error(msg)
 
 
+class _DocProcessor:
+    """
+    Context manager that runs migration processor with batches of documents.
+    Returns list of tuples (new document, None) or (None, exception) for each document.
+    Processor is run in a pool of processes if their number is greater than 1 and the platform supports 'fork':
+    forked processes inherit the processor, so it doesn't need to be picklable.
+    """
+
+    # Processor of a worker process. It's set only in the forked workers by the pool initializer:
+    # tasks are pickled, so passing the processor with every task would require it to be picklable.
+    worker_processor = None
+
+    def __init__(self, processor, processes=None):
+        self.processor = processor
+        self.processes = processes
+        self.pool = None
+
+    def __enter__(self):
+        if self.processes and self.processes > 1:
+            if 'fork' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('fork')
+                self.pool = context.Pool(self.processes, initializer=self.init_worker, initargs=(self.processor,))
+            else:
+                log.warning("Platform doesn't support 'fork'. Migration processor will be run in the current process")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+
+    def __call__(self, docs):
+        if self.pool is not None:
+            return self.pool.map(self.run_worker, docs)
+        return [_run_processor(self.processor, doc) for doc in docs]
+
+    @classmethod
+    def init_worker(cls, processor):
+        """Initialize a worker process with the processor"""
+        cls.worker_processor = processor
+
+    @classmethod
+    def run_worker(cls, doc):
+        """Run the processor of a worker process with a document"""
+        new_doc, error = _run_processor(cls.worker_processor, doc)
+        if error is not None and not isinstance(error, Irreversible):
+            # exceptions might be not picklable
+            error = Exception('%s: %s' % (type(error).__name__, error))
+        return new_doc, error
+
+
+def _run_processor(processor, doc):
+    try:
+        log.debug('Trying to migrate Policy with UID: %s', doc['uid'])
+        new_doc = processor(doc)
+        log.debug('Policy with UID: %s was migrated', doc['uid'])
+        return new_doc, None
+    except Exception as e:
+        return None, e
+
+
+def _batches(cursor, size):
+    """Yield lists of documents of the given size from a cursor"""
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Groups of BSON types (as $type aliases) in the order MongoDB sorts values of different types.
+_BSON_TYPES_ORDER = (
+    (type(None), ['null']),
+    ((int, float, Decimal128), ['int', 'long', 'double', 'decimal']),
+    (str, ['string']),
+    (dict, ['object']),
+    (bytes, ['binData']),
+    (ObjectId, ['objectId']),
+    (bool, ['bool']),
+    (datetime.datetime, ['date']),
+)
+
+
+def _after_id_filter(last_id):
+    """
+    Get filter of documents which _id goes after the given one in the ascending order of _id.
+    Comparison operators of MongoDB compare only values of the same type,
+    so documents with _id of types that are sorted after the type of the given _id are added explicitly.
+    """
+    position = None
+    for i, (types, _) in enumerate(_BSON_TYPES_ORDER):
+        # bool is a subclass of int, so it's checked separately
+        if isinstance(last_id, types) and (types is bool or not isinstance(last_id, bool)):
+            position = i
+            break
+    if position is None:
+        log.warning('Unsupported type of _id for resuming migration: %s. Migration is started over', type(last_id))
+        return {}
+    later_types = [alias for _, aliases in _BSON_TYPES_ORDER[position + 1:] for alias in aliases]
+    return {'$or': [{'_id': {'$gt': last_id}}] + [{'_id': {'$type': alias}} for alias in later_types]}
+
+
 class Migration0To1x1x0(MongoMigration):
     """
     Migration between versions 0 and 1.1.0
@@ -357,3 +703,44 @@ class Migration1x1x1To1x2x0(MongoMigration):
             return doc
         self.storage.collection.drop_index(self.type_index)
         self._each_doc(processor=process)
+
+
+class Migration1x2x1To1x3x0(MongoMigration):
+    """
+    Migration between versions 1.2.1 and 1.3.0.
+    What it does:
+    - Adds literal prefixes of policy values to each Policy,
+      so that policies for RegexChecker are prefiltered by MongoDB
+    - Adds indices for them
+    - Adds index for policies effect, so that allow and deny policies are found separately
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.index_name = lambda i: 'prefixes_' + i + '_idx'
+        self.effect_index_name = 'effect_idx'
+
+    @property
+    def order(self):
+        return 4
+
+    def up(self):
+        def process(doc):
+            """Processor for up"""
+            data = copy.deepcopy(doc)
+            del data['_id']
+            data.pop(self.storage.prefixes_field, None)
+            policy = Policy.from_dict(codec.decode(data))
+            doc[self.storage.prefixes_field] = self.storage._get_prefixes(policy)
+            return doc
+        for field in self.storage.condition_fields:
+            self.storage.collection.create_index('%s.%s' % (self.storage.prefixes_field, field),
+                                                 name=self.index_name(field))
+        self.storage.collection.create_index('effect', name=self.effect_index_name)
+        self._each_doc(processor=process)
+
+    def down(self):
+        for field in self.storage.condition_fields:
+            self.storage.collection.drop_index(self.index_name(field))
+        self.storage.collection.drop_index(self.effect_index_name)
+        self.storage.collection.update_many({}, {'$unset': {self.storage.prefixes_field: ''}})
@@ -2,14 +2,24 @@
 Utility functions and classes for Vakt.
 """
 
+import json
 import logging
 
-import jsonpickle
-
 
 log = logging.getLogger(__name__)
 
 
+# Encoder and decoder of data into JSON-compatible form and back.
+# `vakt.codec` registers them upon its import: it depends on Rules which are JsonSerializers themselves.
+_codec = {}
+
+
+def register_codec(encode, decode):
+    """Set functions that encode data into JSON-compatible form and decode it back for JsonSerializer"""
+    _codec['encode'] = encode
+    _codec['decode'] = decode
+
+
 class JsonSerializer:
     """
     Mixin for dumping object to JSON
@@ -27,14 +37,13 @@ class JsonSerializer:
         """
         Get JSON representation of an object
         """
-        jsonpickle.set_encoder_options('json', sort_keys=sort)
-        return jsonpickle.encode(self._data())
+        return json.dumps(_codec['encode'](self._data()), sort_keys=sort)
 
     @classmethod
     def _parse(cls, data):
         """Parse JSON string and return data"""
         try:
-            return jsonpickle.decode(data)
+            return _codec['decode'](json.loads(data))
         except ValueError as err:
             log.exception('Error creating %s from json.', cls.__name__)
             raise err
@@ -46,6 +55,22 @@ class JsonSerializer:
         return vars(self)
 
 
+def make_hashable(data):
+    """
+    Convert arbitrary (possibly nested) data into a hashable representation.
+    Types are preserved in the representation, so that e.g. `1`, `True` and `'1'` are different.
+    Raises TypeError if data contains unhashable values that can't be converted.
+    """
+    if isinstance(data, dict):
+        return dict, frozenset((k, make_hashable(v)) for k, v in data.items())
+    if isinstance(data, (list, tuple)):
+        return type(data), tuple(make_hashable(x) for x in data)
+    if isinstance(data, (set, frozenset)):
+        return type(data), frozenset(make_hashable(x) for x in data)
+    hash(data)
+    return type(data), data
+
+
 class PrettyPrint:
     """
     Allows to log objects with all the fields